@@ -1,5 +1,56 @@
+import mimetypes
+import os
+
+from urllib.parse import quote
+
 from django.conf import settings
+from django.http import FileResponse, HttpResponse, HttpResponseRedirect
+from django.utils.encoding import filepath_to_uri
 
 
 def build_absolute_uri(path):
     return f'{settings.SITE_URL}{path}'
+
+
+def get_storage_urls(storage, names, request=None):
+    """
+    Return the URLs of the files of the storage by name, the storage only asked once : unsigned URLs are the base URL
+    of the storage followed by the name. Absolute URLs if a request is given.
+    """
+    names = [name for name in names if name]
+    if not names:
+        return {}
+    if getattr(storage, 'querystring_auth', False):
+        urls = {name: storage.url(name) for name in names}
+    else:
+        marker = '__url__'
+        base_url = storage.url(marker)[: -len(marker)]
+        urls = {name: base_url + filepath_to_uri(name).lstrip('/') for name in names}
+
+    if request is not None:
+        # The host is resolved once for all the relative URLs
+        base_url = request.build_absolute_uri('/')[:-1]
+        urls = {name: url if url.startswith(('http://', 'https://')) else base_url + url for name, url in urls.items()}
+    return urls
+
+
+def file_download_response(fieldfile, filename=None):
+    """
+    Response downloading the file, once authorized : handed off to nginx with X-Accel-Redirect, redirected to the
+    storage URL for remote storages, or streamed by Django in development. Never read by Python behind nginx.
+    """
+    filename = filename or os.path.basename(fieldfile.name)
+    try:
+        path = fieldfile.path
+    except NotImplementedError:
+        # Remote storage, e.g. S3
+        return HttpResponseRedirect(fieldfile.url)
+
+    if not settings.NGINX_ACCEL_REDIRECT_PREFIX:
+        return FileResponse(open(path, 'rb'), as_attachment=True, filename=filename)
+
+    response = HttpResponse(content_type=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+    response['Content-Disposition'] = f"attachment; filename*=UTF-8''{quote(filename)}"
+    response['Cache-Control'] = 'private, max-age=86400'
+    response['X-Accel-Redirect'] = settings.NGINX_ACCEL_REDIRECT_PREFIX + quote(fieldfile.name)
+    return response
@@ -0,0 +1,169 @@
+import logging
+import time
+import uuid
+
+from functools import lru_cache
+
+import cssutils
+import orjson
+import pynliner
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.template.loader import get_template
+from django_inlinecss.css_loaders import BaseCSSLoader, StaticfilesStorageCSSLoader
+from django_inlinecss.engines import EngineBase
+
+from src.common.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Batched email sending.
+#
+# Emails are queued in a Redis list and sent by SendQueuedEmailsTask, scheduled EMAIL_BATCH_WINDOW seconds after
+# the first email of a batch is queued, or right away once EMAIL_BATCH_SIZE emails are waiting.
+# A batch is sent over a single SMTP connection : the connection and handshake are paid once per batch.
+#
+# Emails are queued with their template name and context, and rendered by the worker.
+#
+# Failed emails wait in a Redis sorted set scored by the time of their next attempt, EMAIL_RETRY_DELAY seconds later.
+# SendQueuedEmailsTask moves the due ones back to the queue when it starts.
+
+QUEUE_KEY = 'emails:queue'
+RETRY_KEY = 'emails:retry'
+
+
+@lru_cache(maxsize=None)
+def load_email_css(path):
+    return StaticfilesStorageCSSLoader().load(path)
+
+
+@lru_cache(maxsize=None)
+def parse_email_css(css):
+    return cssutils.CSSParser().parseString(css)
+
+
+class CachedCSSLoader(BaseCSSLoader):
+    """
+    Read each stylesheet of the {% inlinecss %} blocks once per process - see settings.INLINECSS_CSS_LOADER
+    """
+
+    def load(self, path):
+        return load_email_css(path)
+
+
+class CachedPynlinerEngine(EngineBase):
+    """
+    django_inlinecss PynlinerEngine parsing each stylesheet once per process : only the rendered HTML is parsed and
+    styled for every email - see settings.INLINECSS_ENGINE.
+    The CSS comes from the {% inlinecss %} stylesheets only, the <style> tags of the HTML are left as they are.
+    """
+
+    def render(self):
+        inliner = pynliner.Pynliner().from_string(self.html)
+        # Read only by run()
+        inliner.stylesheet = parse_email_css(self.css)
+        return inliner.run()
+
+
+def render_email(template_name, context):
+    """
+    Render the email template - compiled once per process by the cached template loader. Its {% inlinecss %} blocks
+    inline the CSS on the rendered output.
+    """
+    return get_template(template_name).render(context)
+
+
+def queue_email(subject, to, from_email, template_name, context):
+    """
+    Queue an HTML email for the next batch. The context must be JSON serializable, the template is rendered by the worker.
+    """
+    from src.common.tasks import send_queued_emails_task
+
+    message = {
+        # Tells apart identical emails waiting for a retry
+        'id': uuid.uuid4().hex,
+        'subject': subject,
+        'to': to,
+        'from_email': from_email,
+        'template_name': template_name,
+        'context': context,
+        'attempts': 0,
+    }
+    queued = get_redis().rpush(QUEUE_KEY, orjson.dumps(message))
+    if queued == 1:
+        send_queued_emails_task.apply_async(countdown=settings.EMAIL_BATCH_WINDOW)
+    elif queued % settings.EMAIL_BATCH_SIZE == 0:
+        send_queued_emails_task.delay()
+
+
+def pop_queued_emails(count):
+    pipeline = get_redis().pipeline()
+    pipeline.lrange(QUEUE_KEY, 0, count - 1)
+    pipeline.ltrim(QUEUE_KEY, count, -1)
+    messages, _ = pipeline.execute()
+    return [orjson.loads(message) for message in messages]
+
+
+def retry_emails_later(messages, delay):
+    """
+    Queue the messages again in delay seconds - see queue_due_emails
+    """
+    retry_at = time.time() + delay
+    members = {}
+    for message in messages:
+        members[orjson.dumps(message)] = retry_at
+    get_redis().zadd(RETRY_KEY, members)
+
+
+def queue_due_emails():
+    """
+    Move the messages due for a retry back to the queue. Return their count.
+    """
+    redis = get_redis()
+    due = redis.zrangebyscore(RETRY_KEY, '-inf', time.time())
+    if not due:
+        return 0
+
+    # Only the process which removes a message queues it : concurrent tasks do not send it twice
+    pipeline = redis.pipeline()
+    for message in due:
+        pipeline.zrem(RETRY_KEY, message)
+    claimed = [message for message, removed in zip(due, pipeline.execute()) if removed]
+    if claimed:
+        redis.rpush(QUEUE_KEY, *claimed)
+    return len(claimed)
+
+
+def build_email(message, connection=None):
+    html_message = render_email(message['template_name'], message['context'])
+    return EmailMultiAlternatives(
+        message['subject'],
+        html_message,
+        message['from_email'],
+        message['to'],
+        alternatives=((html_message, 'text/html'),),
+        connection=connection,
+    )
+
+
+def send_emails(messages):
+    """
+    Send the messages over a single connection. Return the messages which failed.
+    A failure does not stop the batch : the connection is reopened for the next messages.
+    """
+    failed = []
+    connection = get_connection()
+    try:
+        for message in messages:
+            try:
+                # A no-op once open : send_messages closes the connections it opens itself
+                connection.open()
+                connection.send_messages([build_email(message, connection)])
+            except Exception:
+                logger.warning(f'Failed to send email to {message["to"]}.', exc_info=True)
+                failed.append(message)
+                connection.close()
+    finally:
+        connection.close()
+    return failed
@@ -0,0 +1,72 @@
+import datetime
+import io
+import timeit
+import uuid
+
+from django.core.management.base import BaseCommand
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from src.common.parsers import ORJSONParser
+from src.common.renderers import ORJSONRenderer
+
+
+def build_restrictions(depth):
+    """
+    Nested or/and restrictions tree, the shape of the large promo codes
+    """
+    if depth == 0:
+        return [
+            {'age': {'gt': 18, 'lt': 65}},
+            {'weather': {'is': 'clear', 'temp': {'gt': 15}}},
+            {'date': {'after': '2024-01-01'}},
+        ]
+    return [{'or': build_restrictions(depth - 1)}, {'and': build_restrictions(depth - 1)}]
+
+
+def build_payloads():
+    restrictions = build_restrictions(5)
+    now = datetime.datetime.now(tz=datetime.timezone.utc)
+    return {
+        'validate accepted': {'message': {'promocode_name': 'WeatherCode', 'status': 'accepted', 'advantage': {'percent': 20}}},
+        'validate denied': {
+            'error': {
+                'promocode_name': 'WeatherCode',
+                'status': 'denied',
+                'reasons': ['Age condition not met.', 'Weather must be clear - current weather: clouds.'],
+            }
+        },
+        'promo code': {'uuid': uuid.uuid4(), 'name': 'WeatherCode', 'advantage': {'percent': 20}, 'restrictions': restrictions},
+        'files list': [
+            {'id': idx, 'file': f'/media/{uuid.uuid4()}.jpg', 'thumbnail': None, 'created_at': now} for idx in range(100)
+        ],
+    }
+
+
+class Command(BaseCommand):
+    help = 'Compare the orjson renderer and parser with the DRF json ones on the API payload shapes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--number', type=int, default=10000, help='Number of runs per payload')
+
+    def handle(self, *args, **options):
+        number = options['number']
+        drf_renderer, orjson_renderer = JSONRenderer(), ORJSONRenderer()
+        drf_parser, orjson_parser = JSONParser(), ORJSONParser()
+
+        self.stdout.write(
+            f'{"payload":<20}{"size":>8}{"render json":>14}{"render orjson":>16}{"parse json":>14}{"parse orjson":>16}'
+        )
+        for name, data in build_payloads().items():
+            body = drf_renderer.render(data)
+            timings = [
+                timeit.timeit(lambda: drf_renderer.render(data), number=number),
+                timeit.timeit(lambda: orjson_renderer.render(data), number=number),
+                timeit.timeit(lambda: drf_parser.parse(io.BytesIO(body)), number=number),
+                timeit.timeit(lambda: orjson_parser.parse(io.BytesIO(body)), number=number),
+            ]
+            # microseconds per call
+            render_json, render_orjson, parse_json, parse_orjson = (t / number * 1e6 for t in timings)
+            self.stdout.write(
+                f'{name:<20}{len(body):>8}{render_json:>12.1f}us{render_orjson:>14.1f}us{parse_json:>12.1f}us{parse_orjson:>14.1f}us'
+            )
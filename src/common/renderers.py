@@ -0,0 +1,34 @@
+import orjson
+
+from rest_framework.renderers import JSONRenderer
+
+# OPT_UTC_Z : UTC datetimes end with 'Z', like with the DRF encoder
+ORJSON_OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_PASSTHROUGH_DATACLASS | orjson.OPT_NON_STR_KEYS
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer producing the same output with orjson.
+
+    orjson natively encodes UUIDs and datetimes the way the DRF encoder does. Decimals, lazy strings, dataclasses
+    and the other non JSON types are passed to the DRF encoder.
+    The standard json renderer is used for what orjson cannot do : indented or ASCII-only output, integers over 64 bits.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+
+        renderer_context = renderer_context or {}
+        if self.get_indent(accepted_media_type, renderer_context) is not None or self.ensure_ascii or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(data, default=self.encoder_class().default, option=ORJSON_OPTIONS)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # Like the DRF renderer, escape \u2028 and \u2029 so that the output is a strict javascript subset
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
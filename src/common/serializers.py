@@ -1,22 +1,18 @@
 from django.conf import settings
 from rest_framework.serializers import ImageField as ApiImageField
-from easy_thumbnails.files import get_thumbnailer
-
-THUMBNAIL_ALIASES = getattr(settings, 'THUMBNAIL_ALIASES', {})
 
+from src.common.thumbnails import get_alias_urls
 
-def get_url(request, instance, alias_obj, alias=None):
-    if alias is not None:
-        return request.build_absolute_uri(get_thumbnailer(instance).get_thumbnail(alias_obj[alias]).url)
-    elif alias is None:
-        return request.build_absolute_uri(instance.url)
-    else:
-        raise TypeError('Unsupported field type')
+THUMBNAIL_ALIASES = getattr(settings, 'THUMBNAIL_ALIASES', {})
 
 
 def image_sizes(request, instance, alias_obj):
-    i_sizes = list(alias_obj.keys())
-    return {'original': get_url(request, instance, alias_obj), **{k: get_url(request, instance, alias_obj, k) for k in i_sizes}}
+    # Cached when the thumbnails are generated - see src/common/thumbnails.py
+    urls = get_alias_urls(instance, alias_obj)
+    return {
+        'original': request.build_absolute_uri(instance.url),
+        **{k: request.build_absolute_uri(url) for k, url in urls.items()},
+    }
 
 
 class ThumbnailerJSONSerializer(ApiImageField):
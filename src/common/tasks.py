@@ -1,6 +1,13 @@
+import logging
+
 from celery import task
+from django.conf import settings
 from django.core.mail import EmailMultiAlternatives
 
+from src.common.mail import pop_queued_emails, queue_due_emails, retry_emails_later, send_emails
+
+logger = logging.getLogger(__name__)
+
 
 @task(name='SendEmailTask')
 def send_email_task(subject, to, default_from, email_html_message):
@@ -12,3 +19,31 @@ def send_email_task(subject, to, default_from, email_html_message):
         alternatives=((email_html_message, 'text/html'),),
     )
     msg.send()
+
+
+@task(name='SendQueuedEmailsTask')
+def send_queued_emails_task():
+    """
+    Send the queued emails in batches of EMAIL_BATCH_SIZE, one SMTP connection per batch - see src/common/mail.py
+    Failed emails are queued again EMAIL_RETRY_DELAY seconds later, up to EMAIL_MAX_ATTEMPTS attempts.
+    """
+    queue_due_emails()
+    while True:
+        messages = pop_queued_emails(settings.EMAIL_BATCH_SIZE)
+        if not messages:
+            return
+
+        failed = send_emails(messages)
+        retried = []
+        for message in failed:
+            message['attempts'] += 1
+            if message['attempts'] < settings.EMAIL_MAX_ATTEMPTS:
+                retried.append(message)
+            else:
+                logger.error(f'Gave up sending email to {message["to"]} after {message["attempts"]} attempts.')
+
+        if retried:
+            retry_emails_later(retried, settings.EMAIL_RETRY_DELAY)
+            send_queued_emails_task.apply_async(countdown=settings.EMAIL_RETRY_DELAY)
+        if len(messages) < settings.EMAIL_BATCH_SIZE:
+            return
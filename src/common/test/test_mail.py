@@ -0,0 +1,156 @@
+import os
+import time
+import unittest
+import uuid
+
+from unittest.mock import patch
+
+import orjson
+
+from django.core import mail
+from django.core.mail.backends.locmem import EmailBackend
+from django.template import engines
+from django.test import TestCase, override_settings
+from redis.exceptions import RedisError
+
+from src.common.mail import build_email, parse_email_css, render_email, send_emails
+from src.common.redis_client import get_redis
+from src.common.tasks import send_queued_emails_task
+
+MAILHOG_HOST = os.getenv('MAILHOG_HOST')
+
+
+def is_redis_reachable():
+    try:
+        return get_redis().ping()
+    except RedisError:
+        return False
+
+
+def get_messages(count):
+    # As queued by queue_email
+    return [
+        {
+            'id': uuid.uuid4().hex,
+            'subject': f'subject {idx}',
+            'to': [f'to{idx}@example.com'],
+            'from_email': 'from@example.com',
+            'template_name': 'emails/user_reset_password.html',
+            'context': {'username': f'user{idx}'},
+            'attempts': 0,
+        }
+        for idx in range(count)
+    ]
+
+
+class StringCSSLoader:
+    def load(self, path):
+        return '.highlight { color: red; }'
+
+
+class TestRenderEmail(TestCase):
+    def test_render(self):
+        self.assertIn('<p>Hi alice,</p>', render_email('emails/user_reset_password.html', {'username': 'alice'}))
+
+    @override_settings(INLINECSS_CSS_LOADER='src.common.test.test_mail.StringCSSLoader')
+    def test_css_is_inlined_after_rendering(self):
+        source = (
+            '{% load inlinecss %}{% inlinecss "emails/style.css" %}'
+            '<p class="{% if urgent %}highlight{% endif %}" title="{{ name }}">{{ name }}</p>'
+            '{% endinlinecss %}'
+        )
+        template = engines['django'].from_string(source)
+        parse_email_css.cache_clear()
+
+        html = template.render({'name': 'alice & bob', 'urgent': True})
+        self.assertIn('class="highlight"', html)
+        self.assertIn('title="alice &amp; bob"', html)
+        self.assertIn('style="color: red"', html)
+        self.assertIn('>alice &amp; bob</p>', html)
+        self.assertNotIn('style=', template.render({'name': 'alice', 'urgent': False}))
+        # The stylesheet is parsed once
+        self.assertEqual(parse_email_css.cache_info().misses, 1)
+
+
+class TestSendEmails(TestCase):
+    def test_send_emails_over_one_connection(self):
+        with patch('src.common.mail.get_connection', wraps=mail.get_connection) as mock_get_connection:
+            failed = send_emails(get_messages(3))
+
+        self.assertEqual(failed, [])
+        self.assertEqual(mock_get_connection.call_count, 1)
+        self.assertEqual([message.to for message in mail.outbox], [['to0@example.com'], ['to1@example.com'], ['to2@example.com']])
+        self.assertIn('<p>Hi user0,</p>', mail.outbox[0].alternatives[0][0])
+
+    def test_partial_failure(self):
+        messages = get_messages(3)
+        send_messages = EmailBackend.send_messages
+
+        def fail_second_message(backend, email_messages):
+            if email_messages[0].to == ['to1@example.com']:
+                raise ConnectionResetError
+            return send_messages(backend, email_messages)
+
+        with patch.object(EmailBackend, 'send_messages', fail_second_message), self.assertLogs('src.common.mail', 'WARNING'):
+            failed = send_emails(messages)
+
+        self.assertEqual(failed, [messages[1]])
+        self.assertEqual(len(mail.outbox), 2)
+
+
+@unittest.skipUnless(is_redis_reachable(), 'Set REDIS_URL to a running Redis, e.g. docker-compose up redis')
+@override_settings(EMAIL_BATCH_SIZE=2, EMAIL_MAX_ATTEMPTS=3, EMAIL_RETRY_DELAY=0)
+class TestSendQueuedEmails(TestCase):
+    def setUp(self):
+        self.queue_key, self.retry_key = f'emails:queue:{uuid.uuid4()}', f'emails:retry:{uuid.uuid4()}'
+        patcher = patch.multiple('src.common.mail', QUEUE_KEY=self.queue_key, RETRY_KEY=self.retry_key)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(get_redis().delete, self.queue_key, self.retry_key)
+
+    def test_failed_emails_are_retried_later(self):
+        get_redis().rpush(self.queue_key, *[orjson.dumps(message) for message in get_messages(2)])
+        attempts = []
+
+        def fail_all(messages):
+            attempts.append([message['attempts'] for message in messages])
+            return messages
+
+        with patch('src.common.tasks.send_emails', side_effect=fail_all), patch.object(
+            send_queued_emails_task, 'apply_async'
+        ) as mock_apply_async:
+            # A full batch fails : it is not popped again by the same run
+            send_queued_emails_task()
+            self.assertEqual(attempts, [[0, 0]])
+            self.assertEqual(get_redis().zcard(self.retry_key), 2)
+            mock_apply_async.assert_called_once_with(countdown=0)
+
+            # Due : the next runs send them again, until EMAIL_MAX_ATTEMPTS
+            send_queued_emails_task()
+            with self.assertLogs('src.common.tasks', 'ERROR'):
+                send_queued_emails_task()
+            send_queued_emails_task()
+
+        self.assertEqual(attempts, [[0, 0], [1, 1], [2, 2]])
+        self.assertEqual(get_redis().zcard(self.retry_key), 0)
+
+
+@unittest.skipUnless(MAILHOG_HOST, 'Set MAILHOG_HOST to run against MailHog, e.g. docker-compose up mailhog')
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend', EMAIL_HOST=MAILHOG_HOST, EMAIL_PORT=1025)
+class TestSendEmailsThroughput(TestCase):
+    count = 200
+
+    def test_throughput(self):
+        messages = get_messages(self.count)
+
+        started_at = time.perf_counter()
+        for message in messages:
+            build_email(message).send()
+        one_connection_per_email = time.perf_counter() - started_at
+
+        started_at = time.perf_counter()
+        failed = send_emails(messages)
+        one_connection_per_batch = time.perf_counter() - started_at
+
+        self.assertEqual(failed, [])
+        self.assertLess(one_connection_per_batch, one_connection_per_email)
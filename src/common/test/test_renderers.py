@@ -0,0 +1,48 @@
+import datetime
+import decimal
+import io
+import uuid
+
+from django.test import TestCase
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from src.common.parsers import ORJSONParser
+from src.common.renderers import ORJSONRenderer
+
+
+class TestORJSONRenderer(TestCase):
+    def assertSameRendering(self, data, accepted_media_type=None):
+        self.assertEqual(ORJSONRenderer().render(data, accepted_media_type), JSONRenderer().render(data, accepted_media_type))
+
+    def test_same_output_as_json_renderer(self):
+        test_cases = [
+            {'uuid': uuid.uuid4(), 'name': 'PROMO', 'advantage': {'percent': 20}},
+            {'created_at': datetime.datetime(2024, 1, 1, 12, 30, 15, 123456, tzinfo=datetime.timezone.utc)},
+            {'created_at': datetime.datetime(2024, 1, 1, 12, 30, 15, tzinfo=datetime.timezone(datetime.timedelta(hours=2)))},
+            {'created_at': datetime.datetime(2024, 1, 1, 12, 30), 'time': datetime.time(12, 30, 15, 5)},
+            {'date': datetime.date(2024, 1, 1), 'price': decimal.Decimal('10.50')},
+            {'reasons': ['Age condition not met.', 'Température'], 'count': 2, 'ratio': 0.5, 'valid': None},
+            {1: 'integer key', 'separator': ' '},
+            [{'big': 2**70}],
+        ]
+        for data in test_cases:
+            self.assertSameRendering(data)
+
+    def test_indent(self):
+        self.assertSameRendering({'a': [1, 2]}, 'application/json; indent=4')
+
+    def test_none(self):
+        self.assertEqual(ORJSONRenderer().render(None), b'')
+
+
+class TestORJSONParser(TestCase):
+    def test_same_output_as_json_parser(self):
+        body = '{"promocode_name": "PROMO", "arguments": {"age": 25, "town": "Lyon"}, "ratio": 1.5}'.encode()
+        self.assertEqual(ORJSONParser().parse(io.BytesIO(body)), JSONParser().parse(io.BytesIO(body)))
+
+    def test_parse_error(self):
+        for body in [b'{"age": ', b'{"age": NaN}']:
+            with self.assertRaises(ParseError):
+                ORJSONParser().parse(io.BytesIO(body))
@@ -0,0 +1,74 @@
+import hashlib
+import time
+import unittest
+import uuid
+
+from unittest.mock import patch
+
+from django.test import SimpleTestCase, override_settings
+from redis.exceptions import RedisError
+from rest_framework.test import APIRequestFactory
+from rest_framework.request import Request
+from rest_framework.parsers import JSONParser
+
+from src.common.redis_client import get_redis
+from src.common.throttling import TokenBucketThrottle, consume_token
+
+
+def is_redis_reachable():
+    try:
+        return get_redis().ping()
+    except RedisError:
+        return False
+
+
+class View:
+    token_bucket_scope = 'promocodes'
+    action = 'validate'
+
+
+@override_settings(
+    TOKEN_BUCKET_ENABLED=True,
+    TOKEN_BUCKET_RATES={'promocodes.validate': {'rate': 1, 'burst': 1, 'by': ('promocode_name',)}},
+    API_KEY_HASHES=frozenset([hashlib.sha256(b'known-key').hexdigest()]),
+)
+class TestTokenBucketThrottle(SimpleTestCase):
+    def get_bucket_key(self, data, **extra):
+        request = Request(APIRequestFactory().post('/', data, format='json', **extra), parsers=[JSONParser()])
+        with patch('src.common.throttling.consume_token', return_value=(True, 0.0)) as consume:
+            self.assertTrue(TokenBucketThrottle().allow_request(request, View()))
+        return consume.call_args[0][0]
+
+    def test_bucket_by_ip(self):
+        self.assertEqual(self.get_bucket_key({'promocode_name': 'PROMO'}), 'throttle:promocodes.validate:ip:127.0.0.1:PROMO')
+
+    def test_bucket_by_api_key(self):
+        key_hash = hashlib.sha256(b'known-key').hexdigest()
+        self.assertEqual(self.get_bucket_key({}, HTTP_X_API_KEY='known-key'), f'throttle:promocodes.validate:key:{key_hash}:')
+
+        # Unknown keys do not get their own bucket
+        self.assertEqual(self.get_bucket_key({}, HTTP_X_API_KEY='random-key'), 'throttle:promocodes.validate:ip:127.0.0.1:')
+
+    def test_list_body(self):
+        self.assertEqual(self.get_bucket_key(['PROMO']), 'throttle:promocodes.validate:ip:127.0.0.1:')
+
+
+@unittest.skipUnless(is_redis_reachable(), 'Set REDIS_URL to a running Redis, e.g. docker-compose up redis')
+class TestTokenBucketScript(SimpleTestCase):
+    def setUp(self):
+        self.key = f'throttle:test:{uuid.uuid4()}'
+
+    def tearDown(self):
+        get_redis().delete(self.key)
+
+    def test_burst_then_refill(self):
+        for _ in range(3):
+            self.assertEqual(consume_token(self.key, 10, 3), (True, 0.0))
+
+        allowed, wait = consume_token(self.key, 10, 3)
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(wait, 0.1, delta=0.02)
+
+        time.sleep(wait)
+        self.assertTrue(consume_token(self.key, 10, 3)[0])
+        self.assertGreater(get_redis().pttl(self.key), 0)
@@ -0,0 +1,92 @@
+import io
+import shutil
+import tempfile
+
+from unittest.mock import patch
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from easy_thumbnails.exceptions import InvalidImageFormatError
+from easy_thumbnails.files import get_thumbnailer
+from PIL import Image, ImageFile
+from rest_framework.test import APIRequestFactory
+
+from src.common.thumbnails import CorruptImageError, generate_thumbnails
+from src.users.serializers import UserSerializer
+from src.users.test.factories import UserFactory
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def get_thumbnailer_of_image(size=(1600, 1200), format='JPEG', name='image.jpg'):
+    content = io.BytesIO()
+    Image.new('RGB', size, (30, 120, 200)).save(content, format)
+    return get_thumbnailer(ContentFile(content.getvalue()), relative_name=name)
+
+
+class TestGenerateThumbnails(TestCase):
+    def test_sizes(self):
+        all_options = [
+            {'size': (50, 50), 'crop': True},
+            {'size': (400, 400), 'crop': True},
+            {'size': (360, 360)},
+            {'size': (100, 0)},
+        ]
+        thumbnails = generate_thumbnails(get_thumbnailer_of_image(), all_options)
+
+        sizes = [Image.open(thumbnail).size for thumbnail in thumbnails]
+        self.assertEqual(sizes, [(50, 50), (400, 400), (360, 270), (100, 75)])
+        self.assertTrue(thumbnails[0].name.endswith('50x50_q85_crop.jpg'))
+
+    def test_png(self):
+        (thumbnail,) = generate_thumbnails(get_thumbnailer_of_image(format='PNG', name='image.png'), [{'size': (80, 80)}])
+        self.assertEqual(Image.open(thumbnail).size, (80, 60))
+
+    def test_not_an_image(self):
+        thumbnailer = get_thumbnailer(ContentFile(b'notes'), relative_name='notes.txt')
+        with self.assertRaises(InvalidImageFormatError):
+            generate_thumbnails(thumbnailer, [{'size': (80, 80)}])
+
+    def test_truncated_image(self):
+        content = get_thumbnailer_of_image().read()
+        thumbnailer = get_thumbnailer(ContentFile(content[: len(content) // 2]), relative_name='image.jpg')
+        with self.assertRaises(CorruptImageError):
+            generate_thumbnails(thumbnailer, [{'size': (80, 80)}])
+        # Process wide : left to its default
+        self.assertFalse(ImageFile.LOAD_TRUNCATED_IMAGES)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class TestAliasUrls(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        content = io.BytesIO()
+        Image.new('RGB', (800, 600), (30, 120, 200)).save(content, 'JPEG')
+        self.user = UserFactory()
+        # Generates the thumbnails of the aliases
+        self.user.profile_picture = SimpleUploadedFile('me.jpg', content.getvalue())
+        self.user.save()
+        self.request = APIRequestFactory().get('/')
+
+    def test_cached_urls(self):
+        with patch('src.common.thumbnails.get_thumbnailer', side_effect=AssertionError('Not cached')):
+            urls = UserSerializer(self.user, context={'request': self.request}).data['profile_picture']
+
+        self.assertEqual(set(urls), {'original', *settings.THUMBNAIL_ALIASES['users']})
+        self.assertTrue(urls['thumbnail'].startswith('http://testserver/media/profile_pictures/me'))
+        self.assertTrue(urls['thumbnail'].endswith('100x100_q85_crop.jpg'))
+
+    def test_cache_miss(self):
+        with patch('src.common.thumbnails.get_thumbnailer', side_effect=AssertionError('Not cached')):
+            cached_urls = UserSerializer(self.user, context={'request': self.request}).data['profile_picture']
+        cache.clear()
+
+        self.assertEqual(UserSerializer(self.user, context={'request': self.request}).data['profile_picture'], cached_urls)
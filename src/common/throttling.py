@@ -0,0 +1,140 @@
+import hashlib
+import logging
+import time
+
+from django.conf import settings
+from redis.exceptions import RedisError
+from rest_framework.throttling import BaseThrottle
+from rest_framework.views import APIView
+
+from src.common.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Token bucket refill and consumption, atomic on the Redis side.
+# KEYS[1] : bucket key - ARGV : rate (tokens per second), burst (bucket capacity), now (seconds)
+# Returns whether the request is allowed and the seconds to wait for the next token.
+TOKEN_BUCKET_SCRIPT = '''
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+local tokens = tonumber(bucket[1]) or burst
+local updated_at = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated_at) * rate)
+
+local allowed = 0
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+else
+    wait = (1 - tokens) / rate
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated_at', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000))
+return {allowed, tostring(wait)}
+'''
+
+_token_bucket_script = None
+
+
+def consume_token(key, rate, burst):
+    """
+    Take a token from the bucket identified by key. Return (allowed, seconds to wait for the next token).
+    """
+    global _token_bucket_script
+
+    if _token_bucket_script is None:
+        _token_bucket_script = get_redis().register_script(TOKEN_BUCKET_SCRIPT)
+
+    allowed, wait = _token_bucket_script(keys=[key], args=[rate, burst, time.time()])
+    return bool(allowed), float(wait)
+
+
+def get_api_key_ident(request):
+    """
+    Return the bucket ident of the API key of the request (X-Api-Key header), None if there is none or if it is not one
+    of settings.API_KEY_HASHES : clients must not pick their bucket.
+    """
+    api_key = request.META.get('HTTP_X_API_KEY')
+    if not api_key:
+        return None
+    api_key_hash = hashlib.sha256(api_key.encode()).hexdigest()
+    if api_key_hash not in settings.API_KEY_HASHES:
+        return None
+    return f'key:{api_key_hash}'
+
+
+def get_client_ident(request):
+    """
+    Identity of the client of the DRF request for the token buckets : its user id, else its API key if it is a known one,
+    else its IP. Authenticates the request on first access.
+    """
+    if request.user and request.user.is_authenticated:
+        return f'user:{request.user.pk}'
+    return get_api_key_ident(request) or f'ip:{BaseThrottle().get_ident(request)}'
+
+
+def check_token_bucket(scope, client_ident, promocode_name=None):
+    """
+    Take a token from the bucket of the client for the given scope, configured in settings.TOKEN_BUCKET_RATES.
+    Return (allowed, seconds to wait for the next token). Fail open : requests are allowed when Redis is unreachable.
+    """
+    config = settings.TOKEN_BUCKET_RATES.get(scope)
+    if not settings.TOKEN_BUCKET_ENABLED or config is None:
+        return True, None
+
+    key = f'throttle:{scope}:{client_ident}'
+    if 'promocode_name' in config.get('by', ()):
+        key = f'{key}:{promocode_name or ""}'
+
+    try:
+        return consume_token(key, config['rate'], config['burst'])
+    except RedisError:
+        logger.warning('Token bucket throttle skipped, Redis is unreachable.', exc_info=True)
+        return True, None
+
+
+def check_default_throttles(request):
+    """
+    Apply the DRF default throttles (REST_FRAMEWORK['DEFAULT_THROTTLE_CLASSES']) to a DRF request of a plain Django view,
+    built by APIView().initialize_request. Return (allowed, seconds to wait or None). The user throttle authenticates
+    the request : raise the APIException of the authentication, e.g. AuthenticationFailed for an invalid token.
+    """
+    view = APIView()
+    throttled = [throttle for throttle in view.get_throttles() if not throttle.allow_request(request, view)]
+    if not throttled:
+        return True, None
+    return False, max((throttle.wait() for throttle in throttled if throttle.wait() is not None), default=None)
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Redis token bucket per client, configured per view action in settings.TOKEN_BUCKET_RATES :
+    the scope is `<view.token_bucket_scope>.<view.action>`, e.g. 'promocodes.validate'.
+
+    Clients are identified by get_client_ident, their API key is the X-Api-Key header.
+    With `by` containing 'promocode_name', each client gets one bucket per promo code.
+    """
+
+    def __init__(self):
+        self.wait_seconds = None
+
+    def allow_request(self, request, view):
+        scope = f'{getattr(view, "token_bucket_scope", None)}.{view.action}'
+        config = settings.TOKEN_BUCKET_RATES.get(scope)
+        if not settings.TOKEN_BUCKET_ENABLED or config is None:
+            return True
+
+        promocode_name = None
+        if 'promocode_name' in config.get('by', ()) and isinstance(request.data, dict):
+            promocode_name = request.data.get('promocode_name')
+
+        allowed, self.wait_seconds = check_token_bucket(scope, get_client_ident(request), promocode_name)
+        return allowed
+
+    def wait(self):
+        return self.wait_seconds
@@ -0,0 +1,172 @@
+import hashlib
+import logging
+
+from concurrent.futures import ThreadPoolExecutor
+
+import orjson
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from easy_thumbnails import engine, utils
+from easy_thumbnails.alias import aliases
+from easy_thumbnails.exceptions import InvalidImageFormatError
+from easy_thumbnails.files import ThumbnailFile, get_thumbnailer
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Thumbnails of every size from a single decode of the source image.
+#
+# easy_thumbnails decodes the full resolution source once per thumbnail. Here the source is decoded once,
+# at the smallest JPEG draft scale (1/2, 1/4 or 1/8) still larger than the biggest thumbnail. The thumbnails are
+# processed from the largest to the smallest - each one derived from the previous when that one is large enough -
+# and encoded in parallel : Pillow releases the GIL while encoding.
+
+# The URLs of the alias thumbnails are cached when they are generated, so that serializing a file with its
+# thumbnails (ThumbnailerJSONSerializer) touches neither the storage nor Pillow. A URL is cached by file name
+# and alias options : a new file or a changed alias is a miss.
+ALIAS_URLS_CACHE_TIMEOUT = 30 * 24 * 60 * 60
+
+# Options which make a thumbnail unsuitable as the source of the smaller ones
+NOT_DERIVABLE_OPTIONS = ('zoom', 'target', 'sharpen', 'detail', 'bw', 'replace_alpha', 'background')
+
+
+class CorruptImageError(Exception):
+    """
+    The source is an image which can not be decoded, e.g. a truncated one.
+    """
+
+
+def decode_source(thumbnailer, max_size):
+    """
+    Decode the source image, JPEGs at reduced scale unless max_size is 0. Return None if the source is not an image,
+    raise CorruptImageError if it can not be decoded.
+    """
+    was_closed = getattr(thumbnailer, 'closed', False)
+    thumbnailer.open()
+    try:
+        try:
+            # Read from the file itself : Pillow only reads the header of the files which are not images
+            image = Image.open(thumbnailer)
+        except (IOError, SyntaxError):
+            return None
+        if image.format == 'JPEG' and max_size:
+            # A square request : the orientation is only applied after decoding
+            image.draft(image.mode, (max_size, max_size))
+        try:
+            image.load()
+        except (IOError, SyntaxError) as e:
+            raise CorruptImageError(str(e)) from e
+    finally:
+        if was_closed:
+            thumbnailer.close()
+    return utils.exif_orientation(image)
+
+
+def _can_derive(previous, options):
+    """
+    Check whether the thumbnail processed with the previous options can be the source of the given options.
+    """
+    if previous is None or any(options.get(option) for option in NOT_DERIVABLE_OPTIONS):
+        return False
+    previous_options, previous_image = previous
+    if any(previous_options.get(option) for option in NOT_DERIVABLE_OPTIONS):
+        return False
+
+    width, height = (dimension or 0 for dimension in options['size'])
+    if previous_image.size[0] < width or previous_image.size[1] < height:
+        return False
+    if not previous_options.get('crop'):
+        return True
+    # A cropped thumbnail only contains the region of a crop with the same aspect ratio
+    return bool(options.get('crop')) and width * previous_image.size[1] == height * previous_image.size[0]
+
+
+def _encode(thumbnailer, options, image):
+    filename = thumbnailer.get_thumbnail_name(options, transparent=utils.is_transparent(image))
+    data = engine.save_image(image, filename=filename, quality=options['quality'], subsampling=options['subsampling'])
+    return ThumbnailFile(
+        filename, file=ContentFile(data.read()), storage=thumbnailer.thumbnail_storage, thumbnail_options=options
+    )
+
+
+def generate_thumbnails(thumbnailer, all_options):
+    """
+    Return the unsaved ThumbnailFiles of the source of the thumbnailer for each thumbnail options, in the same order.
+    Raise InvalidImageFormatError if the source is not an image, CorruptImageError if it can not be decoded.
+    """
+    all_options = [thumbnailer.get_options(options) for options in all_options]
+    max_size = max(int(dimension or 0) for options in all_options for dimension in options['size'])
+    # zoom crops a region of the thumbnail, which needs more pixels than the thumbnail size
+    if any(options.get('zoom') for options in all_options):
+        max_size = 0
+
+    image = decode_source(thumbnailer, max_size)
+    if image is None:
+        raise InvalidImageFormatError('The source file does not appear to be an image')
+
+    order = sorted(range(len(all_options)), key=lambda index: max(all_options[index]['size']), reverse=True)
+    images, previous = [None] * len(all_options), None
+    for index in order:
+        options = all_options[index]
+        source = previous[1] if _can_derive(previous, options) else image
+        images[index] = engine.process_image(source, options, thumbnailer.thumbnail_processors)
+        previous = (options, images[index])
+
+    with ThreadPoolExecutor(max_workers=len(all_options)) as pool:
+        return list(pool.map(_encode, [thumbnailer] * len(all_options), all_options, images))
+
+
+def generate_all_aliases(fieldfile, include_global=True):
+    """
+    Generate and save the thumbnails of every alias of the file - replaces easy_thumbnails.files.generate_all_aliases
+    """
+    all_options = aliases.all(fieldfile, include_global=include_global)
+    if not all_options:
+        return
+
+    thumbnailer = get_thumbnailer(fieldfile)
+    cache_keys = [get_alias_url_cache_key(fieldfile.name, alias, options) for alias, options in all_options.items()]
+    for alias, options in all_options.items():
+        options['ALIAS'] = alias
+    try:
+        thumbnails = generate_thumbnails(thumbnailer, list(all_options.values()))
+    except InvalidImageFormatError:
+        return
+    except CorruptImageError:
+        logger.warning('No thumbnails for %s, the image can not be decoded.', fieldfile.name, exc_info=True)
+        return
+    for thumbnail in thumbnails:
+        thumbnailer.save_thumbnail(thumbnail)
+    cache.set_many({key: thumbnail.url for key, thumbnail in zip(cache_keys, thumbnails)}, ALIAS_URLS_CACHE_TIMEOUT)
+
+
+def generate_aliases_global(fieldfile, **kwargs):
+    """
+    saved_file signal handler - see easy_thumbnails.signal_handlers.generate_aliases_global
+    """
+    generate_all_aliases(fieldfile, include_global=True)
+
+
+def get_alias_url_cache_key(name, alias, options):
+    options = {option: value for option, value in options.items() if option != 'ALIAS'}
+    options_hash = hashlib.md5(orjson.dumps(options, option=orjson.OPT_SORT_KEYS, default=str)).hexdigest()
+    return f'thumbnails:url:{alias}:{options_hash}:{name}'
+
+
+def get_alias_urls(fieldfile, alias_options):
+    """
+    Return the URLs of the thumbnails of the file by alias, from the cache. The missing ones are only looked up -
+    or generated - by easy_thumbnails on a cache miss, e.g. for the files saved before the URLs were cached.
+    """
+    cache_keys = {alias: get_alias_url_cache_key(fieldfile.name, alias, options) for alias, options in alias_options.items()}
+    cached = cache.get_many(list(cache_keys.values()))
+    urls = {alias: cached.get(key) for alias, key in cache_keys.items()}
+
+    missing = [alias for alias, url in urls.items() if url is None]
+    if missing:
+        thumbnailer = get_thumbnailer(fieldfile)
+        for alias in missing:
+            urls[alias] = thumbnailer.get_thumbnail(alias_options[alias]).url
+        cache.set_many({cache_keys[alias]: urls[alias] for alias in missing}, ALIAS_URLS_CACHE_TIMEOUT)
+    return urls
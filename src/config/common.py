@@ -3,6 +3,7 @@ import sentry_sdk
 import sys
 import dotenv
 
+from celery.schedules import crontab
 from datetime import timedelta
 from sentry_sdk.integrations.django import DjangoIntegration
 from os.path import join
@@ -81,11 +82,55 @@ EMAIL_BACKEND = os.getenv('EMAIL_BACKEND', 'django.core.mail.backends.smtp.Email
 EMAIL_HOST = os.getenv('EMAIL_HOST', 'localhost')
 EMAIL_PORT = os.getenv('EMAIL_PORT', 1025)
 EMAIL_FROM = os.getenv('EMAIL_FROM', 'noreply@somehost.local')
+# Emails are sent in batches over one SMTP connection - see src/common/mail.py
+# Seconds to wait for more emails after the first one of a batch
+EMAIL_BATCH_WINDOW = float(os.getenv('EMAIL_BATCH_WINDOW', 2))
+EMAIL_BATCH_SIZE = int(os.getenv('EMAIL_BATCH_SIZE', 100))
+EMAIL_MAX_ATTEMPTS = int(os.getenv('EMAIL_MAX_ATTEMPTS', 3))
+# Seconds before sending the failed emails again
+EMAIL_RETRY_DELAY = int(os.getenv('EMAIL_RETRY_DELAY', 60))
+# {% inlinecss %} of the email templates : the stylesheets are read and parsed once per process
+INLINECSS_ENGINE = 'src.common.mail.CachedPynlinerEngine'
+INLINECSS_CSS_LOADER = 'src.common.mail.CachedCSSLoader'
 
 # Celery
 BROKER_URL = os.getenv('BROKER_URL', 'redis://redis:6379')
 CELERY_RESULT_BACKEND = os.getenv('CELERY_RESULT_BACKEND', 'redis://redis:6379')
 
+# Redis
+REDIS_URL = os.getenv('REDIS_URL', BROKER_URL)
+REDIS_SOCKET_TIMEOUT = float(os.getenv('REDIS_SOCKET_TIMEOUT', 0.1))
+
+# Cache, shared by all the processes
+CACHES = {
+    'default': {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': os.getenv('CACHE_URL', f'{REDIS_URL}/1'),
+        'OPTIONS': {
+            'SOCKET_CONNECT_TIMEOUT': REDIS_SOCKET_TIMEOUT,
+            'SOCKET_TIMEOUT': REDIS_SOCKET_TIMEOUT,
+            # The cache is an optimization : when Redis is unreachable, reads miss and writes are dropped
+            'IGNORE_EXCEPTIONS': True,
+        },
+    },
+    # Deny-list of the revoked tokens - see src/users/authentication.py : the errors are raised, a revocation is never
+    # dropped silently
+    'auth': {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': os.getenv('CACHE_URL', f'{REDIS_URL}/1'),
+        'OPTIONS': {
+            'SOCKET_CONNECT_TIMEOUT': REDIS_SOCKET_TIMEOUT,
+            'SOCKET_TIMEOUT': REDIS_SOCKET_TIMEOUT,
+        },
+    },
+}
+DJANGO_REDIS_LOG_IGNORED_EXCEPTIONS = True
+if TESTING:
+    CACHES = {
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+        'auth': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'auth'},
+    }
+
 ADMINS = ()
 
 # Sentry
@@ -99,6 +144,40 @@ CELERY_ACCEPT_CONTENT = ['application/json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'UTC'
+# The tests run the tasks in their own process - on commit, see TestCase.captureOnCommitCallbacks
+CELERY_ALWAYS_EAGER = TESTING
+CELERYBEAT_SCHEDULE = {
+    # date restrictions boundaries all fall on midnight
+    'refresh-promocodes-active-flags': {
+        'task': 'RefreshPromoCodesActiveFlagsTask',
+        'schedule': crontab(minute=0, hour=0),
+    },
+    # safety net, the snapshot is also published on every promo code change
+    'publish-promocodes-snapshot': {
+        'task': 'PublishPromoCodesSnapshotTask',
+        'schedule': timedelta(minutes=10),
+    },
+    # moves the validation events from the Redis stream to the audit table
+    'write-validation-events': {
+        'task': 'WriteValidationEventsTask',
+        'schedule': timedelta(seconds=5),
+    },
+    # safety net, a batch is scheduled when its first email is queued
+    'send-queued-emails': {
+        'task': 'SendQueuedEmailsTask',
+        'schedule': timedelta(minutes=1),
+    },
+    # moves the closed buckets of the live validation counters to PromoCodeCounter
+    'roll-up-promocode-counters': {
+        'task': 'RollUpPromoCodeCountersTask',
+        'schedule': timedelta(minutes=1),
+    },
+    # deletes the chunks of the uploads never completed
+    'abort-stale-uploads': {
+        'task': 'AbortStaleUploadsTask',
+        'schedule': timedelta(hours=1),
+    },
+}
 
 # Postgres
 DATABASES = {
@@ -133,9 +212,15 @@ STATICFILES_FINDERS = (
     'django.contrib.staticfiles.finders.AppDirectoriesFinder',
 )
 
-# Media files
+# Media files : public, e.g. the thumbnails
 MEDIA_ROOT = join(os.path.dirname(BASE_DIR), 'media')
 MEDIA_URL = '/media/'
+# The uploaded files, when stored on the filesystem : outside MEDIA_ROOT, so that they are only downloaded once
+# authorized - see src/files/storage.py
+PROTECTED_MEDIA_ROOT = join(os.path.dirname(BASE_DIR), 'protected_media')
+# Internal nginx location of PROTECTED_MEDIA_ROOT (see nginx-media.conf) : when set, the downloads authorized by Django
+# are handed off to nginx with X-Accel-Redirect. Empty, Django serves them.
+NGINX_ACCEL_REDIRECT_PREFIX = os.getenv('NGINX_ACCEL_REDIRECT_PREFIX', '')
 
 # Headers
 USE_X_FORWARDED_HOST = True
@@ -232,8 +317,8 @@ AUTH_USER_MODEL = 'users.User'
 AUTHENTICATION_BACKENDS = (
     'social_core.backends.facebook.FacebookOAuth2',
     'social_core.backends.twitter.TwitterOAuth',
+    # Also authenticates with the username : ModelBackend would only query and hash a second time on failed logins
     'src.users.backends.EmailOrUsernameModelBackend',
-    'django.contrib.auth.backends.ModelBackend',
 )
 for key in ['GOOGLE_OAUTH2_KEY', 'GOOGLE_OAUTH2_SECRET', 'FACEBOOK_KEY', 'FACEBOOK_SECRET', 'TWITTER_KEY', 'TWITTER_SECRET']:
     exec("SOCIAL_AUTH_{key} = os.environ.get('{key}', '')".format(key=key))
@@ -282,7 +367,8 @@ SOCIAL_AUTH_TWITTER_PIPELINE = (
 SOCIAL_AUTH_LOGIN_REDIRECT_URL = '/complete/twitter/'
 
 THUMBNAIL_ALIASES = {
-    'src.users': {
+    # easy_thumbnails targets are app labels, not module paths
+    'users': {
         'thumbnail': {'size': (100, 100), 'crop': True},
         'medium_square_crop': {'size': (400, 400), 'crop': True},
         'small_square_crop': {'size': (50, 50), 'crop': True},
@@ -298,15 +384,20 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': int(os.getenv('DJANGO_PAGINATION_LIMIT', 18)),
     'DATETIME_FORMAT': '%Y-%m-%dT%H:%M:%S.%fZ',
     'DEFAULT_RENDERER_CLASSES': (
-        'rest_framework.renderers.JSONRenderer',
+        'src.common.renderers.ORJSONRenderer',
         'rest_framework.renderers.BrowsableAPIRenderer',
     ),
+    'DEFAULT_PARSER_CLASSES': (
+        'src.common.parsers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework.authentication.SessionAuthentication',
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'src.users.authentication.StatelessJWTAuthentication',
     ),
     'DEFAULT_THROTTLE_CLASSES': [
         'rest_framework.throttling.AnonRateThrottle',
@@ -317,6 +408,20 @@ REST_FRAMEWORK = {
     'TEST_REQUEST_DEFAULT_FORMAT': 'json',
 }
 
+# Redis token buckets - see src/common/throttling.py
+# rate is in tokens per second, burst is the bucket capacity.
+TOKEN_BUCKET_ENABLED = os.getenv('TOKEN_BUCKET_ENABLED', 'True') == 'True' and not TESTING
+TOKEN_BUCKET_RATES = {
+    'promocodes.create': {'rate': 1, 'burst': 10},
+    'promocodes.validate': {'rate': 5, 'burst': 20},
+}
+# SHA-256 hex digests of the API keys issued to clients, comma separated. Requests with one of these keys in their
+# X-Api-Key header get the bucket of the key, the others the bucket of their IP.
+API_KEY_HASHES = frozenset(filter(None, os.getenv('API_KEY_HASHES', '').split(',')))
+
+# Seconds during which the users authenticated by the session are cached, deleted on save. 0 disables the cache.
+USER_CACHE_TTL = int(os.getenv('USER_CACHE_TTL', 300))
+
 # JWT configuration
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
@@ -360,3 +465,49 @@ SUMMERNOTE_CONFIG = {
 DEFAULT_AUTO_FIELD = 'django.db.models.AutoField'
 
 OPEN_WEATHER_KEY = os.getenv('OPEN_WEATHER_KEY', '')
+
+# Promo codes catalogue snapshot, memory-mapped by the web workers - see src/promocodes/snapshot.py
+# The path must be shared by the web and queue containers. Leave empty to read promo codes from the database.
+PROMOCODE_SNAPSHOT_PATH = os.getenv('PROMOCODE_SNAPSHOT_PATH', '')
+# Seconds during which the web workers keep promo codes in memory. Edits are picked up through Postgres
+# LISTEN / NOTIFY (see src/promocodes/invalidation.py), the TTL only bounds the memory usage. 0 disables the cache.
+PROMOCODE_CACHE_TTL = int(os.getenv('PROMOCODE_CACHE_TTL', 3600))
+# Whether the web workers listen to the promo code changes : the cache and the Bloom filter are only used while they do.
+# Off in the tests, whose transactions are never committed hence never notified.
+PROMOCODE_CHANGES_LISTENER_ENABLED = os.getenv('PROMOCODE_CHANGES_LISTENER_ENABLED', 'True') == 'True' and not TESTING
+# Seconds between two rebuilds of the web workers Bloom filter over the promo code names, which answers unknown names
+# with an index only lookup instead of the snapshot and row reads. It is also kept up to date on save and by the
+# notifications. 0 disables it.
+PROMOCODE_BLOOM_FILTER_REBUILD_INTERVAL = int(os.getenv('PROMOCODE_BLOOM_FILTER_REBUILD_INTERVAL', 600))
+
+# Audit log of the promo code validations - see src/promocodes/audit.py
+AUDIT_ENABLED = os.getenv('AUDIT_ENABLED', 'True') == 'True' and not TESTING
+# Events kept in memory by each web worker while waiting to be pushed to Redis, then dropped
+AUDIT_BUFFER_SIZE = int(os.getenv('AUDIT_BUFFER_SIZE', 10000))
+# Events per Redis pipeline and per COPY
+AUDIT_BATCH_SIZE = int(os.getenv('AUDIT_BATCH_SIZE', 5000))
+# Events waiting in the Redis stream for the writer task, then dropped
+AUDIT_STREAM_MAXLEN = int(os.getenv('AUDIT_STREAM_MAXLEN', 1000000))
+
+# Live validation counters of the promo codes, by status and denial reason - see src/promocodes/counters.py
+PROMOCODE_COUNTERS_ENABLED = os.getenv('PROMOCODE_COUNTERS_ENABLED', 'True') == 'True' and not TESTING
+# Seconds during which the web workers keep the user segments in memory - see src/promocodes/segments.py
+PROMOCODE_SEGMENT_CACHE_TTL = int(os.getenv('PROMOCODE_SEGMENT_CACHE_TTL', 60))
+# Seconds during which the promo code versions (ETag / Last-Modified) are cached. Saves delete them, the TTL bounds
+# the staleness after the writes which bypass save(), e.g. update() or raw SQL.
+PROMOCODE_VERSION_CACHE_TTL = int(os.getenv('PROMOCODE_VERSION_CACHE_TTL', 300))
+
+# Uploaded files are hashed as they are received, then stored once per content - see src/files/blobs.py
+FILE_UPLOAD_HANDLERS = [
+    'src.files.blobs.HashingMemoryFileUploadHandler',
+    'src.files.blobs.HashingTemporaryFileUploadHandler',
+]
+
+# Chunked, resumable file uploads - see src/files/uploads.py
+# Size of every chunk but the last one. S3 multipart uploads need parts of at least 5MB.
+UPLOAD_CHUNK_SIZE = max(int(os.getenv('UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024)), 5 * 1024 * 1024)
+UPLOAD_MAX_SIZE = int(os.getenv('UPLOAD_MAX_SIZE', 5 * 1024 * 1024 * 1024))
+# Seconds during which the presigned POST of a direct upload to S3 is valid
+UPLOAD_PRESIGNED_EXPIRY = int(os.getenv('UPLOAD_PRESIGNED_EXPIRY', 3600))
+# Hours after which an incomplete upload is aborted and its chunks deleted
+UPLOAD_SESSION_TTL = int(os.getenv('UPLOAD_SESSION_TTL', 24))
@@ -0,0 +1,132 @@
+import hashlib
+import os
+
+from django.core.files.uploadhandler import MemoryFileUploadHandler, TemporaryFileUploadHandler
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import Blob, File
+from .storage import files_storage
+
+# Content-addressed storage of the uploaded files.
+#
+# The content of a file is stored once, under its SHA-256, as a Blob counting the files referencing it.
+# A file uploaded again reuses the blob and its thumbnail : nothing is written to the storage nor processed.
+# The blob and its thumbnail are deleted with the last file referencing it.
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+class HashingUploadHandlerMixin:
+    """
+    Hash the uploaded files as they are received - see settings.FILE_UPLOAD_HANDLERS
+    """
+
+    def new_file(self, *args, **kwargs):
+        # Before : the handler keeping the file raises StopFutureHandlers
+        self.hash = hashlib.sha256()
+        super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        data = super().receive_data_chunk(raw_data, start)
+        # The chunk is only hashed by the handler keeping it
+        if data is None:
+            self.hash.update(raw_data)
+        return data
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        if file is not None:
+            file.content_hash = self.hash.hexdigest()
+        return file
+
+
+class HashingMemoryFileUploadHandler(HashingUploadHandlerMixin, MemoryFileUploadHandler):
+    pass
+
+
+class HashingTemporaryFileUploadHandler(HashingUploadHandlerMixin, TemporaryFileUploadHandler):
+    pass
+
+
+def hash_stream(blocks):
+    content_hash = hashlib.sha256()
+    for block in blocks:
+        content_hash.update(block)
+    return content_hash.hexdigest()
+
+
+def get_blob_key(content_hash, filename):
+    # Spread over directories, the extension kept for the content type
+    extension = os.path.splitext(filename)[1].lower()
+    return f'blobs/{content_hash[:2]}/{content_hash[2:4]}/{content_hash}{extension}'
+
+
+def acquire_blob(content_hash, size, filename, save):
+    """
+    Take a reference on the blob of the content with the given hash. If there is none, it is created and
+    save(key) stores the content under its key. Return the blob.
+    """
+    with transaction.atomic():
+        blob = Blob.objects.select_for_update().filter(hash=content_hash).first()
+        if blob is None:
+            # Already there when left by a rolled back creation, or saved by a concurrent upload : same key, same content
+            key, saved_key = get_blob_key(content_hash, filename), None
+            if not files_storage.exists(key):
+                saved_key = save(key)
+            try:
+                with transaction.atomic():
+                    blob = Blob.objects.create(hash=content_hash, file=key, size=size)
+            except IntegrityError:
+                blob = Blob.objects.select_for_update().get(hash=content_hash)
+            if saved_key and saved_key != blob.file.name:
+                files_storage.delete(saved_key)
+        Blob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') + 1)
+    return blob
+
+
+def acquire_uploaded_blob(content):
+    """
+    acquire_blob for an uploaded file - hashed while received, or read once here
+    """
+    content_hash = getattr(content, 'content_hash', None)
+    if content_hash is None:
+        content_hash = hash_stream(content.chunks(HASH_BLOCK_SIZE))
+        content.seek(0)
+    return acquire_blob(content_hash, content.size, content.name, lambda key: files_storage.save(key, content))
+
+
+def release_blob(blob_id):
+    """
+    Drop a reference on the blob, deleting it and its files with the last one.
+    """
+    with transaction.atomic():
+        # Blocks acquire_blob until the files are deleted : it then stores the content again
+        blob = Blob.objects.select_for_update().filter(pk=blob_id).first()
+        if blob is None:
+            return
+        if blob.ref_count > 1:
+            Blob.objects.filter(pk=blob_id).update(ref_count=F('ref_count') - 1)
+            return
+
+        blob.delete()
+        blob.file.delete(save=False)
+        if blob.thumbnail:
+            blob.thumbnail.delete(save=False)
+
+
+def create_file(author, blob):
+    """
+    Create a file of the blob, with its thumbnail if it is already generated.
+    """
+    thumbnail_status = blob.thumbnail_status
+    # Pending or failed : GenerateFileThumbnailTask (re)generates the thumbnail of the blob
+    if thumbnail_status not in (File.THUMBNAIL_READY, File.THUMBNAIL_NONE):
+        thumbnail_status = File.THUMBNAIL_PENDING
+    return File.objects.create(
+        author=author,
+        blob=blob,
+        file=blob.file.name,
+        thumbnail=blob.thumbnail.name or None,
+        thumbnail_status=thumbnail_status,
+    )
@@ -0,0 +1,30 @@
+# Generated by Django 3.2.12 on 2026-10-19 11:33
+
+from django.db import migrations, models
+
+
+def set_existing_thumbnail_statuses(apps, schema_editor):
+    # Thumbnails of the existing files were generated on upload
+    File = apps.get_model('files', 'File')
+    File.objects.exclude(thumbnail='').exclude(thumbnail=None).update(thumbnail_status='ready')
+    File.objects.filter(models.Q(thumbnail='') | models.Q(thumbnail=None)).update(thumbnail_status='none')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='file',
+            name='thumbnail_status',
+            field=models.CharField(
+                choices=[('pending', 'Pending'), ('ready', 'Ready'), ('failed', 'Failed'), ('none', 'None')],
+                default='pending',
+                max_length=16,
+            ),
+        ),
+        migrations.RunPython(set_existing_thumbnail_statuses, migrations.RunPython.noop),
+    ]
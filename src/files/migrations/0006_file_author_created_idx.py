@@ -0,0 +1,28 @@
+# Generated by Django 3.2.12 on 2026-10-19 11:44
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('files', '0005_uploadsession_direct'),
+    ]
+
+    operations = [
+        # The composite index replaces the author index : created first, the author lookups always have one
+        migrations.AddIndex(
+            model_name='file',
+            index=models.Index(fields=['author', 'created_at', 'id'], name='files_file_author_created_idx'),
+        ),
+        migrations.AlterField(
+            model_name='file',
+            name='author',
+            field=models.ForeignKey(
+                db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='files', to=settings.AUTH_USER_MODEL
+            ),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 3.2.12 on 2026-10-19 14:02
+
+import os
+import shutil
+
+from django.conf import settings
+from django.db import migrations, models
+
+import src.files.storage
+
+
+def move_uploaded_files(apps, source, destination):
+    # Remote storages keep the same bucket
+    if not isinstance(src.files.storage.files_storage, src.files.storage.ProtectedFileSystemStorage):
+        return
+    File, Blob, UploadSession = (
+        apps.get_model('files', 'File'),
+        apps.get_model('files', 'Blob'),
+        apps.get_model('files', 'UploadSession'),
+    )
+    names = set(File.objects.values_list('file', flat=True)) | set(Blob.objects.values_list('file', flat=True))
+    names |= set(UploadSession.objects.exclude(status='complete').values_list('key', flat=True))
+    for name in names:
+        source_path = os.path.join(source, name)
+        if name and os.path.isfile(source_path):
+            destination_path = os.path.join(destination, name)
+            os.makedirs(os.path.dirname(destination_path), exist_ok=True)
+            shutil.move(source_path, destination_path)
+
+
+def move_to_protected_media(apps, schema_editor):
+    move_uploaded_files(apps, settings.MEDIA_ROOT, settings.PROTECTED_MEDIA_ROOT)
+
+
+def move_to_media(apps, schema_editor):
+    move_uploaded_files(apps, settings.PROTECTED_MEDIA_ROOT, settings.MEDIA_ROOT)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('files', '0006_file_author_created_idx'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='blob',
+            name='file',
+            field=models.FileField(storage=src.files.storage.get_files_storage, upload_to=''),
+        ),
+        migrations.AlterField(
+            model_name='file',
+            name='file',
+            field=models.FileField(storage=src.files.storage.get_files_storage, upload_to=''),
+        ),
+        # The uploads stored on the filesystem leave MEDIA_ROOT, served publicly by nginx
+        migrations.RunPython(move_to_protected_media, move_to_media),
+    ]
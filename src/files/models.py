@@ -1,22 +1,94 @@
-from django.db import models
+import uuid
+
+from django.db import models, transaction
 from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
-from easy_thumbnails.exceptions import EasyThumbnailsError
-from easy_thumbnails.files import get_thumbnailer
-from PIL import UnidentifiedImageError
+
+from .storage import get_files_storage
 
 
 class File(models.Model):
     THUMBNAIL_SIZE = (360, 360)
 
-    file = models.FileField(blank=False, null=False)
+    # thumbnail_status : the thumbnail is generated by GenerateFileThumbnailTask, clients poll until it is ready
+    THUMBNAIL_PENDING = 'pending'
+    THUMBNAIL_READY = 'ready'
+    THUMBNAIL_FAILED = 'failed'
+    # the file is not an image
+    THUMBNAIL_NONE = 'none'
+    THUMBNAIL_STATUSES = (
+        (THUMBNAIL_PENDING, 'Pending'),
+        (THUMBNAIL_READY, 'Ready'),
+        (THUMBNAIL_FAILED, 'Failed'),
+        (THUMBNAIL_NONE, 'None'),
+    )
+
+    file = models.FileField(blank=False, null=False, storage=get_files_storage)
+    thumbnail = models.ImageField(blank=True, null=True)
+    thumbnail_status = models.CharField(max_length=16, choices=THUMBNAIL_STATUSES, default=THUMBNAIL_PENDING)
+    # Indexed by files_file_author_created_idx
+    author = models.ForeignKey('users.User', related_name='files', on_delete=models.DO_NOTHING, db_index=False)
+    # file and thumbnail are the ones of the blob - files uploaded before the blobs have none
+    blob = models.ForeignKey('Blob', related_name='files', null=True, blank=True, on_delete=models.PROTECT)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        # The pages of the files of a user - see FileCursorPagination
+        indexes = [models.Index(fields=['author', 'created_at', 'id'], name='files_file_author_created_idx')]
+
+
+class Blob(models.Model):
+    """
+    Content of the uploaded files, stored once under its SHA-256 whatever the number of files - see blobs.py
+    """
+
+    hash = models.CharField(max_length=64, unique=True)
+    file = models.FileField(storage=get_files_storage)
+    size = models.PositiveBigIntegerField()
     thumbnail = models.ImageField(blank=True, null=True)
-    author = models.ForeignKey('users.User', related_name='files', on_delete=models.DO_NOTHING)
+    thumbnail_status = models.CharField(max_length=16, choices=File.THUMBNAIL_STATUSES, default=File.THUMBNAIL_PENDING)
+    # Files referencing the blob : it is deleted with the last one
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+
+class UploadSession(models.Model):
+    """
+    Chunked, resumable upload : the chunks are streamed to the storage as they arrive, at offset,
+    then the completed upload becomes a File - see uploads.py
+    """
+
+    OPEN = 'open'
+    # finished : the File is registered by RegisterUploadTask
+    COMPLETING = 'completing'
+    COMPLETE = 'complete'
+    STATUSES = ((OPEN, 'Open'), (COMPLETING, 'Completing'), (COMPLETE, 'Complete'))
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    author = models.ForeignKey('users.User', related_name='upload_sessions', on_delete=models.CASCADE)
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    # Bytes received so far : the next chunk starts there
+    offset = models.PositiveBigIntegerField(default=0)
+    status = models.CharField(max_length=16, choices=STATUSES, default=OPEN)
+    # Sent by the client straight to the bucket, through a presigned POST
+    direct = models.BooleanField(default=False)
+    # Storage key of the upload, and S3 multipart upload id and parts
+    key = models.CharField(max_length=1024)
+    multipart_upload_id = models.CharField(max_length=1024, blank=True, default='')
+    parts = models.JSONField(default=list)
+    file = models.OneToOneField(File, related_name='upload_session', null=True, blank=True, on_delete=models.SET_NULL)
     created_at = models.DateTimeField(auto_now_add=True)
 
 
 @receiver(post_delete, sender=File)
 def auto_delete_file_on_delete(sender, instance, **kwargs):
+    if instance.blob_id:
+        from .blobs import release_blob
+
+        release_blob(instance.blob_id)
+        return
+
     if instance.file:
         instance.file.delete()
 
@@ -26,14 +98,10 @@ def auto_delete_file_on_delete(sender, instance, **kwargs):
 
 @receiver(post_save, sender=File)
 def generate_thumbnail(sender, instance=None, created=False, **kwargs):
-    # avoid recursion
-    if created is False:
+    # avoid recursion - and the duplicates of a blob with a thumbnail already
+    if created is False or instance.thumbnail_status != File.THUMBNAIL_PENDING:
         return
 
-    thumbnailer = get_thumbnailer(instance.file.name, relative_name='thumbnail')
-    try:
-        thumbnail = thumbnailer.get_thumbnail({'size': File.THUMBNAIL_SIZE}, save=False)
-    except (UnidentifiedImageError, EasyThumbnailsError):
-        return
-    else:
-        instance.thumbnail.save(name=f'small_{instance.file.name}', content=thumbnail)
+    from .tasks import generate_file_thumbnail_task
+
+    transaction.on_commit(lambda: generate_file_thumbnail_task.delay(instance.pk))
@@ -0,0 +1,12 @@
+from rest_framework.pagination import CursorPagination
+
+
+class FileCursorPagination(CursorPagination):
+    """
+    Keyset pages of the files of a user, newest first : each page is a range scan of files_file_author_created_idx
+    from the cursor position, whatever the number of files before it.
+    """
+
+    ordering = ('-created_at', '-id')
+    page_size_query_param = 'page_size'
+    max_page_size = 100
@@ -1,15 +1,109 @@
+import os
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import models, transaction
+from django.urls import reverse
 from rest_framework import serializers
 
-from .models import File
+from src.common.helpers import get_storage_urls
+
+from .blobs import acquire_uploaded_blob, create_file
+from .models import File, UploadSession
+from .uploads import S3UploadStore, get_upload_store
+from .validators import validate_file_size
+
+
+class StorageURLsMixin:
+    """
+    File fields rendered from the URLs resolved in bulk by FileListSerializer, when there are some
+    """
+
+    def to_representation(self, value):
+        urls = self.context.get('storage_urls')
+        if urls is None or not value:
+            return super().to_representation(value)
+        return urls[value.name]
+
+
+class DownloadURLFileField(serializers.FileField):
+    """
+    File rendered as the URL of its download : the uploaded files have no public URL - see files/storage.py
+    """
+
+    def to_representation(self, value):
+        if not value:
+            return None
+        url = reverse('file-download', kwargs={'pk': value.instance.pk})
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request is not None else url
+
+
+class StorageURLImageField(StorageURLsMixin, serializers.ImageField):
+    pass
+
+
+class FileListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        files = list(data)
+        names = {instance.thumbnail.name for instance in files}
+        self._context['storage_urls'] = get_storage_urls(default_storage, names, self.context.get('request'))
+        try:
+            return super().to_representation(files)
+        finally:
+            del self._context['storage_urls']
 
 
 class FileSerializer(serializers.ModelSerializer):
+    serializer_field_mapping = {
+        **serializers.ModelSerializer.serializer_field_mapping,
+        models.FileField: DownloadURLFileField,
+        models.ImageField: StorageURLImageField,
+    }
+
     class Meta:
         model = File
-        fields = ('file', 'thumbnail', 'created_at', 'id')
+        fields = ('file', 'thumbnail', 'thumbnail_status', 'created_at', 'id')
+        read_only_fields = ('thumbnail_status',)
+        extra_kwargs = {'file': {'validators': [validate_file_size]}}
+        list_serializer_class = FileListSerializer
 
     def create(self, validated_data):
         user = self.context['request'].user
-        validated_data['author_id'] = user.id
 
-        return super().create(validated_data)
+        with transaction.atomic():
+            return create_file(user, acquire_uploaded_blob(validated_data['file']))
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    chunk_size = serializers.SerializerMethodField()
+    presigned_post = serializers.SerializerMethodField()
+
+    class Meta:
+        model = UploadSession
+        fields = ('id', 'filename', 'size', 'direct', 'offset', 'chunk_size', 'presigned_post', 'status', 'file', 'created_at')
+        read_only_fields = ('offset', 'status', 'file')
+
+    def get_chunk_size(self, instance):
+        return settings.UPLOAD_CHUNK_SIZE
+
+    def get_presigned_post(self, instance):
+        # Only on creation
+        return getattr(instance, 'presigned_post', None)
+
+    def validate_direct(self, value):
+        if value and not isinstance(get_upload_store(), S3UploadStore):
+            raise serializers.ValidationError('Direct uploads need the S3 storage.')
+        return value
+
+    def validate_filename(self, value):
+        # The storage name of the file : no directories
+        value = os.path.basename(value)
+        if not value:
+            raise serializers.ValidationError('A filename is required.')
+        return value
+
+    def validate_size(self, value):
+        if value > settings.UPLOAD_MAX_SIZE:
+            raise serializers.ValidationError(f'The maximum file size that can be uploaded is {settings.UPLOAD_MAX_SIZE} bytes.')
+        return value
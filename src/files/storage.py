@@ -0,0 +1,49 @@
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.urls import reverse
+from django.utils.functional import LazyObject, empty
+
+# Storage of the uploaded files.
+#
+# Remote storages (S3) are shared with the rest of the media. On the filesystem, the uploads are kept in
+# PROTECTED_MEDIA_ROOT, outside MEDIA_ROOT : nginx only serves them through an internal location, once the download
+# is authorized by FilesViewset.download - see file_download_response.
+
+
+class ProtectedFileSystemStorage(FileSystemStorage):
+    def __init__(self):
+        super().__init__(location=settings.PROTECTED_MEDIA_ROOT)
+
+    def url(self, name):
+        # No public URL : the download route of the file, authorized for its author. Blobs are shared by several files,
+        # the first one is picked - FileSerializer renders the route of each file instead.
+        from .models import File
+
+        pk = File.objects.filter(file=name).order_by('pk').values_list('pk', flat=True).first()
+        if pk is None:
+            raise ValueError(f'No file is stored under {name}.')
+        return reverse('file-download', kwargs={'pk': pk})
+
+
+class FilesStorage(LazyObject):
+    def _setup(self):
+        if isinstance(default_storage, FileSystemStorage):
+            self._wrapped = ProtectedFileSystemStorage()
+        else:
+            self._wrapped = default_storage._wrapped
+
+
+files_storage = FilesStorage()
+
+
+def get_files_storage():
+    # Callable : the storage is not serialized in the migrations
+    return files_storage
+
+
+@receiver(setting_changed)
+def reset_files_storage(setting, **kwargs):
+    if setting in ('DEFAULT_FILE_STORAGE', 'MEDIA_ROOT', 'PROTECTED_MEDIA_ROOT'):
+        files_storage._wrapped = empty
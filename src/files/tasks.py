@@ -0,0 +1,105 @@
+import logging
+
+from datetime import timedelta
+
+from celery import task
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from easy_thumbnails.exceptions import EasyThumbnailsError
+from easy_thumbnails.files import Thumbnailer
+from PIL import UnidentifiedImageError
+
+from src.common.thumbnails import CorruptImageError, generate_thumbnails
+
+from .models import Blob, File, UploadSession
+from .uploads import complete_upload, get_upload_store
+
+logger = logging.getLogger(__name__)
+
+
+def set_thumbnail(instance, **fields):
+    # update() does not send post_save
+    if instance.blob_id is None:
+        File.objects.filter(pk=instance.pk).update(**fields)
+        return
+    # The thumbnail of a blob is the one of all its files
+    Blob.objects.filter(pk=instance.blob_id).update(**fields)
+    File.objects.filter(blob_id=instance.blob_id).update(**fields)
+
+
+@task(name='GenerateFileThumbnailTask', bind=True, max_retries=3, default_retry_delay=10)
+def generate_file_thumbnail_task(self, file_id):
+    """
+    Generate the thumbnail of the file - of its blob. Idempotent : the thumbnail name only depends on the file,
+    so a retry overwrites the thumbnail of the previous attempt instead of creating another one.
+    """
+    instance = File.objects.select_related('blob').filter(pk=file_id).first()
+    if instance is None or instance.thumbnail_status == File.THUMBNAIL_READY:
+        return
+    if instance.blob and instance.blob.thumbnail_status in (File.THUMBNAIL_READY, File.THUMBNAIL_NONE):
+        # Generated for another file of the blob meanwhile
+        set_thumbnail(instance, thumbnail=instance.blob.thumbnail.name or None, thumbnail_status=instance.blob.thumbnail_status)
+        return
+
+    thumbnailer = Thumbnailer(name=instance.file.name, source_storage=instance.file.storage)
+    try:
+        (thumbnail,) = generate_thumbnails(thumbnailer, [{'size': File.THUMBNAIL_SIZE}])
+
+        name = f'small_{instance.file.name}'
+        storage = instance.thumbnail.storage
+        if storage.exists(name):
+            storage.delete(name)
+        name = storage.save(name, thumbnail)
+    except (UnidentifiedImageError, EasyThumbnailsError):
+        set_thumbnail(instance, thumbnail_status=File.THUMBNAIL_NONE)
+        return
+    except CorruptImageError:
+        # A retry would not decode it either
+        logger.warning('Thumbnail of the file %s failed, the image can not be decoded.', file_id, exc_info=True)
+        set_thumbnail(instance, thumbnail_status=File.THUMBNAIL_FAILED)
+        return
+    except Exception as e:
+        if self.request.retries >= self.max_retries:
+            set_thumbnail(instance, thumbnail_status=File.THUMBNAIL_FAILED)
+            raise
+        raise self.retry(exc=e)
+
+    set_thumbnail(instance, thumbnail=name, thumbnail_status=File.THUMBNAIL_READY)
+
+
+@task(name='RegisterUploadTask', bind=True, max_retries=3, default_retry_delay=10)
+def register_upload_task(self, session_id):
+    """
+    Store a finished upload as a blob and create its File. Reading the upload back to hash it is left to the workers :
+    the web workers never read the content of a chunked or direct upload back - see uploads.py
+    """
+    try:
+        with transaction.atomic():
+            session = UploadSession.objects.select_for_update().filter(pk=session_id, status=UploadSession.COMPLETING).first()
+            if session is not None:
+                complete_upload(session)
+    except Exception as e:
+        if self.request.retries >= self.max_retries:
+            # The client can complete the upload again
+            UploadSession.objects.filter(pk=session_id).update(status=UploadSession.OPEN)
+            raise
+        raise self.retry(exc=e)
+
+
+@task(name='AbortStaleUploadsTask')
+def abort_stale_uploads_task():
+    """
+    Abort the uploads still open after UPLOAD_SESSION_TTL hours, deleting their chunks.
+    """
+    stale = UploadSession.objects.filter(
+        status=UploadSession.OPEN, created_at__lt=timezone.now() - timedelta(hours=settings.UPLOAD_SESSION_TTL)
+    )
+    store = get_upload_store()
+    for session in stale.iterator():
+        try:
+            store.abort(session)
+        except Exception:
+            logger.warning(f'Failed to abort the upload {session.pk}.', exc_info=True)
+            continue
+        session.delete()
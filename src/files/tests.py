@@ -1,3 +1,399 @@
-# from django.test import TestCase
+import base64
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
 
-# Create your tests here.
+from contextlib import contextmanager
+from unittest.mock import patch
+
+import boto3
+import requests
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import override_settings
+from django.urls import reverse
+from moto import mock_s3
+from PIL import Image
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from src.users.test.factories import UserFactory
+
+from .models import Blob, File, UploadSession
+from .tasks import generate_file_thumbnail_task
+from .uploads import S3UploadStore
+
+MEDIA_ROOT = tempfile.mkdtemp()
+PROTECTED_MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def get_image(name='image.jpg', size=(800, 600)):
+    content = io.BytesIO()
+    Image.new('RGB', size, (200, 30, 30)).save(content, 'JPEG')
+    return SimpleUploadedFile(name, content.getvalue(), content_type='image/jpeg')
+
+
+class OnCommitTasksMixin:
+    @contextmanager
+    def run_tasks_on_commit(self):
+        """
+        Run the tasks sent on commit when leaving the block, eagerly - see CELERY_ALWAYS_EAGER.
+        Django 3.2 does not run the callbacks registered by the callbacks : run them too.
+        """
+        with self.captureOnCommitCallbacks() as callbacks:
+            yield
+        while callbacks:
+            with self.captureOnCommitCallbacks() as next_callbacks:
+                for callback in callbacks:
+                    callback()
+            callbacks = next_callbacks
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, PROTECTED_MEDIA_ROOT=PROTECTED_MEDIA_ROOT)
+class TestFileThumbnail(OnCommitTasksMixin, APITestCase):
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        shutil.rmtree(PROTECTED_MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        self.user = UserFactory()
+        self.client.force_authenticate(user=self.user)
+
+    def test_upload_image(self):
+        with self.run_tasks_on_commit():
+            response = self.client.post(reverse('file-list'), {'file': get_image()}, format='multipart')
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            # Off the request path
+            self.assertEqual(response.data['thumbnail_status'], File.THUMBNAIL_PENDING)
+
+        response = self.client.get(reverse('file-detail', kwargs={'pk': response.data['id']}))
+        self.assertEqual(response.data['thumbnail_status'], File.THUMBNAIL_READY)
+        with Image.open(File.objects.get().thumbnail) as thumbnail:
+            self.assertLessEqual(max(thumbnail.size), max(File.THUMBNAIL_SIZE))
+
+    def test_upload_other_file(self):
+        with self.run_tasks_on_commit():
+            response = self.client.post(
+                reverse('file-list'), {'file': SimpleUploadedFile('notes.txt', b'notes')}, format='multipart'
+            )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(File.objects.get().thumbnail_status, File.THUMBNAIL_NONE)
+
+    def test_upload_truncated_image(self):
+        content = get_image().read()
+        with self.assertLogs('src.files.tasks', 'WARNING'), self.run_tasks_on_commit():
+            response = self.client.post(
+                reverse('file-list'), {'file': SimpleUploadedFile('image.jpg', content[: len(content) // 2])}, format='multipart'
+            )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(File.objects.get().thumbnail_status, File.THUMBNAIL_FAILED)
+
+    def test_thumbnail_task_is_idempotent(self):
+        with self.run_tasks_on_commit():
+            instance = File.objects.create(file=get_image(), author=self.user)
+        instance.refresh_from_db()
+        thumbnail_name = instance.thumbnail.name
+
+        File.objects.filter(pk=instance.pk).update(thumbnail_status=File.THUMBNAIL_PENDING)
+        generate_file_thumbnail_task(instance.pk)
+
+        instance.refresh_from_db()
+        self.assertEqual(instance.thumbnail.name, thumbnail_name)
+        self.assertEqual(instance.thumbnail_status, File.THUMBNAIL_READY)
+
+    def test_retrieve_other_user_file(self):
+        instance = File.objects.create(file=get_image(), author=UserFactory())
+        response = self.client.get(reverse('file-detail', kwargs={'pk': instance.pk}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, PROTECTED_MEDIA_ROOT=PROTECTED_MEDIA_ROOT, UPLOAD_CHUNK_SIZE=1024)
+class TestChunkedUpload(OnCommitTasksMixin, APITestCase):
+    def setUp(self):
+        self.user = UserFactory()
+        self.client.force_authenticate(user=self.user)
+        self.content = get_image(size=(200, 200)).read()
+
+    def start_upload(self, size=None):
+        response = self.client.post(reverse('uploadsession-list'), {'filename': 'image.jpg', 'size': size or len(self.content)})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.data['id']
+
+    def put_chunk(self, upload_id, offset, data, **extra):
+        return self.client.put(
+            reverse('uploadsession-chunk', kwargs={'pk': upload_id}),
+            data,
+            content_type='application/octet-stream',
+            HTTP_UPLOAD_OFFSET=str(offset),
+            **extra,
+        )
+
+    def test_upload_in_chunks(self):
+        upload_id = self.start_upload()
+        for offset in range(0, len(self.content), 1024):
+            response = self.put_chunk(upload_id, offset, self.content[offset : offset + 1024])
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        with self.run_tasks_on_commit():
+            response = self.client.post(reverse('uploadsession-complete', kwargs={'pk': upload_id}))
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['status'], UploadSession.COMPLETING)
+
+        response = self.client.get(reverse('uploadsession-detail', kwargs={'pk': upload_id}))
+        self.assertEqual(response.data['status'], UploadSession.COMPLETE)
+        instance = File.objects.get(pk=response.data['file'])
+        self.assertEqual(instance.file.read(), self.content)
+        self.assertEqual(instance.thumbnail_status, File.THUMBNAIL_READY)
+
+    def test_resume_upload(self):
+        upload_id = self.start_upload()
+        self.put_chunk(upload_id, 0, self.content[:1024])
+
+        # The chunk was received but the client did not get the answer : it sends the chunk again
+        response = self.put_chunk(upload_id, 0, self.content[:1024])
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.data['offset'], 1024)
+
+        response = self.client.get(reverse('uploadsession-detail', kwargs={'pk': upload_id}))
+        self.assertEqual(response.data['offset'], 1024)
+
+    def test_reject_oversized_chunk(self):
+        upload_id = self.start_upload()
+        response = self.put_chunk(upload_id, 0, self.content[:2048])
+        self.assertEqual(response.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+    def test_reject_oversized_upload(self):
+        with override_settings(UPLOAD_MAX_SIZE=1000):
+            response = self.client.post(reverse('uploadsession-list'), {'filename': 'image.jpg', 'size': 1001})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_complete_incomplete_upload(self):
+        upload_id = self.start_upload()
+        response = self.client.post(reverse('uploadsession-complete', kwargs={'pk': upload_id}))
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+    def test_reject_oversized_file_before_parsing(self):
+        response = self.client.post(
+            reverse('file-list'), b'', content_type='multipart/form-data; boundary=x', CONTENT_LENGTH=str(100 * 1024 * 1024)
+        )
+        self.assertEqual(response.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+    def test_reject_upload_without_content_length(self):
+        # e.g. Transfer-Encoding: chunked
+        response = self.client.post(reverse('file-list'), {'file': get_image()}, format='multipart', CONTENT_LENGTH='')
+        self.assertEqual(response.status_code, status.HTTP_411_LENGTH_REQUIRED)
+        self.assertFalse(File.objects.exists())
+
+        upload_id = self.start_upload()
+        response = self.put_chunk(upload_id, 0, self.content[:1024], CONTENT_LENGTH='')
+        self.assertEqual(response.status_code, status.HTTP_411_LENGTH_REQUIRED)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, PROTECTED_MEDIA_ROOT=PROTECTED_MEDIA_ROOT, UPLOAD_CHUNK_SIZE=1024)
+class TestBlobs(OnCommitTasksMixin, APITestCase):
+    def setUp(self):
+        self.user = UserFactory()
+        self.client.force_authenticate(user=self.user)
+
+    def upload(self, name='image.jpg'):
+        with self.run_tasks_on_commit():
+            response = self.client.post(reverse('file-list'), {'file': get_image(name)}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return File.objects.get(pk=response.data['id'])
+
+    def test_duplicate_upload_reuses_blob(self):
+        first = self.upload()
+        with patch('src.files.tasks.generate_thumbnails') as generate_thumbnails:
+            second = self.upload('copy.jpg')
+        generate_thumbnails.assert_not_called()
+
+        blob = Blob.objects.get()
+        self.assertEqual(blob.hash, hashlib.sha256(get_image().read()).hexdigest())
+        self.assertEqual(blob.ref_count, 2)
+        self.assertEqual((second.file.name, second.thumbnail.name), (first.file.name, first.thumbnail.name))
+        self.assertEqual(second.thumbnail_status, File.THUMBNAIL_READY)
+
+    def test_chunked_upload_reuses_blob(self):
+        first = self.upload()
+        content = get_image().read()
+        response = self.client.post(reverse('uploadsession-list'), {'filename': 'image.jpg', 'size': len(content)})
+        upload_id = response.data['id']
+        for offset in range(0, len(content), 1024):
+            self.client.put(
+                reverse('uploadsession-chunk', kwargs={'pk': upload_id}),
+                content[offset : offset + 1024],
+                content_type='application/octet-stream',
+                HTTP_UPLOAD_OFFSET=str(offset),
+            )
+
+        with self.run_tasks_on_commit():
+            self.client.post(reverse('uploadsession-complete', kwargs={'pk': upload_id}))
+        self.assertEqual(File.objects.get(upload_session=upload_id).file.name, first.file.name)
+        self.assertEqual(Blob.objects.get().ref_count, 2)
+
+    def test_blob_deleted_with_last_file(self):
+        first, second = self.upload(), self.upload()
+        storage, thumbnail_storage = first.file.storage, first.thumbnail.storage
+
+        first.delete()
+        self.assertTrue(storage.exists(second.file.name))
+        self.assertTrue(thumbnail_storage.exists(second.thumbnail.name))
+
+        second.delete()
+        self.assertFalse(Blob.objects.exists())
+        self.assertFalse(storage.exists(second.file.name))
+        self.assertFalse(thumbnail_storage.exists(second.thumbnail.name))
+
+
+@override_settings(
+    MEDIA_ROOT=MEDIA_ROOT,
+    PROTECTED_MEDIA_ROOT=PROTECTED_MEDIA_ROOT,
+    DEFAULT_FILE_STORAGE='storages.backends.s3boto3.S3Boto3Storage',
+    AWS_STORAGE_BUCKET_NAME='files',
+    AWS_ACCESS_KEY_ID='testing',
+    AWS_SECRET_ACCESS_KEY='testing',
+    AWS_S3_REGION_NAME='us-east-1',
+)
+class TestDirectUpload(OnCommitTasksMixin, APITestCase):
+    def setUp(self):
+        s3 = mock_s3()
+        s3.start()
+        self.addCleanup(s3.stop)
+        boto3.client('s3', region_name='us-east-1').create_bucket(Bucket='files')
+
+        self.user = UserFactory()
+        self.client.force_authenticate(user=self.user)
+        self.content = get_image().read()
+
+    def start_upload(self, size=None):
+        response = self.client.post(
+            reverse('uploadsession-list'), {'filename': 'image.jpg', 'size': size or len(self.content), 'direct': True}
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.data
+
+    def test_direct_upload(self):
+        upload = self.start_upload()
+        presigned_post = upload['presigned_post']
+        response = requests.post(presigned_post['url'], data=presigned_post['fields'], files={'file': self.content})
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+        with self.run_tasks_on_commit():
+            response = self.client.post(reverse('uploadsession-complete', kwargs={'pk': upload['id']}))
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['status'], UploadSession.COMPLETING)
+
+        response = self.client.get(reverse('uploadsession-detail', kwargs={'pk': upload['id']}))
+        self.assertEqual(response.data['status'], UploadSession.COMPLETE)
+        instance = File.objects.get(pk=response.data['file'])
+        self.assertEqual(instance.file.read(), self.content)
+        self.assertEqual(instance.thumbnail_status, File.THUMBNAIL_READY)
+        # Only the blob is left in the bucket
+        keys = [item['Key'] for item in boto3.client('s3').list_objects_v2(Bucket='files')['Contents']]
+        self.assertNotIn(f'uploads/{upload["id"]}', keys)
+
+    def test_reject_other_size(self):
+        upload = self.start_upload(size=len(self.content) + 1)
+        presigned_post = upload['presigned_post']
+        policy = json.loads(base64.b64decode(presigned_post['fields']['policy']))
+        self.assertIn(['content-length-range', len(self.content) + 1, len(self.content) + 1], policy['conditions'])
+
+        # Enforced by S3, not by moto
+        requests.post(presigned_post['url'], data=presigned_post['fields'], files={'file': self.content})
+        response = self.client.post(reverse('uploadsession-complete', kwargs={'pk': upload['id']}))
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertFalse(File.objects.exists())
+
+    def test_complete_before_upload(self):
+        upload = self.start_upload()
+        response = self.client.post(reverse('uploadsession-complete', kwargs={'pk': upload['id']}))
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+    def test_chunked_upload(self):
+        response = self.client.post(reverse('uploadsession-list'), {'filename': 'image.jpg', 'size': len(self.content)})
+        upload_id = response.data['id']
+        self.client.put(
+            reverse('uploadsession-chunk', kwargs={'pk': upload_id}),
+            self.content,
+            content_type='application/octet-stream',
+            HTTP_UPLOAD_OFFSET='0',
+        )
+
+        # The request only finishes the multipart upload : it is read back by RegisterUploadTask
+        with patch.object(S3UploadStore, 'complete', wraps=S3UploadStore().complete) as mock_complete:
+            with self.run_tasks_on_commit():
+                response = self.client.post(reverse('uploadsession-complete', kwargs={'pk': upload_id}))
+                self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+                mock_complete.assert_not_called()
+            mock_complete.assert_called_once()
+
+        instance = File.objects.get(upload_session=upload_id)
+        self.assertEqual(instance.file.read(), self.content)
+        self.assertEqual(instance.thumbnail_status, File.THUMBNAIL_READY)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, PROTECTED_MEDIA_ROOT=PROTECTED_MEDIA_ROOT)
+class TestFileList(OnCommitTasksMixin, APITestCase):
+    def setUp(self):
+        self.user = UserFactory()
+        self.client.force_authenticate(user=self.user)
+        with self.run_tasks_on_commit():
+            self.files = [File.objects.create(file=get_image(f'image{i}.jpg'), author=self.user) for i in range(5)]
+            File.objects.create(file=get_image(), author=UserFactory())
+
+    def test_list_pages(self):
+        ids, url = [], reverse('file-list') + '?page_size=2'
+        while url:
+            with self.assertNumQueries(1):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            ids += [item['id'] for item in response.data['results']]
+            url = response.data['next']
+
+        # Newest first, only the files of the user
+        self.assertEqual(ids, [instance.pk for instance in reversed(self.files)])
+
+    def test_list_urls(self):
+        response = self.client.get(reverse('file-list'))
+        instance = self.files[-1]
+        instance.refresh_from_db()
+        download_url = reverse('file-download', kwargs={'pk': instance.pk})
+        self.assertEqual(response.data['results'][0]['file'], f'http://testserver{download_url}')
+        self.assertEqual(response.data['results'][0]['thumbnail'], f'http://testserver{instance.thumbnail.url}')
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, PROTECTED_MEDIA_ROOT=PROTECTED_MEDIA_ROOT)
+class TestFileDownload(APITestCase):
+    def setUp(self):
+        self.user = UserFactory()
+        self.client.force_authenticate(user=self.user)
+        self.instance = File.objects.create(file=SimpleUploadedFile('notes.txt', b'notes'), author=self.user)
+
+    def test_download(self):
+        response = self.client.get(reverse('file-download', kwargs={'pk': self.instance.pk}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(b''.join(response.streaming_content), b'notes')
+
+    @override_settings(NGINX_ACCEL_REDIRECT_PREFIX='/protected-media/')
+    def test_download_through_nginx(self):
+        response = self.client.get(reverse('file-download', kwargs={'pk': self.instance.pk}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/{self.instance.file.name}')
+        self.assertEqual(response['Content-Type'], 'text/plain')
+        self.assertEqual(response.content, b'')
+
+    def test_uploads_are_not_public(self):
+        # Out of MEDIA_ROOT, served publicly by nginx
+        self.assertTrue(os.path.isfile(os.path.join(PROTECTED_MEDIA_ROOT, self.instance.file.name)))
+        self.assertFalse(os.path.exists(os.path.join(MEDIA_ROOT, self.instance.file.name)))
+        self.assertEqual(self.instance.file.url, reverse('file-download', kwargs={'pk': self.instance.pk}))
+
+    def test_download_other_user_file(self):
+        instance = File.objects.create(file=SimpleUploadedFile('notes.txt', b'notes'), author=UserFactory())
+        response = self.client.get(reverse('file-download', kwargs={'pk': instance.pk}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
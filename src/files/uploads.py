@@ -0,0 +1,212 @@
+import mimetypes
+import os
+import tempfile
+
+from botocore.exceptions import ClientError
+from django.conf import settings
+
+from .blobs import HASH_BLOCK_SIZE, acquire_blob, create_file, hash_stream
+from .models import UploadSession
+from .storage import files_storage
+
+# Stores of the chunked uploads (UploadSession).
+#
+# Chunks are streamed from the request to the storage in small blocks, so the web workers never hold a whole file :
+# appended to a partial file on the filesystem, or uploaded as the parts of an S3 multipart upload in production.
+# Every chunk but the last one is UPLOAD_CHUNK_SIZE bytes long, S3 parts must be at least 5MB.
+# A completed upload is stored as a blob, under the hash of its content, by RegisterUploadTask : the request completing
+# the upload only finishes it (finish), reading the whole file back to hash it (complete) is left to the workers.
+
+BLOCK_SIZE = 64 * 1024
+
+
+class IncompleteChunkError(Exception):
+    """
+    The request body ended before Content-Length bytes were read, e.g. the client disconnected.
+    """
+
+
+def copy_stream(stream, destination, length):
+    remaining = length
+    while remaining:
+        block = stream.read(min(BLOCK_SIZE, remaining))
+        if not block:
+            raise IncompleteChunkError(f'Received {length - remaining} bytes out of {length}.')
+        destination.write(block)
+        remaining -= len(block)
+
+
+class LocalUploadStore:
+    """
+    Chunks are written at their offset into a partial file, moved to the storage once complete.
+    """
+
+    def get_partial_path(self, session):
+        return files_storage.path(f'uploads/{session.id}.part')
+
+    def start(self, session):
+        path = self.get_partial_path(session)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        open(path, 'wb').close()
+        session.key = f'uploads/{session.id}.part'
+
+    def append(self, session, stream, length):
+        with open(self.get_partial_path(session), 'r+b') as f:
+            f.seek(session.offset)
+            try:
+                copy_stream(stream, f, length)
+            finally:
+                # Drop the bytes of an incomplete chunk, the client resends it
+                f.truncate(f.tell() if f.tell() == session.offset + length else session.offset)
+
+    def finish(self, session):
+        # The partial file is the upload
+        pass
+
+    def complete(self, session):
+        """
+        Return the blob of the upload, with a new reference - see blobs.py
+        """
+        partial_path = self.get_partial_path(session)
+        with open(partial_path, 'rb') as f:
+            content_hash = hash_stream(iter(lambda: f.read(HASH_BLOCK_SIZE), b''))
+
+        def save(key):
+            path = files_storage.path(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(partial_path, path)
+            return key
+
+        blob = acquire_blob(content_hash, session.size, session.filename, save)
+        # Already stored
+        self.abort(session)
+        return blob
+
+    def abort(self, session):
+        try:
+            os.remove(self.get_partial_path(session))
+        except FileNotFoundError:
+            pass
+
+
+class S3UploadStore:
+    """
+    Chunks are the parts of an S3 multipart upload. A part is spooled to a temporary file (on disk past 1MB)
+    while it is received : the S3 client needs a seekable body to sign and retry the request.
+    Direct uploads are sent by the clients straight to the bucket through a presigned POST, bypassing the web workers.
+    """
+
+    def get_object(self, session):
+        return files_storage.bucket.Object(files_storage._normalize_name(session.key))
+
+    def get_object_params(self, session):
+        params = {'ContentType': mimetypes.guess_type(session.filename)[0] or 'application/octet-stream'}
+        if files_storage.default_acl:
+            params['ACL'] = files_storage.default_acl
+        return params
+
+    def start(self, session):
+        # Copied to the key of its blob once complete
+        session.key = f'uploads/{session.id}'
+        if not session.direct:
+            session.multipart_upload_id = self.get_object(session).initiate_multipart_upload(**self.get_object_params(session)).id
+
+    def get_presigned_post(self, session):
+        """
+        Return the url and the form fields of the direct upload. The bucket only accepts a file of the session size.
+        """
+        params = self.get_object_params(session)
+        fields = {'Content-Type': params['ContentType']}
+        conditions = [{'Content-Type': params['ContentType']}, ['content-length-range', session.size, session.size]]
+        if 'ACL' in params:
+            fields['acl'] = params['ACL']
+            conditions.append({'acl': params['ACL']})
+        return files_storage.bucket.meta.client.generate_presigned_post(
+            files_storage.bucket.name,
+            self.get_object(session).key,
+            Fields=fields,
+            Conditions=conditions,
+            ExpiresIn=settings.UPLOAD_PRESIGNED_EXPIRY,
+        )
+
+    def get_uploaded_size(self, session):
+        """
+        Return the size of the direct upload, None if it was not received
+        """
+        try:
+            return self.get_object(session).content_length
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('404', 'NoSuchKey'):
+                return None
+            raise
+
+    def append(self, session, stream, length):
+        part_number = session.offset // settings.UPLOAD_CHUNK_SIZE + 1
+        multipart_upload = self.get_object(session).MultipartUpload(session.multipart_upload_id)
+
+        with tempfile.SpooledTemporaryFile(max_size=1024 * 1024) as body:
+            copy_stream(stream, body, length)
+            body.seek(0)
+            response = multipart_upload.Part(part_number).upload(Body=body, ContentLength=length)
+
+        # A part uploaded again replaces the previous one
+        session.parts = [part for part in session.parts if part['PartNumber'] != part_number]
+        session.parts.append({'PartNumber': part_number, 'ETag': response['ETag']})
+
+    def finish(self, session):
+        """
+        Assemble the parts of the multipart upload into the object. Idempotent : the upload may be completed again
+        after its registration failed.
+        """
+        if session.direct:
+            return
+        multipart_upload = self.get_object(session).MultipartUpload(session.multipart_upload_id)
+        try:
+            multipart_upload.complete(MultipartUpload={'Parts': sorted(session.parts, key=lambda part: part['PartNumber'])})
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'NoSuchUpload' or self.get_uploaded_size(session) != session.size:
+                raise
+
+    def complete(self, session):
+        """
+        Return the blob of the finished upload, with a new reference - see blobs.py
+        The hash of an upload cannot be kept across the requests of the chunks, nor computed for a direct upload :
+        the object is read back once, streamed, and copied to the key of its blob within S3.
+        """
+        s3_object = self.get_object(session)
+        content_hash = hash_stream(s3_object.get()['Body'].iter_chunks(HASH_BLOCK_SIZE))
+
+        def save(key):
+            destination = files_storage.bucket.Object(files_storage._normalize_name(key))
+            extra_args = {'ACL': files_storage.default_acl} if files_storage.default_acl else None
+            destination.copy({'Bucket': files_storage.bucket.name, 'Key': s3_object.key}, ExtraArgs=extra_args)
+            return key
+
+        blob = acquire_blob(content_hash, session.size, session.filename, save)
+        s3_object.delete()
+        return blob
+
+    def abort(self, session):
+        if not session.direct:
+            try:
+                self.get_object(session).MultipartUpload(session.multipart_upload_id).abort()
+            except ClientError as e:
+                # Finished, but its registration failed
+                if e.response['Error']['Code'] != 'NoSuchUpload':
+                    raise
+        self.get_object(session).delete()
+
+
+def get_upload_store():
+    if settings.DEFAULT_FILE_STORAGE.endswith('S3Boto3Storage'):
+        return S3UploadStore()
+    return LocalUploadStore()
+
+
+def complete_upload(session):
+    """
+    Store the finished upload as a blob and create its File - which generates the thumbnail of a new blob.
+    """
+    session.file = create_file(session.author, get_upload_store().complete(session))
+    session.status = UploadSession.COMPLETE
+    session.save(update_fields=['file', 'offset', 'status'])
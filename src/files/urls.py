@@ -1,7 +1,8 @@
 from rest_framework.routers import SimpleRouter
 
-from .views import FilesViewset
+from .views import FilesViewset, UploadSessionViewSet
 
 files_router = SimpleRouter()
 
 files_router.register(r'files', FilesViewset)
+files_router.register(r'uploads', UploadSessionViewSet)
@@ -1,12 +1,48 @@
-from rest_framework import viewsets, mixins
+from django.conf import settings
+from django.db import transaction
+from rest_framework import viewsets, mixins, status
+from rest_framework.decorators import action
+from rest_framework.exceptions import APIException
 from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
 
-from .serializers import FileSerializer
-from .models import File
+from src.common.helpers import file_download_response
 
+from .serializers import FileSerializer, UploadSessionSerializer
+from .models import File, UploadSession
+from .pagination import FileCursorPagination
+from .uploads import IncompleteChunkError, get_upload_store
+from .validators import MAX_FILESIZE
 
-class FilesViewset(mixins.CreateModelMixin, viewsets.GenericViewSet):
+# Multipart boundaries and headers around the file
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+class PayloadTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'Request body is too large.'
+    default_code = 'payload_too_large'
+
+
+class LengthRequired(APIException):
+    status_code = status.HTTP_411_LENGTH_REQUIRED
+    default_detail = 'The Content-Length header is required.'
+    default_code = 'length_required'
+
+
+def get_content_length(request):
+    # Without it, the size limits could not be enforced before the body is read
+    try:
+        length = int(request.META.get('CONTENT_LENGTH', ''))
+    except ValueError:
+        raise LengthRequired()
+    if length < 0:
+        raise LengthRequired()
+    return length
+
+
+class FilesViewset(mixins.ListModelMixin, mixins.RetrieveModelMixin, mixins.CreateModelMixin, viewsets.GenericViewSet):
     # MultiPartParser AND FormParser
     # https://www.django-rest-framework.org/api-guide/parsers/#multipartparser
     # "You will typically want to use both FormParser and MultiPartParser
@@ -15,6 +51,37 @@ class FilesViewset(mixins.CreateModelMixin, viewsets.GenericViewSet):
     queryset = File.objects.all()
     serializer_class = FileSerializer
     permissions = {'default': (IsAuthenticated,)}
+    pagination_class = FileCursorPagination
+    # The cursor pages follow the index, not a client ordering
+    filter_backends = ()
+
+    def initial(self, request, *args, **kwargs):
+        # Before authentication : the CSRF check of session authentication parses the body
+        if self.action == 'create' and get_content_length(request) > MAX_FILESIZE + MULTIPART_OVERHEAD:
+            raise PayloadTooLarge('The maximum file size that can be uploaded is 10MB, use the chunked uploads.')
+        super().initial(request, *args, **kwargs)
+
+    def get_queryset(self):
+        return super().get_queryset().filter(author=self.request.user)
+
+    def list(self, request, *args, **kwargs):
+        """
+        List the files of the user, newest first. Follow the next link to get the next page.
+        """
+        return super().list(request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Retrieve a file of the user - poll it until its thumbnail_status is no longer pending
+        """
+        return super().retrieve(request, *args, **kwargs)
+
+    @action(detail=True, methods=['get'], url_path='download', url_name='download')
+    def download(self, request, *args, **kwargs):
+        """
+        Download a file of the user - the bytes are sent by nginx or the storage, see file_download_response
+        """
+        return file_download_response(self.get_object().file)
 
     def create(self, request, *args, **kwargs):
         """
@@ -30,3 +97,102 @@ class FilesViewset(mixins.CreateModelMixin, viewsets.GenericViewSet):
               message: Created
         """
         return super().create(request, *args, **kwargs)
+
+
+class UploadSessionViewSet(mixins.CreateModelMixin, mixins.RetrieveModelMixin, mixins.DestroyModelMixin, viewsets.GenericViewSet):
+    """
+    Chunked, resumable uploads - see uploads.py
+    - create : {"filename": ..., "size": ...}, returns the upload id and chunk_size.
+      With "direct": true, returns the presigned_post - url and form fields - to send the file straight to the bucket.
+    - chunk : PUT the bytes of a chunk, starting at the Upload-Offset header, as application/octet-stream.
+      Every chunk but the last one is chunk_size bytes long.
+    - retrieve : the offset to resume the upload from
+    - complete : the File is registered in the background, poll the upload until its file is set
+    - destroy : aborts the upload
+    """
+
+    queryset = UploadSession.objects.all()
+    serializer_class = UploadSessionSerializer
+    permissions = {'default': (IsAuthenticated,)}
+
+    def get_queryset(self):
+        return super().get_queryset().filter(author=self.request.user)
+
+    def perform_create(self, serializer):
+        session = UploadSession(author=self.request.user, **serializer.validated_data)
+        store = get_upload_store()
+        store.start(session)
+        session.save()
+        if session.direct:
+            session.presigned_post = store.get_presigned_post(session)
+        serializer.instance = session
+
+    def perform_destroy(self, instance):
+        if instance.status == UploadSession.OPEN:
+            get_upload_store().abort(instance)
+        instance.delete()
+
+    @action(detail=True, methods=['put'], url_path='chunk', url_name='chunk')
+    def chunk(self, request, *args, **kwargs):
+        """
+        Append a chunk. The body is streamed to the storage : it is never parsed nor held in memory.
+        Answers 409 with the upload when Upload-Offset is not its offset - resume from there.
+        """
+        session = self.get_object()
+        length = get_content_length(request)
+        if length > settings.UPLOAD_CHUNK_SIZE:
+            raise PayloadTooLarge(f'A chunk is at most {settings.UPLOAD_CHUNK_SIZE} bytes long.')
+        if session.status != UploadSession.OPEN:
+            return Response({'error': 'The upload is complete.'}, status=status.HTTP_409_CONFLICT)
+        if session.direct:
+            return Response({'error': 'Direct uploads are sent to their presigned URL.'}, status=status.HTTP_400_BAD_REQUEST)
+        if request.META.get('HTTP_UPLOAD_OFFSET') != str(session.offset):
+            return Response(self.get_serializer(session).data, status=status.HTTP_409_CONFLICT)
+        if session.offset + length > session.size:
+            raise PayloadTooLarge(f'The upload is {session.size} bytes long.')
+        if not length or (length != settings.UPLOAD_CHUNK_SIZE and session.offset + length != session.size):
+            return Response(
+                {'error': f'Chunks must be {settings.UPLOAD_CHUNK_SIZE} bytes long, except the last one.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        store = get_upload_store()
+        try:
+            store.append(session, request.stream, length)
+        except IncompleteChunkError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Another request may have appended the same chunk meanwhile : the offset only moves forward once
+        updated = UploadSession.objects.filter(pk=session.pk, offset=session.offset).update(
+            offset=session.offset + length, parts=session.parts
+        )
+        session.refresh_from_db()
+        if not updated:
+            return Response(self.get_serializer(session).data, status=status.HTTP_409_CONFLICT)
+        return Response(self.get_serializer(session).data)
+
+    @action(detail=True, methods=['post'], url_path='complete', url_name='complete')
+    def complete(self, request, *args, **kwargs):
+        with transaction.atomic():
+            session = self.get_queryset().select_for_update().get(pk=self.get_object().pk)
+            if session.status != UploadSession.OPEN:
+                return Response({'error': 'The upload is complete.'}, status=status.HTTP_409_CONFLICT)
+            store = get_upload_store()
+            if session.direct:
+                # Only checked : the content is read by RegisterUploadTask
+                session.offset = store.get_uploaded_size(session) or 0
+            if session.offset != session.size:
+                return Response(
+                    {'error': f'The upload is not complete : {session.offset} bytes out of {session.size} received.'},
+                    status=status.HTTP_409_CONFLICT,
+                )
+
+            store.finish(session)
+            session.status = UploadSession.COMPLETING
+            session.save(update_fields=['offset', 'status'])
+
+            from .tasks import register_upload_task
+
+            transaction.on_commit(lambda: register_upload_task.delay(session.pk))
+        # Poll the upload until its file is registered
+        return Response(self.get_serializer(session).data, status=status.HTTP_202_ACCEPTED)
@@ -1,17 +1,20 @@
 from django.core.mail import EmailMultiAlternatives
-from django.template.loader import render_to_string
 from django.conf import settings
 
+from src.common.mail import queue_email, render_email
+
 
 class EmailChannel:
     @staticmethod
     def send(context, html_template, subject, to):
+        """
+        Queue the email : only the template name and the context are queued, the worker renders the template.
+        """
         if isinstance(to, str):
             to = [to]
 
-        email_html_message = render_to_string(html_template, context)
-
         if settings.TESTING:
+            email_html_message = render_email(html_template, context)
             msg = EmailMultiAlternatives(
                 subject,
                 email_html_message,
@@ -21,7 +24,5 @@ class EmailChannel:
             )
             return msg.send()
 
-        from src.common.tasks import send_email_task
-
-        send_email_task.delay(subject, to, settings.EMAIL_FROM, email_html_message)
+        queue_email(subject, to, settings.EMAIL_FROM, html_template, context)
         return
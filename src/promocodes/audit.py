@@ -0,0 +1,296 @@
+import atexit
+import csv
+import io
+import logging
+import os
+import threading
+import time
+import uuid
+
+from collections import deque
+from datetime import datetime, timedelta
+
+import orjson
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from redis.exceptions import RedisError
+
+from src.common.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Audit log of the promo code validations.
+#
+# The web workers buffer the events in memory (bounded, see AUDIT_BUFFER_SIZE) and a background thread pushes them
+# to a Redis stream in pipelined batches, so validation requests never wait for a write.
+# WriteValidationEventsTask then reads the stream in large batches and COPYs them to the partitioned
+# promocodes_promocodevalidationevent table.
+# Events are dropped - and counted in the METRICS_KEY hash - when the buffer or the stream is full.
+# Batches which keep failing to be written are moved event by event to the DEAD_LETTER_KEY stream.
+
+STREAM_KEY = 'promocodes:validations'
+METRICS_KEY = 'promocodes:validations:metrics'
+CONSUMER_GROUP = 'audit-writers'
+CONSUMER_NAME = 'writer'
+WRITER_LOCK_KEY = 'promocodes:validations:writer-lock'
+DEAD_LETTER_KEY = 'promocodes:validations:dead-letter'
+# Failed attempts by batch, keyed by the id of the first event of the batch
+FAILURES_KEY = 'promocodes:validations:failures'
+
+# Attempts at writing a batch before its events are written one by one, the failing ones being dead-lettered
+MAX_BATCH_ATTEMPTS = 3
+
+# max_length of PromoCodeValidationEvent.promocode_name
+PROMOCODE_NAME_MAX_LENGTH = 255
+
+# Seconds between two flushes of the in-process buffer
+FLUSH_INTERVAL = 0.2
+
+COLUMNS = ('created_at', 'promocode_name', 'arguments', 'status', 'reasons', 'latency_ms')
+
+_buffer = deque()
+_dropped = 0
+_flusher_pid = None
+_flusher_lock = threading.Lock()
+
+# Deletes the writer lock only if it is still held by the given token, i.e. it has not expired and been taken since
+RELEASE_LOCK_SCRIPT = '''
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+'''
+
+
+def strip_nul(value):
+    """
+    Remove the NUL characters of the strings of value, which Postgres text and jsonb reject
+    """
+    if isinstance(value, str):
+        return value.replace('\x00', '')
+    if isinstance(value, dict):
+        return {strip_nul(key): strip_nul(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [strip_nul(item) for item in value]
+    return value
+
+
+def record_validation_event(promocode_name, arguments, status, reasons, latency_ms):
+    """
+    Buffer a validation event - never blocks, drops the event if the buffer is full.
+    """
+    global _dropped
+
+    if not settings.AUDIT_ENABLED:
+        return
+
+    _start_flusher()
+    if len(_buffer) >= settings.AUDIT_BUFFER_SIZE:
+        _dropped += 1
+        return
+
+    _buffer.append(
+        {
+            'created_at': timezone.now().isoformat(),
+            'promocode_name': strip_nul(str(promocode_name))[:PROMOCODE_NAME_MAX_LENGTH],
+            'arguments': orjson.dumps(strip_nul(arguments), default=str).decode(),
+            'status': status,
+            'reasons': orjson.dumps(reasons).decode(),
+            'latency_ms': f'{latency_ms:.3f}',
+        }
+    )
+
+
+def flush_buffer():
+    """
+    Push the buffered events to the stream. Apply backpressure by dropping them when the stream is full,
+    i.e. when the writer task does not keep up.
+    """
+    global _dropped
+
+    events = []
+    while _buffer and len(events) < settings.AUDIT_BATCH_SIZE:
+        events.append(_buffer.popleft())
+    dropped, _dropped = _dropped, 0
+    if not events and not dropped:
+        return
+
+    try:
+        redis = get_redis()
+        pipeline = redis.pipeline(transaction=False)
+        if events:
+            if redis.xlen(STREAM_KEY) + len(events) > settings.AUDIT_STREAM_MAXLEN:
+                pipeline.hincrby(METRICS_KEY, 'dropped_stream_full', len(events))
+            else:
+                for event in events:
+                    pipeline.xadd(STREAM_KEY, event)
+                pipeline.hincrby(METRICS_KEY, 'buffered', len(events))
+        if dropped:
+            pipeline.hincrby(METRICS_KEY, 'dropped_buffer_full', dropped)
+        pipeline.execute()
+    except RedisError:
+        logger.warning(f'Dropped {len(events) + dropped} validation events, Redis is unreachable.', exc_info=True)
+
+
+def _flush_forever():
+    while True:
+        time.sleep(FLUSH_INTERVAL)
+        while _buffer or _dropped:
+            flush_buffer()
+            if len(_buffer) < settings.AUDIT_BATCH_SIZE:
+                break
+
+
+def _start_flusher():
+    global _flusher_pid
+
+    # The thread does not survive a fork
+    if _flusher_pid != os.getpid():
+        with _flusher_lock:
+            if _flusher_pid != os.getpid():
+                threading.Thread(target=_flush_forever, name='promocodes-audit-flusher', daemon=True).start()
+                atexit.register(flush_buffer)
+                _flusher_pid = os.getpid()
+
+
+def ensure_partition(day):
+    """
+    Create the monthly partition holding the given day, if needed (Postgres only)
+    """
+    start = day.replace(day=1)
+    end = (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'CREATE TABLE IF NOT EXISTS promocodes_promocodevalidationevent_{start:%Y%m} '
+            f'PARTITION OF promocodes_promocodevalidationevent '
+            f"FOR VALUES FROM ('{start:%Y-%m-%d}') TO ('{end:%Y-%m-%d}')"
+        )
+
+
+def copy_events(events):
+    """
+    Insert the events with a single COPY (bulk_create on the other databases)
+    """
+    from .models import PromoCodeValidationEvent
+
+    if connection.vendor != 'postgresql':
+        PromoCodeValidationEvent.objects.bulk_create(
+            [
+                PromoCodeValidationEvent(
+                    created_at=event['created_at'],
+                    promocode_name=event['promocode_name'],
+                    arguments=orjson.loads(event['arguments']),
+                    status=event['status'],
+                    reasons=orjson.loads(event['reasons']),
+                    latency_ms=float(event['latency_ms']),
+                )
+                for event in events
+            ]
+        )
+        return
+
+    for day in {event['created_at'][:10] for event in events}:
+        ensure_partition(datetime.strptime(day, '%Y-%m-%d').date())
+
+    data = io.StringIO()
+    # Quoted empty strings are not NULLs for COPY
+    writer = csv.writer(data, quoting=csv.QUOTE_ALL)
+    for event in events:
+        writer.writerow([event[column] for column in COLUMNS])
+    data.seek(0)
+
+    with connection.cursor() as cursor:
+        cursor.copy_expert(f'COPY promocodes_promocodevalidationevent ({", ".join(COLUMNS)}) FROM STDIN WITH (FORMAT csv)', data)
+
+
+def write_batch(redis, entries):
+    """
+    Write the events of a batch of stream entries. A batch which already failed MAX_BATCH_ATTEMPTS times is written
+    event by event, and the failing events are moved to the DEAD_LETTER_KEY stream.
+    Return the number of dead-lettered events. Raise the error of the batch if it failed, to be retried.
+    """
+    events = [{key.decode(): value.decode() for key, value in fields.items()} for _, fields in entries if fields]
+    first_id = entries[0][0]
+
+    if int(redis.hget(FAILURES_KEY, first_id) or 0) < MAX_BATCH_ATTEMPTS:
+        try:
+            if events:
+                copy_events(events)
+        except Exception:
+            redis.hincrby(FAILURES_KEY, first_id, 1)
+            raise
+        redis.hdel(FAILURES_KEY, first_id)
+        return 0
+
+    dead_letters = []
+    for event in events:
+        try:
+            with transaction.atomic():
+                copy_events([event])
+        except Exception:
+            logger.exception('Moved a validation event to the dead letter stream.')
+            dead_letters.append(event)
+
+    pipeline = redis.pipeline()
+    for event in dead_letters:
+        pipeline.xadd(DEAD_LETTER_KEY, event, maxlen=settings.AUDIT_STREAM_MAXLEN, approximate=True)
+    pipeline.hincrby(METRICS_KEY, 'dead_lettered', len(dead_letters))
+    pipeline.hdel(FAILURES_KEY, first_id)
+    pipeline.execute()
+    return len(dead_letters)
+
+
+def write_events(max_batches=None):
+    """
+    Move the events from the stream to the database, one batch at a time. Return the number of events written.
+    A lock ensures a single writer : its pending (read but not acknowledged) events are retried first.
+    """
+    redis = get_redis()
+    lock_token = uuid.uuid4().hex
+    if not redis.set(WRITER_LOCK_KEY, lock_token, nx=True, ex=300):
+        return 0
+
+    try:
+        try:
+            redis.xgroup_create(STREAM_KEY, CONSUMER_GROUP, id='0', mkstream=True)
+        except RedisError:
+            # The group already exists
+            pass
+
+        written, batches = 0, 0
+        # '0' reads the pending events of a previous writer that failed, '>' the new ones
+        for stream_id in ('0', '>'):
+            while max_batches is None or batches < max_batches:
+                response = redis.xreadgroup(
+                    CONSUMER_GROUP, CONSUMER_NAME, {STREAM_KEY: stream_id}, count=settings.AUDIT_BATCH_SIZE
+                )
+                entries = response[0][1] if response else []
+                if not entries:
+                    break
+
+                dead_lettered = write_batch(redis, entries)
+
+                ids = [entry_id for entry_id, _ in entries]
+                pipeline = redis.pipeline()
+                pipeline.xack(STREAM_KEY, CONSUMER_GROUP, *ids)
+                pipeline.xdel(STREAM_KEY, *ids)
+                pipeline.hincrby(METRICS_KEY, 'written', len(ids) - dead_lettered)
+                pipeline.execute()
+                written += len(ids) - dead_lettered
+                batches += 1
+        return written
+    finally:
+        redis.eval(RELEASE_LOCK_SCRIPT, 1, WRITER_LOCK_KEY, lock_token)
+
+
+def get_metrics():
+    """
+    Counters of the audit log pipeline : buffered, written, dropped_buffer_full, dropped_stream_full, dead_lettered,
+    plus the backlog
+    """
+    redis = get_redis()
+    metrics = {key.decode(): int(value) for key, value in redis.hgetall(METRICS_KEY).items()}
+    metrics['backlog'] = redis.xlen(STREAM_KEY)
+    return metrics
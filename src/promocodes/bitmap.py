@@ -0,0 +1,58 @@
+import zlib
+
+from typing import Iterable
+
+
+class Bitmap:
+    """
+    Set of non-negative integers stored as one bit each : bit i is set when i belongs to the set.
+    Membership is O(1) and the set operations run over whole machine words (through Python ints),
+    so segments over millions of dense user indexes stay fast and compact - see segments.py.
+    """
+
+    def __init__(self, data: bytes = b''):
+        self.data = bytearray(data)
+
+    @classmethod
+    def from_indexes(cls, indexes: Iterable[int]) -> 'Bitmap':
+        bitmap = cls()
+        for index in indexes:
+            bitmap.add(index)
+        return bitmap
+
+    @classmethod
+    def from_int(cls, value: int) -> 'Bitmap':
+        return cls(value.to_bytes((value.bit_length() + 7) // 8, 'little'))
+
+    def to_int(self) -> int:
+        return int.from_bytes(self.data, 'little')
+
+    @classmethod
+    def decompress(cls, data: bytes) -> 'Bitmap':
+        return cls(zlib.decompress(data))
+
+    def compress(self) -> bytes:
+        # Runs of empty bytes, i.e. users outside of the segment, compress very well
+        return zlib.compress(bytes(self.data))
+
+    def add(self, index: int):
+        byte = index >> 3
+        if byte >= len(self.data):
+            self.data.extend(bytes(byte + 1 - len(self.data)))
+        self.data[byte] |= 1 << (index & 7)
+
+    def __contains__(self, index: int) -> bool:
+        byte = index >> 3
+        return byte < len(self.data) and bool(self.data[byte] >> (index & 7) & 1)
+
+    def __len__(self):
+        return self.to_int().bit_count() if hasattr(int, 'bit_count') else bin(self.to_int()).count('1')
+
+    def __or__(self, other: 'Bitmap') -> 'Bitmap':
+        return Bitmap.from_int(self.to_int() | other.to_int())
+
+    def __and__(self, other: 'Bitmap') -> 'Bitmap':
+        return Bitmap.from_int(self.to_int() & other.to_int())
+
+    def __sub__(self, other: 'Bitmap') -> 'Bitmap':
+        return Bitmap.from_int(self.to_int() & ~other.to_int())
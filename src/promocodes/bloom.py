@@ -0,0 +1,49 @@
+import math
+import struct
+
+from array import array
+from hashlib import blake2b
+from typing import Iterable
+
+DIGEST = struct.Struct('<QQ')
+
+# Number of bits set per name, all of them in the same 64 bits block
+HASH_COUNT = 7
+
+
+class BloomFilter:
+    """
+    Set membership test without false negatives : `name in bloom_filter` is False only if the name was never added.
+
+    This is a blocked Bloom filter : the bits of a name all fall in a single 64 bits block, so adding or testing a name
+    costs one hash and one memory access - a rebuild over millions of names takes a few seconds.
+    The blocks are sized for twice the bits of a classic Bloom filter, to make up for the higher false positive rate.
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        capacity = max(capacity, 1)
+        bit_count = -2 * capacity * math.log(error_rate) / math.log(2) ** 2
+        self.block_count = max(int(bit_count // 64), 1)
+        self.blocks = array('Q', bytes(8 * self.block_count))
+
+    @classmethod
+    def from_names(cls, names: Iterable[str], capacity: int, error_rate: float = 0.01) -> 'BloomFilter':
+        bloom_filter = cls(capacity, error_rate)
+        for name in names:
+            bloom_filter.add(name)
+        return bloom_filter
+
+    def _block_and_mask(self, name: str):
+        h1, h2 = DIGEST.unpack(blake2b(name.encode(), digest_size=16).digest())
+        mask = 0
+        for i in range(HASH_COUNT):
+            mask |= 1 << ((h2 >> (6 * i)) & 63)
+        return h1 % self.block_count, mask
+
+    def add(self, name: str):
+        block, mask = self._block_and_mask(name)
+        self.blocks[block] |= mask
+
+    def __contains__(self, name: str) -> bool:
+        block, mask = self._block_and_mask(name)
+        return self.blocks[block] & mask == mask
@@ -0,0 +1,213 @@
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import connection
+
+from .bloom import BloomFilter
+from .invalidation import start_listener
+from .models import PromoCode, get_version_cache_key
+from .snapshot import SnapshotReader, write_snapshot
+
+_snapshot_reader = SnapshotReader(settings.PROMOCODE_SNAPSHOT_PATH) if settings.PROMOCODE_SNAPSHOT_PATH else None
+
+# Per-worker cache of the promo codes : name -> (promo code, expiry time).
+# Entries are evicted as soon as the database notifies a change (see invalidation.py), hence the long TTL.
+_cache = {}
+# Names of the recently changed promo codes : name -> time of the notification.
+# They are read from the database until a snapshot generated after the change is published.
+_changed_names = {}
+# Seconds after which changed names are forgotten when there is no snapshot
+CHANGED_NAMES_RETENTION = 60
+_changed_names_pruned_at = 0
+_lock = threading.Lock()
+
+# Per-worker Bloom filter over all the promo code names, rebuilt in the background every
+# PROMOCODE_BLOOM_FILTER_REBUILD_INTERVAL seconds. Names are added as soon as they are saved by the current process
+# (post_save), and when their notification is received for the other processes. Names it does not contain are checked
+# against the unique index of the name - an index only lookup, no row is read : the ones created by another process
+# may not be notified yet. Found names are added.
+_bloom_filter = None
+# Time at which the last rebuild started, 0 forces a rebuild
+_bloom_filter_built_at = 0
+# Names notified while the Bloom filter is being rebuilt, None when no rebuild is in progress
+_bloom_filter_pending_names = None
+BLOOM_FILTER_ERROR_RATE = 0.01
+
+
+def publish_snapshot():
+    """
+    Publish the snapshot of the whole promo codes catalogue - see snapshot.py
+    """
+    generated_at = time.time()
+    promocodes = PromoCode.objects.only(
+        'uuid', 'name', 'advantage', 'restrictions', 'is_time_only', 'is_active_now', 'active_until'
+    )
+    write_snapshot(settings.PROMOCODE_SNAPSHOT_PATH, promocodes.iterator(), generated_at=generated_at)
+
+
+def _add_to_bloom_filter(name):
+    # Called with _lock held
+    if _bloom_filter is not None:
+        _bloom_filter.add(name)
+    if _bloom_filter_pending_names is not None:
+        _bloom_filter_pending_names.append(name)
+
+
+def on_promocode_saved(name):
+    """
+    Called on post_save : the current process knows the name without waiting for its notification.
+    """
+    with _lock:
+        _add_to_bloom_filter(name)
+
+
+def on_promocode_change(promocode_uuid, names):
+    """
+    Called by the changes listener thread whenever a promo code is inserted, updated or deleted.
+    """
+    notified_at = time.time()
+    with _lock:
+        for name in names:
+            _cache.pop(name, None)
+            _changed_names[name] = notified_at
+            _add_to_bloom_filter(name)
+
+
+def on_listen():
+    """
+    Called by the changes listener thread when it (re)starts listening : changes may have been missed.
+    """
+    global _bloom_filter, _bloom_filter_built_at
+
+    with _lock:
+        _cache.clear()
+        _bloom_filter = None
+        _bloom_filter_built_at = 0
+
+
+def _rebuild_bloom_filter():
+    global _bloom_filter, _bloom_filter_pending_names
+
+    try:
+        with _lock:
+            _bloom_filter_pending_names = []
+        names = PromoCode.objects.values_list('name', flat=True)
+        # Leave room for the promo codes created until the next rebuild
+        bloom_filter = BloomFilter.from_names(names.iterator(), 2 * names.count(), BLOOM_FILTER_ERROR_RATE)
+        with _lock:
+            for name in _bloom_filter_pending_names:
+                bloom_filter.add(name)
+            _bloom_filter = bloom_filter
+    finally:
+        _bloom_filter_pending_names = None
+        connection.close()
+
+
+def _may_exist(name):
+    """
+    Return False if the promo code name does not exist. Only the names missing from the Bloom filter cost a query.
+    """
+    global _bloom_filter_built_at
+
+    if time.monotonic() - _bloom_filter_built_at > settings.PROMOCODE_BLOOM_FILTER_REBUILD_INTERVAL:
+        with _lock:
+            if _bloom_filter_pending_names is None:
+                _bloom_filter_built_at = time.monotonic()
+                threading.Thread(target=_rebuild_bloom_filter, name='promocodes-bloom-filter', daemon=True).start()
+
+    bloom_filter = _bloom_filter
+    if bloom_filter is None or name in bloom_filter:
+        return True
+
+    # Created by another process, not notified yet
+    if not PromoCode.objects.filter(name=name).exists():
+        return False
+    with _lock:
+        _add_to_bloom_filter(name)
+    return True
+
+
+def _prune_changed_names(snapshot):
+    global _changed_names_pruned_at
+
+    # Pruning walks every changed name, at most once per second
+    if not _changed_names or time.monotonic() - _changed_names_pruned_at < 1:
+        return
+    _changed_names_pruned_at = time.monotonic()
+
+    forget_before = snapshot.generated_at if snapshot is not None else time.time() - CHANGED_NAMES_RETENTION
+    with _lock:
+        for name, notified_at in list(_changed_names.items()):
+            if notified_at <= forget_before:
+                del _changed_names[name]
+
+
+def _get_uncached_promocode(name):
+    snapshot = _snapshot_reader.get_snapshot() if _snapshot_reader else None
+    _prune_changed_names(snapshot)
+
+    if snapshot is None or name in _changed_names:
+        return PromoCode.objects.get(name=name)
+
+    data = snapshot.get(name)
+    if data is None:
+        # Created after the snapshot was generated, until the next one is published
+        return PromoCode.objects.get(name=name, updated_at__gt=datetime.fromtimestamp(snapshot.generated_at, timezone.utc))
+    active_until = datetime.fromtimestamp(data['active_until'], timezone.utc) if data['active_until'] else None
+    return PromoCode(**{**data, 'uuid': uuid.UUID(data['uuid']), 'active_until': active_until})
+
+
+def get_promocode(name):
+    """
+    Return the promo code with the given name, from the catalogue snapshot when it is published, else from the database.
+    Raise PromoCode.DoesNotExist if there is none.
+    """
+    # The cache and the Bloom filter are only safe while the changes listener runs
+    listening = settings.PROMOCODE_CHANGES_LISTENER_ENABLED and start_listener(on_promocode_change, on_listen)
+
+    if listening and settings.PROMOCODE_BLOOM_FILTER_REBUILD_INTERVAL > 0 and not _may_exist(name):
+        raise PromoCode.DoesNotExist(f'PromoCode matching name {name} does not exist.')
+
+    use_cache = listening and settings.PROMOCODE_CACHE_TTL > 0
+
+    if use_cache:
+        entry = _cache.get(name)
+        if entry is not None and entry[1] > time.monotonic():
+            return entry[0]
+
+    # Time at which the lookup starts : a change notified in between must not be overwritten by a stale value
+    looked_up_at = time.time()
+    promocode = _get_uncached_promocode(name)
+
+    if use_cache:
+        with _lock:
+            if _changed_names.get(name, 0) < looked_up_at:
+                _cache[name] = (promocode, time.monotonic() + settings.PROMOCODE_CACHE_TTL)
+    return promocode
+
+
+def get_promocode_version(pk):
+    """
+    Return (version, updated_at timestamp) of the promo code with the given primary key, or None if there is none.
+    The version comes from the cache, so checking whether a promo code changed costs no database query.
+    """
+    key = get_version_cache_key(pk)
+    version = cache.get(key)
+    if version is not None:
+        return version
+
+    try:
+        row = PromoCode.objects.filter(pk=pk).values_list('version', 'updated_at').first()
+    except ValidationError:
+        return None
+    if row is None:
+        return None
+
+    version = (row[0], row[1].timestamp())
+    cache.set(key, version, settings.PROMOCODE_VERSION_CACHE_TTL)
+    return version
@@ -0,0 +1,146 @@
+import logging
+import time
+
+from datetime import datetime, timezone
+
+import orjson
+
+from django.conf import settings
+from django.db.models import Sum
+from redis.exceptions import RedisError
+
+from src.common.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Live acceptance / denial counters of the promo codes.
+#
+# Validations increment, in a single pipeline, the hash of the promo code for the current time bucket :
+# one field per status and one per denial reason.
+# RollUpPromoCodeCountersTask moves the closed buckets to PromoCodeCounter rows, so the dashboards sum a few
+# summary rows per bucket instead of counting events - the buckets not rolled up yet are read from Redis.
+
+COUNTERS_KEY = 'promocodes:counters:{}:{}'
+# Names of the promo codes counted in a bucket
+NAMES_KEY = 'promocodes:counters:{}:names'
+# Buckets not rolled up yet
+BUCKETS_KEY = 'promocodes:counters:buckets'
+BUCKET_SECONDS = 60
+# Keys expire if the roll-up task does not run, to bound the Redis memory
+BUCKET_TTL = 7 * 24 * 3600
+# See PromoCodeCounter.reason
+REASON_MAX_LENGTH = 255
+
+
+def get_bucket(timestamp):
+    return int(timestamp) // BUCKET_SECONDS * BUCKET_SECONDS
+
+
+def increment_counters(promocode_name, status, reasons):
+    """
+    Count a validation of the promo code. Fail open : the counts are lost when Redis is unreachable.
+    """
+    if not settings.PROMOCODE_COUNTERS_ENABLED:
+        return
+
+    bucket = get_bucket(time.time())
+    key, names_key = COUNTERS_KEY.format(bucket, promocode_name), NAMES_KEY.format(bucket)
+    try:
+        pipeline = get_redis().pipeline(transaction=False)
+        pipeline.hincrby(key, orjson.dumps([status, '']), 1)
+        for reason in reasons:
+            pipeline.hincrby(key, orjson.dumps([status, reason[:REASON_MAX_LENGTH]]), 1)
+        pipeline.expire(key, BUCKET_TTL)
+        pipeline.sadd(names_key, promocode_name)
+        pipeline.expire(names_key, BUCKET_TTL)
+        pipeline.sadd(BUCKETS_KEY, bucket)
+        pipeline.execute()
+    except RedisError:
+        logger.warning('Promo code counters skipped, Redis is unreachable.', exc_info=True)
+
+
+def decode_counters(counters):
+    for field, count in counters.items():
+        status, reason = orjson.loads(field)
+        yield status, reason, int(count)
+
+
+def roll_up_counters():
+    """
+    Write the counters of the closed buckets to PromoCodeCounter, then drop them from Redis.
+    The bucket preceding the current one is left open for the late increments (clock skew between the web servers).
+    Return the number of buckets rolled up.
+    """
+    from .models import PromoCodeCounter
+
+    redis = get_redis()
+    open_bucket = get_bucket(time.time()) - BUCKET_SECONDS
+    buckets = sorted(bucket for bucket in map(int, redis.smembers(BUCKETS_KEY)) if bucket < open_bucket)
+
+    for bucket in buckets:
+        names = [name.decode() for name in redis.smembers(NAMES_KEY.format(bucket))]
+        keys = [COUNTERS_KEY.format(bucket, name) for name in names]
+
+        pipeline = redis.pipeline(transaction=False)
+        for key in keys:
+            pipeline.hgetall(key)
+        bucket_start = datetime.fromtimestamp(bucket, tz=timezone.utc)
+        counters = [
+            PromoCodeCounter(bucket=bucket_start, promocode_name=name, status=status, reason=reason, count=count)
+            for name, name_counters in zip(names, pipeline.execute())
+            for status, reason, count in decode_counters(name_counters)
+        ]
+        # A failed roll-up is retried from scratch : the rows written by the first attempt are skipped
+        PromoCodeCounter.objects.bulk_create(counters, batch_size=1000, ignore_conflicts=True)
+
+        pipeline = redis.pipeline()
+        pipeline.delete(NAMES_KEY.format(bucket), *keys)
+        pipeline.srem(BUCKETS_KEY, bucket)
+        pipeline.execute()
+    return len(buckets)
+
+
+def get_counters(promocode_name, since):
+    """
+    Return the validation counts of the promo code since the given datetime, by status and by denial reason :
+    {'accepted': 10, 'denied': 4, 'reasons': {'Age condition not met.': 3, ...}}
+    """
+    from .models import PromoCodeCounter
+
+    statuses, reasons = {}, {}
+
+    def add(status, reason, count):
+        if reason:
+            reasons[reason] = reasons.get(reason, 0) + count
+        else:
+            statuses[status] = statuses.get(status, 0) + count
+
+    since_bucket = get_bucket(since.timestamp())
+    # Redis is read first : the buckets rolled up meanwhile are excluded from the database query
+    live_buckets = []
+    if settings.PROMOCODE_COUNTERS_ENABLED:
+        try:
+            redis = get_redis()
+            buckets = [bucket for bucket in map(int, redis.smembers(BUCKETS_KEY)) if bucket >= since_bucket]
+            pipeline = redis.pipeline(transaction=False)
+            for bucket in buckets:
+                pipeline.hgetall(COUNTERS_KEY.format(bucket, promocode_name))
+            for bucket, counters in zip(buckets, pipeline.execute()):
+                live_buckets.append(datetime.fromtimestamp(bucket, tz=timezone.utc))
+                for status, reason, count in decode_counters(counters):
+                    add(status, reason, count)
+        except RedisError:
+            logger.warning('Live promo code counters skipped, Redis is unreachable.', exc_info=True)
+
+    rows = (
+        PromoCodeCounter.objects.filter(
+            promocode_name=promocode_name, bucket__gte=datetime.fromtimestamp(since_bucket, tz=timezone.utc)
+        )
+        .exclude(bucket__in=live_buckets)
+        .values('status', 'reason')
+        .annotate(total=Sum('count'))
+    )
+    for row in rows:
+        add(row['status'], row['reason'], row['total'])
+
+    return {**statuses, 'reasons': dict(sorted(reasons.items(), key=lambda item: -item[1]))}
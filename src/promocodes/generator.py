@@ -0,0 +1,71 @@
+import base64
+import secrets
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import PromoCode
+from .utils import get_static_verdict, get_static_verdict_expiry, is_time_only, validate_advantage, validate_restrictions
+
+BATCH_SIZE = 5000
+
+
+def random_name(prefix: str, length: int) -> str:
+    """
+    prefix followed by a random base32 body of the given length
+    """
+    body = base64.b32encode(secrets.token_bytes(length)).decode()[:length]
+    return f'{prefix}{body}'
+
+
+def generate_promocodes(count: int, advantage, restrictions, prefix: str = '', length: int = 8, batch_size: int = BATCH_SIZE):
+    """
+    Create count single-use promo codes named prefix + random base32 body, sharing the given advantage and restrictions.
+    The codes are bulk inserted in batches, skipping the names which already exist.
+    Return the list of the generated names. Raise ValueError if the advantage or restrictions are invalid.
+    """
+    # Codes are inserted with bulk_create, bypassing PromoCode.save : validate the shared definition once
+    validation_err = validate_advantage(advantage) or validate_restrictions(restrictions)
+    if validation_err:
+        raise ValueError(validation_err)
+    if len(prefix) + length > PromoCode._meta.get_field('name').max_length:
+        raise ValueError('Promo code names are too long.')
+    # Keep collisions rare, so that batches do not need to be sampled again and again
+    if count > 32**length // 100:
+        raise ValueError(f'Cannot generate {count} distinct promo codes with a body of {length} characters.')
+
+    static_fields = {
+        'advantage': advantage,
+        'restrictions': restrictions,
+        'is_time_only': is_time_only(restrictions),
+        'is_active_now': get_static_verdict(restrictions),
+        'active_until': get_static_verdict_expiry(restrictions),
+    }
+
+    generated = []
+    generated_names = set()
+    while len(generated) < count:
+        batch = set()
+        while len(batch) < min(batch_size, count - len(generated)):
+            name = random_name(prefix, length)
+            if name not in generated_names:
+                batch.add(name)
+
+        # Names which already exist, e.g. inserted by a concurrent run, are skipped by the database : the inserted ones are
+        # read back by primary key
+        promocodes = [PromoCode(name=name, **static_fields) for name in batch]
+        with transaction.atomic():
+            PromoCode.objects.bulk_create(promocodes, batch_size=batch_size, ignore_conflicts=True)
+            inserted = set(
+                PromoCode.objects.filter(pk__in=[promocode.pk for promocode in promocodes]).values_list('name', flat=True)
+            )
+        generated.extend(inserted)
+        generated_names.update(batch)
+
+    # bulk_create does not send post_save
+    if settings.PROMOCODE_SNAPSHOT_PATH:
+        from .tasks import publish_promocodes_snapshot_task
+
+        transaction.on_commit(publish_promocodes_snapshot_task.delay)
+
+    return generated
@@ -0,0 +1,89 @@
+import json
+import logging
+import os
+import select
+import threading
+import time
+
+import psycopg2
+
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+# Channel on which the promocodes_promocode trigger notifies every change - see migration 0003
+CHANNEL = 'promocodes_changed'
+
+# Seconds to wait before reconnecting after the listener connection is lost
+RECONNECT_DELAY = 5
+
+
+class PromoCodeChangesListener(threading.Thread):
+    """
+    Daemon thread which LISTENs on CHANNEL through its own connection, and calls on_change(uuid, names)
+    for every promo code inserted, updated or deleted.
+    Changes are missed while the connection is down : on_listen() is called every time the LISTEN starts again,
+    so that the caches built on top of the notifications can be reset.
+    """
+
+    def __init__(self, on_change, on_listen):
+        super().__init__(name='promocodes-changes-listener', daemon=True)
+        self.on_change = on_change
+        self.on_listen = on_listen
+        self.listening = threading.Event()
+
+    def run(self):
+        while True:
+            try:
+                self.listen()
+            except psycopg2.Error:
+                logger.exception('Lost the promo codes changes listener connection.')
+            except Exception:
+                # A notification could not be handled : start over, the caches are reset on the next LISTEN
+                logger.exception('Failed to handle a promo code change notification.')
+            self.listening.clear()
+            time.sleep(RECONNECT_DELAY)
+
+    def listen(self):
+        params = connection.get_connection_params()
+        conn = psycopg2.connect(**params)
+        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(f'LISTEN {CHANNEL};')
+            self.on_listen()
+            self.listening.set()
+            while True:
+                select.select([conn], [], [], 60)
+                conn.poll()
+                while conn.notifies:
+                    notify = conn.notifies.pop(0)
+                    payload = json.loads(notify.payload)
+                    self.on_change(payload['uuid'], payload['names'])
+        finally:
+            conn.close()
+
+
+_listener = None
+_listener_pid = None
+_listener_lock = threading.Lock()
+
+
+def start_listener(on_change, on_listen) -> bool:
+    """
+    Start the changes listener of the current process if needed (the thread does not survive a fork).
+    Return True if changes are currently notified, False if the listener is not connected yet
+    or if the database does not support LISTEN / NOTIFY.
+    """
+    global _listener, _listener_pid
+
+    if connection.vendor != 'postgresql':
+        return False
+
+    if _listener_pid != os.getpid():
+        with _listener_lock:
+            if _listener_pid != os.getpid():
+                _listener = PromoCodeChangesListener(on_change, on_listen)
+                _listener.start()
+                _listener_pid = os.getpid()
+    return _listener.listening.is_set()
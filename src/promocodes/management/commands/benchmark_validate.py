@@ -0,0 +1,63 @@
+import itertools
+import json
+import timeit
+
+from unittest.mock import patch
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory
+
+from src.promocodes.models import PromoCode
+from src.promocodes.views import PromoCodeViewSet, validate_promocode
+
+# Accepted (age) and denied (time-only) codes, neither calls the weather API
+PROMOCODES = {
+    'BenchmarkAgeCode': PromoCode(name='BenchmarkAgeCode', advantage={'percent': 20}, restrictions=[{'age': {'gt': 20}}]),
+    'BenchmarkDateCode': PromoCode(
+        name='BenchmarkDateCode', advantage={'value': 5}, restrictions=[{'date': {'after': '2999-01-01'}}]
+    ),
+}
+
+
+def get_promocode(name):
+    try:
+        return PROMOCODES[name]
+    except KeyError:
+        raise PromoCode.DoesNotExist()
+
+
+class Command(BaseCommand):
+    help = 'Compare the overhead of the DRF and lean promo code validate views'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--number', type=int, default=5000, help='Number of requests per view')
+
+    def handle(self, *args, **options):
+        number = options['number']
+        factory = RequestFactory()
+        views = {
+            'PromoCodeViewSet.validate': PromoCodeViewSet.as_view({'post': 'validate'}),
+            'validate_promocode (lean)': validate_promocode,
+        }
+        bodies = {
+            'accepted': ({'promocode_name': 'BenchmarkAgeCode', 'arguments': {'age': 25}}, 200),
+            'denied': ({'promocode_name': 'BenchmarkDateCode', 'arguments': {}}, 400),
+        }
+
+        # Each request comes from another client : the throttles are checked, never hit
+        addresses = (f'10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}' for i in itertools.count())
+
+        # Promo codes are served from memory, as from the workers cache : only the views overhead is measured
+        with patch('src.promocodes.services.get_promocode', get_promocode):
+            self.stdout.write(f'{"view":<30}{"verdict":<10}{"per request":>14}')
+            for verdict, (body, status_code) in bodies.items():
+                data = json.dumps(body)
+                for view_name, view in views.items():
+
+                    def request():
+                        response = view(factory.post('/', data, content_type='application/json', REMOTE_ADDR=next(addresses)))
+                        if response.status_code != status_code:
+                            raise CommandError(f'{view_name} answered {response.status_code}')
+
+                    elapsed = timeit.timeit(request, number=number)
+                    self.stdout.write(f'{view_name:<30}{verdict:<10}{elapsed / number * 1e6:>12.1f}us')
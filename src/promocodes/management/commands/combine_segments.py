@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from src.promocodes.segments import combine_segments
+
+
+class Command(BaseCommand):
+    help = 'Create or replace a user segment from set operations on other segments'
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', help='Name of the segment')
+        parser.add_argument('--union', nargs='+', default=[], help='Users in any of these segments')
+        parser.add_argument('--intersection', nargs='+', default=[], help='Users in all of these segments')
+        parser.add_argument('--difference', nargs='+', default=[], help='Users in none of these segments')
+
+    def handle(self, *args, **options):
+        try:
+            segment = combine_segments(
+                options['name'], union=options['union'], intersection=options['intersection'], difference=options['difference']
+            )
+        except ValueError as e:
+            raise CommandError(f'Failed to combine segments: {e}')
+
+        self.stdout.write(self.style.SUCCESS(f'Created segment {segment.name} with {segment.size} users.'))
@@ -0,0 +1,37 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from src.promocodes.generator import generate_promocodes
+
+
+class Command(BaseCommand):
+    help = 'Generate single-use promo codes sharing the same advantage and restrictions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('count', type=int, help='Number of promo codes to generate')
+        parser.add_argument('--advantage', required=True, help='JSON advantage, e.g. {"percent": 20}')
+        parser.add_argument('--restrictions', required=True, help='JSON restrictions, e.g. [{"age": {"gt": 18}}]')
+        parser.add_argument('--prefix', default='', help='Prefix of the promo code names')
+        parser.add_argument('--length', type=int, default=8, help='Length of the random base32 part of the names')
+        parser.add_argument('--output', help='File to write the generated names to, one per line')
+
+    def handle(self, *args, **options):
+        try:
+            advantage = json.loads(options['advantage'])
+            restrictions = json.loads(options['restrictions'])
+        except json.JSONDecodeError as e:
+            raise CommandError(f'Invalid JSON: {e}')
+
+        try:
+            names = generate_promocodes(
+                options['count'], advantage, restrictions, prefix=options['prefix'], length=options['length']
+            )
+        except ValueError as e:
+            raise CommandError(f'Failed to generate promo codes: {e}')
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.writelines(f'{name}\n' for name in names)
+
+        self.stdout.write(self.style.SUCCESS(f'Generated {len(names)} promo codes.'))
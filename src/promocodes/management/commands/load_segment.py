@@ -0,0 +1,27 @@
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+
+from src.promocodes.segments import load_segment
+
+
+class Command(BaseCommand):
+    help = 'Create or replace a user segment from a CSV file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', help='Name of the segment')
+        parser.add_argument('path', help='CSV file holding the user ids')
+        parser.add_argument('--column', default='user_id', help='Header of the user ids column')
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['path'], newline='') as f:
+                reader = csv.DictReader(f)
+                if options['column'] not in (reader.fieldnames or ()):
+                    raise CommandError(f'{options["path"]} has no {options["column"]} column.')
+                user_ids = (row[options['column']].strip() for row in reader)
+                segment = load_segment(options['name'], (user_id for user_id in user_ids if user_id))
+        except OSError as e:
+            raise CommandError(f'Failed to read {options["path"]}: {e}')
+
+        self.stdout.write(self.style.SUCCESS(f'Loaded segment {segment.name} with {segment.size} users.'))
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from src.promocodes.models import PromoCode
+from src.promocodes.simulation import CHUNK_SIZE, read_profiles_csv, simulate_campaign
+
+
+class Command(BaseCommand):
+    help = 'Evaluate a promo code against the user profiles (user_id, age, town) of a CSV file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('promocode_name', help='Name of the promo code')
+        parser.add_argument('input', help='CSV file with the user_id (optional), age and town columns')
+        parser.add_argument('output', help='CSV file to write the user,accepted,reasons rows to')
+        parser.add_argument('--processes', type=int, help='Number of processes, defaults to the number of CPUs')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='Number of profiles per chunk')
+
+    def handle(self, *args, **options):
+        try:
+            promocode = PromoCode.objects.get(name=options['promocode_name'])
+        except PromoCode.DoesNotExist:
+            raise CommandError(f'Promo code {options["promocode_name"]} does not exist')
+
+        try:
+            result = simulate_campaign(
+                promocode,
+                read_profiles_csv(options['input']),
+                options['output'],
+                processes=options['processes'],
+                chunk_size=options['chunk_size'],
+            )
+        except (OSError, ValueError) as e:
+            raise CommandError(f'Failed to simulate the campaign: {e}')
+
+        self.stdout.write(
+            self.style.SUCCESS(f'{result["accepted"]} of {result["total"]} users would be accepted ({result["share"]:.1%}).')
+        )
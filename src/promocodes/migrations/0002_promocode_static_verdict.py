@@ -0,0 +1,83 @@
+# Generated by Django 3.2.12 on 2026-10-19 09:12
+
+from datetime import datetime
+
+from django.db import migrations, models
+
+
+# Copied from src.promocodes.utils as of this migration : the migration must not change with the application code
+def is_time_only(restrictions):
+    for restriction in restrictions:
+        if 'date' in restriction:
+            continue
+        elif 'or' in restriction:
+            if not is_time_only(restriction['or']):
+                return False
+        elif 'and' in restriction:
+            if not is_time_only(restriction['and']):
+                return False
+        else:
+            return False
+    return True
+
+
+def evaluate_date_restrictions(restrictions):
+    # evaluate_restrictions, restricted to the date, or and and conditions of the time-only restrictions
+    failure_reasons = []
+
+    for restriction in restrictions:
+        if 'date' in restriction:
+            now = datetime.now()
+            date_condition = restriction['date']
+            if 'after' in date_condition and now < datetime.strptime(date_condition['after'], '%Y-%m-%d'):
+                failure_reasons.append(f"Date must be after {date_condition['after']}.")
+            if 'before' in date_condition and now > datetime.strptime(date_condition['before'], '%Y-%m-%d'):
+                failure_reasons.append(f"Date must be before {date_condition['before']}.")
+
+        elif 'or' in restriction:
+            results = [evaluate_date_restrictions([sub_condition]) for sub_condition in restriction['or']]
+            if any(res == [] for res in results):
+                return []
+            failure_reasons.extend(item for res in results for item in res)
+
+        elif 'and' in restriction:
+            results = [evaluate_date_restrictions([sub_condition]) for sub_condition in restriction['and']]
+            failures = [res for res in results if res != []]
+            if not failures:
+                return []
+            failure_reasons.extend(item for res in failures for item in res)
+
+    return list(set(failure_reasons))
+
+
+def get_static_verdict(restrictions):
+    return is_time_only(restrictions) and evaluate_date_restrictions(restrictions) == []
+
+
+def compute_static_verdicts(apps, schema_editor):
+    PromoCode = apps.get_model('promocodes', 'PromoCode')
+    for promocode in PromoCode.objects.all().iterator():
+        promocode.is_time_only = is_time_only(promocode.restrictions)
+        promocode.is_active_now = get_static_verdict(promocode.restrictions)
+        promocode.save(update_fields=['is_time_only', 'is_active_now'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('promocodes', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='promocode',
+            name='is_active_now',
+            field=models.BooleanField(db_index=True, default=False, editable=False),
+        ),
+        migrations.AddField(
+            model_name='promocode',
+            name='is_time_only',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.RunPython(compute_static_verdicts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+from django.db import migrations
+
+CREATE_TRIGGER = '''
+CREATE OR REPLACE FUNCTION promocodes_promocode_notify() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        PERFORM pg_notify('promocodes_changed', json_build_object('uuid', OLD.uuid, 'names', json_build_array(OLD.name))::text);
+        RETURN OLD;
+    ELSIF TG_OP = 'UPDATE' THEN
+        PERFORM pg_notify('promocodes_changed', json_build_object('uuid', NEW.uuid, 'names', json_build_array(OLD.name, NEW.name))::text);
+    ELSE
+        PERFORM pg_notify('promocodes_changed', json_build_object('uuid', NEW.uuid, 'names', json_build_array(NEW.name))::text);
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER promocodes_promocode_notify
+AFTER INSERT OR UPDATE OR DELETE ON promocodes_promocode
+FOR EACH ROW EXECUTE PROCEDURE promocodes_promocode_notify();
+'''
+
+DROP_TRIGGER = '''
+DROP TRIGGER IF EXISTS promocodes_promocode_notify ON promocodes_promocode;
+DROP FUNCTION IF EXISTS promocodes_promocode_notify();
+'''
+
+
+def create_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(CREATE_TRIGGER)
+
+
+def drop_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_TRIGGER)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('promocodes', '0002_promocode_static_verdict'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigger, drop_trigger),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.2.12 on 2026-10-19 14:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('promocodes', '0003_promocode_notify_trigger'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='promocode',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='promocode',
+            name='version',
+            field=models.PositiveIntegerField(default=1, editable=False),
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 3.2.12 on 2026-10-19 16:41
+
+from django.db import migrations, models
+
+# Partitioned by month on created_at : the primary key has to contain it.
+# Partitions are created by the writer task, see src/promocodes/audit.py
+CREATE_PARTITIONED_TABLE = '''
+CREATE TABLE promocodes_promocodevalidationevent (
+    id bigserial NOT NULL,
+    created_at timestamp with time zone NOT NULL,
+    promocode_name varchar(255) NOT NULL,
+    arguments jsonb NOT NULL,
+    status varchar(16) NOT NULL,
+    reasons jsonb NOT NULL,
+    latency_ms double precision NOT NULL,
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+
+CREATE INDEX promocodes_validation_name_idx ON promocodes_promocodevalidationevent (promocode_name, created_at);
+'''
+
+
+def create_table(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(CREATE_PARTITIONED_TABLE)
+    else:
+        schema_editor.create_model(apps.get_model('promocodes', 'PromoCodeValidationEvent'))
+
+
+def drop_table(apps, schema_editor):
+    schema_editor.delete_model(apps.get_model('promocodes', 'PromoCodeValidationEvent'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('promocodes', '0004_promocode_version'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='PromoCodeValidationEvent',
+                    fields=[
+                        ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                        ('created_at', models.DateTimeField()),
+                        ('promocode_name', models.CharField(max_length=255)),
+                        ('arguments', models.JSONField()),
+                        ('status', models.CharField(max_length=16)),
+                        ('reasons', models.JSONField()),
+                        ('latency_ms', models.FloatField()),
+                    ],
+                ),
+                migrations.AddIndex(
+                    model_name='promocodevalidationevent',
+                    index=models.Index(fields=['promocode_name', 'created_at'], name='promocodes_validation_name_idx'),
+                ),
+            ],
+        ),
+        # Runs after the state operations, so that the model is available
+        migrations.RunPython(create_table, drop_table),
+    ]
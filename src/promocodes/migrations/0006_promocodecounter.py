@@ -0,0 +1,30 @@
+# Generated by Django 3.2.12 on 2026-10-19 11:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('promocodes', '0005_promocodevalidationevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PromoCodeCounter',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField()),
+                ('promocode_name', models.CharField(max_length=255)),
+                ('status', models.CharField(max_length=16)),
+                ('reason', models.CharField(blank=True, default='', max_length=255)),
+                ('count', models.PositiveIntegerField()),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='promocodecounter',
+            constraint=models.UniqueConstraint(
+                fields=('promocode_name', 'bucket', 'status', 'reason'), name='unique_promocode_counter'
+            ),
+        ),
+    ]
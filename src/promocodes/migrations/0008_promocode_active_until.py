@@ -0,0 +1,47 @@
+# Generated by Django 3.2.12 on 2026-10-19 15:06
+
+from datetime import datetime
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+# Copied from src.promocodes.utils as of this migration : the migration must not change with the application code
+def get_date_boundaries(restrictions):
+    boundaries = []
+    for restriction in restrictions:
+        if 'date' in restriction:
+            for key in ('after', 'before'):
+                if key in restriction['date']:
+                    boundaries.append(datetime.strptime(restriction['date'][key], '%Y-%m-%d'))
+        elif 'or' in restriction:
+            boundaries.extend(get_date_boundaries(restriction['or']))
+        elif 'and' in restriction:
+            boundaries.extend(get_date_boundaries(restriction['and']))
+    return boundaries
+
+
+def compute_active_until(apps, schema_editor):
+    PromoCode = apps.get_model('promocodes', 'PromoCode')
+    now = datetime.now()
+    for promocode in PromoCode.objects.filter(is_time_only=True).iterator():
+        boundaries = [boundary for boundary in get_date_boundaries(promocode.restrictions) if boundary >= now]
+        if boundaries:
+            promocode.active_until = timezone.make_aware(min(boundaries))
+            promocode.save(update_fields=['active_until'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('promocodes', '0007_segment'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='promocode',
+            name='active_until',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(compute_active_until, migrations.RunPython.noop),
+    ]
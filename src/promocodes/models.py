@@ -1,9 +1,23 @@
 import json
 import uuid
 
-from django.db import models
+from django.conf import settings
+from django.core.cache import cache
+from django.db import models, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
 
-from .utils import validate_advantage, validate_restrictions
+from .utils import get_static_verdict, get_static_verdict_expiry, is_time_only, validate_advantage, validate_restrictions
+
+
+class PromoCodeQuerySet(models.QuerySet):
+    def active_now(self):
+        """
+        Time-only promo codes which are currently active - see PromoCode.is_statically_active
+        """
+        now = timezone.now()
+        return self.filter(models.Q(active_until__isnull=True) | models.Q(active_until__gt=now), is_active_now=True)
 
 
 class PromoCode(models.Model):
@@ -17,6 +31,21 @@ class PromoCode(models.Model):
     # restrictions is JSON field representing the array of restrictions - see utils file for typing
     restrictions = models.JSONField()
 
+    # is_time_only is True when the restrictions only contain date conditions, i.e. the verdict only depends on the clock.
+    # is_active_now materializes that verdict : it is computed on save and flipped by RefreshPromoCodesActiveFlagsTask
+    # after each after / before boundary. It is always False for the other promo codes.
+    # active_until is the next boundary, None if there is none left : past it, is_active_now is not trusted until the task
+    # flips it - the restrictions are evaluated, see is_statically_active.
+    is_time_only = models.BooleanField(default=False, editable=False)
+    is_active_now = models.BooleanField(default=False, editable=False, db_index=True)
+    active_until = models.DateTimeField(null=True, blank=True, editable=False)
+
+    # version is incremented on every save : together with updated_at it backs the ETag / Last-Modified headers
+    version = models.PositiveIntegerField(default=1, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = PromoCodeQuerySet.as_manager()
+
     # Validation pre-save
     def save(self, *args, **kwargs):
         """
@@ -51,4 +80,114 @@ class PromoCode(models.Model):
         if validation_err:
             raise ValueError(validation_err)
 
+        self.is_time_only = is_time_only(restrictions)
+        self.is_active_now = get_static_verdict(restrictions)
+        self.active_until = get_static_verdict_expiry(restrictions)
+
+        adding = self._state.adding
+        if not adding:
+            # Incremented by the database : concurrent saves each get their own version
+            self.version = models.F('version') + 1
+
         super().save(*args, **kwargs)
+
+        if not adding:
+            self.refresh_from_db(fields=['version'])
+
+    def is_statically_active(self):
+        """
+        Return True if the promo code is a time-only one which is active, without evaluating its restrictions.
+        """
+        return self.is_active_now and (self.active_until is None or timezone.now() < self.active_until)
+
+
+@receiver(post_save, sender=PromoCode)
+@receiver(post_delete, sender=PromoCode)
+def republish_snapshot(sender, instance=None, **kwargs):
+    if not settings.PROMOCODE_SNAPSHOT_PATH:
+        return
+
+    from .tasks import publish_promocodes_snapshot_task
+
+    transaction.on_commit(publish_promocodes_snapshot_task.delay)
+
+
+@receiver(post_save, sender=PromoCode)
+def add_to_bloom_filter(sender, instance=None, **kwargs):
+    from .catalogue import on_promocode_saved
+
+    on_promocode_saved(instance.name)
+
+
+class PromoCodeValidationEvent(models.Model):
+    """
+    Audit log of the validation attempts, written in batches by WriteValidationEventsTask - see audit.py
+    On Postgres, the table is partitioned by month on created_at.
+    """
+
+    ACCEPTED = 'accepted'
+    DENIED = 'denied'
+    INVALID = 'invalid'
+    NOT_FOUND = 'not_found'
+
+    id = models.BigAutoField(primary_key=True)
+    created_at = models.DateTimeField()
+    promocode_name = models.CharField(max_length=255)
+    arguments = models.JSONField()
+    status = models.CharField(max_length=16)
+    reasons = models.JSONField()
+    latency_ms = models.FloatField()
+
+    class Meta:
+        indexes = [models.Index(fields=['promocode_name', 'created_at'], name='promocodes_validation_name_idx')]
+
+
+class PromoCodeCounter(models.Model):
+    """
+    Validation counts of a promo code over a one minute bucket, by status (reason is empty) and by denial reason.
+    Rolled up from the live Redis counters by RollUpPromoCodeCountersTask - see counters.py
+    """
+
+    bucket = models.DateTimeField()
+    promocode_name = models.CharField(max_length=255)
+    status = models.CharField(max_length=16)
+    reason = models.CharField(max_length=255, blank=True, default='')
+    count = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['promocode_name', 'bucket', 'status', 'reason'], name='unique_promocode_counter')
+        ]
+
+
+class UserIndex(models.Model):
+    """
+    Dense integer index of the users, the positions of the segments bitmaps.
+    user_id is the `user` argument of the validations, e.g. the User uuid.
+    """
+
+    id = models.AutoField(primary_key=True)
+    user_id = models.CharField(max_length=64, unique=True)
+
+
+class Segment(models.Model):
+    """
+    Set of users targeted by `segment` restrictions, stored as a zlib compressed bitmap over UserIndex - see segments.py
+    """
+
+    name = models.CharField(max_length=255, unique=True)
+    bitmap = models.BinaryField()
+    size = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+
+def get_version_cache_key(pk):
+    return f'promocodes:version:{pk}'
+
+
+@receiver(post_save, sender=PromoCode)
+@receiver(post_delete, sender=PromoCode)
+def delete_cached_version(sender, instance=None, **kwargs):
+    # Deleted rather than set : the commits of concurrent saves may run their callbacks out of order.
+    # The next get_promocode_version reads the committed version.
+    transaction.on_commit(lambda: cache.delete(get_version_cache_key(instance.pk)))
@@ -0,0 +1,118 @@
+import threading
+import time
+
+from functools import lru_cache
+from typing import Iterable, Optional
+
+from django.conf import settings
+from django.db import transaction
+
+from .bitmap import Bitmap
+from .models import Segment, UserIndex
+
+# Segments of users targeted by the `segment` restrictions : {"segment": {"in": "premium"}}
+#
+# Users get a dense integer index (UserIndex) and a segment is a bitmap over these indexes, so that checking the
+# membership of a user costs one indexed lookup - cached, indexes never change - and one bit test,
+# whatever the size of the segment.
+
+# Per-worker cache of the decompressed segments : name -> (bitmap, expiry time)
+_segments = {}
+_lock = threading.Lock()
+
+
+@lru_cache(maxsize=100000)
+def get_user_index(user_id: str) -> int:
+    """
+    Raise UserIndex.DoesNotExist - which is not cached - for the users outside of every segment.
+    """
+    return UserIndex.objects.values_list('id', flat=True).get(user_id=user_id)
+
+
+def get_bitmap(name: str) -> Optional[Bitmap]:
+    """
+    Return the bitmap of the segment with the given name, or None if there is none.
+    """
+    entry = _segments.get(name)
+    if entry is not None and entry[1] > time.monotonic():
+        return entry[0]
+
+    data = Segment.objects.filter(name=name).values_list('bitmap', flat=True).first()
+    bitmap = Bitmap.decompress(data) if data is not None else None
+    with _lock:
+        _segments[name] = (bitmap, time.monotonic() + settings.PROMOCODE_SEGMENT_CACHE_TTL)
+    return bitmap
+
+
+def is_in_segment(name: str, user_id: str) -> bool:
+    bitmap = get_bitmap(name)
+    if bitmap is None:
+        return False
+    try:
+        return get_user_index(user_id) in bitmap
+    except UserIndex.DoesNotExist:
+        return False
+
+
+def get_user_indexes(user_ids: Iterable[str], batch_size: int = 10000):
+    """
+    Yield the indexes of the given users, indexing the new ones.
+    Existing users are looked up first, so that the indexes stay dense : conflicting inserts would burn ids.
+    """
+    batch = []
+    for user_id in user_ids:
+        batch.append(user_id)
+        if len(batch) == batch_size:
+            yield from _get_batch_user_indexes(batch)
+            batch = []
+    if batch:
+        yield from _get_batch_user_indexes(batch)
+
+
+def _get_batch_user_indexes(user_ids):
+    indexes = dict(UserIndex.objects.filter(user_id__in=user_ids).values_list('user_id', 'id'))
+    missing = {user_id for user_id in user_ids if user_id not in indexes}
+    if missing:
+        UserIndex.objects.bulk_create([UserIndex(user_id=user_id) for user_id in missing], ignore_conflicts=True)
+        indexes.update(UserIndex.objects.filter(user_id__in=missing).values_list('user_id', 'id'))
+    return indexes.values()
+
+
+def save_segment(name: str, bitmap: Bitmap) -> Segment:
+    segment, _ = Segment.objects.update_or_create(name=name, defaults={'bitmap': bitmap.compress(), 'size': len(bitmap)})
+    return segment
+
+
+def load_segment(name: str, user_ids: Iterable[str]) -> Segment:
+    """
+    Create or replace the segment holding the given users, e.g. read from a CSV file.
+    """
+    with transaction.atomic():
+        return save_segment(name, Bitmap.from_indexes(get_user_indexes(user_ids)))
+
+
+def combine_segments(name: str, union: Iterable[str] = (), intersection: Iterable[str] = (), difference: Iterable[str] = ()):
+    """
+    Create or replace the segment of the users in any of the `union` segments, in all of the `intersection` segments
+    and in none of the `difference` segments.
+    Raise ValueError if a segment does not exist.
+    """
+
+    def get_existing_bitmap(segment_name):
+        data = Segment.objects.filter(name=segment_name).values_list('bitmap', flat=True).first()
+        if data is None:
+            raise ValueError(f'Segment {segment_name} does not exist.')
+        return Bitmap.decompress(data)
+
+    union, intersection, difference = list(union), list(intersection), list(difference)
+    if not union and not intersection:
+        raise ValueError('A segment needs at least one segment to union or intersect.')
+
+    bitmap = None
+    for segment_name in union:
+        bitmap = get_existing_bitmap(segment_name) if bitmap is None else bitmap | get_existing_bitmap(segment_name)
+    for segment_name in intersection:
+        bitmap = get_existing_bitmap(segment_name) if bitmap is None else bitmap & get_existing_bitmap(segment_name)
+    for segment_name in difference:
+        bitmap = bitmap - get_existing_bitmap(segment_name)
+    return save_segment(name, bitmap)
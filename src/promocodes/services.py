@@ -0,0 +1,55 @@
+import time
+
+from rest_framework import status
+
+from .audit import record_validation_event
+from .catalogue import get_promocode
+from .counters import increment_counters
+from .models import PromoCode, PromoCodeValidationEvent
+from .utils import validate_promo_code
+
+
+def validate_promocode_request(data):
+    """
+    Validate the promo code named in the request data against its arguments :
+    {'promocode_name': 'WeatherCode', 'arguments': {'age': 25, 'town': 'Lyon'}}
+    Return the response body and status code - the validate views only differ by how they parse and render.
+    Every attempt is recorded in the audit log and counted, see audit.py and counters.py
+    """
+    started_at = time.perf_counter()
+    (body, status_code), event_status, reasons = _validate_promocode_request(data)
+    latency_ms = (time.perf_counter() - started_at) * 1000
+    record_validation_event(data.get('promocode_name', ''), data.get('arguments', {}), event_status, reasons, latency_ms)
+    # Only the existing promo codes are counted : the names of the requests are arbitrary
+    if event_status != PromoCodeValidationEvent.NOT_FOUND:
+        increment_counters(data['promocode_name'], event_status, reasons)
+    return body, status_code
+
+
+def _validate_promocode_request(data):
+    """
+    Return the response body and status code, with the audit status and reasons
+    """
+    try:
+        promocode_name = data['promocode_name']
+        promocode = get_promocode(promocode_name)
+    except PromoCode.DoesNotExist:
+        response = {'error': f'Promo code {promocode_name} does not exist'}, status.HTTP_404_NOT_FOUND
+        return response, PromoCodeValidationEvent.NOT_FOUND, []
+
+    arguments = {}
+    if 'arguments' in data:
+        arguments = data['arguments']
+
+    try:
+        failure_reasons = validate_promo_code(promocode.restrictions, arguments, static_verdict=promocode.is_statically_active())
+    except ValueError as e:
+        response = {'error': f'Failed to validate promo code: {e}'}, status.HTTP_400_BAD_REQUEST
+        return response, PromoCodeValidationEvent.INVALID, [str(e)]
+
+    if len(failure_reasons) > 0:
+        response = {"promocode_name": promocode_name, "status": "denied", "reasons": failure_reasons}
+        return ({'error': response}, status.HTTP_400_BAD_REQUEST), PromoCodeValidationEvent.DENIED, failure_reasons
+
+    response = {"promocode_name": promocode_name, "status": "accepted", "advantage": promocode.advantage}
+    return ({'message': response}, status.HTTP_200_OK), PromoCodeValidationEvent.ACCEPTED, []
@@ -0,0 +1,102 @@
+import csv
+import os
+
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Iterable, Iterator, List
+
+from billiard import Pool
+from django.db import connections
+
+from .utils import evaluate_restrictions, get_current_weather, has_weather_restriction, validate_arguments
+
+# Offline campaign simulation : which share of a user population would a promo code accept ?
+#
+# Profiles are streamed in chunks, evaluated by a pool of processes and the verdicts written to a CSV file as the chunks
+# complete. The pool comes from billiard, Celery's fork of multiprocessing, which lets the daemonic prefork workers have
+# children. The weather API is called once per town, by the parent process, whatever the number of users living there.
+
+CHUNK_SIZE = 10000
+# Concurrent weather API calls
+WEATHER_LOOKUP_THREADS = 16
+
+
+def read_profiles_csv(path: str) -> Iterator[dict]:
+    """
+    Yield the profiles of a CSV file with the user_id (optional), age and town columns, as validation arguments.
+    """
+    with open(path, newline='') as f:
+        for row_number, row in enumerate(csv.DictReader(f), start=1):
+            profile = {'user': row.get('user_id') or str(row_number)}
+            if row.get('age'):
+                try:
+                    profile['age'] = int(row['age'])
+                except ValueError:
+                    # Reported as an invalid argument for this user - see validate_arguments
+                    profile['age'] = row['age']
+            if row.get('town'):
+                profile['town'] = row['town']
+            yield profile
+
+
+def _evaluate_chunk(restrictions, profiles, weathers):
+    results = []
+    for profile in profiles:
+        arguments_err = validate_arguments(profile)
+        if arguments_err:
+            results.append((profile.get('user'), [arguments_err]))
+        else:
+            results.append((profile.get('user'), evaluate_restrictions(restrictions, profile, weathers)))
+    return results
+
+
+def simulate_campaign(promocode, profiles: Iterable[dict], output_path: str, processes=None, chunk_size=CHUNK_SIZE):
+    """
+    Evaluate the promo code against every profile - validation arguments, e.g. read_profiles_csv(path) or
+    queryset.values('age', 'town').iterator() - and write user,accepted,reasons rows to output_path.
+    Return {'total': ..., 'accepted': ..., 'share': ...}.
+    """
+    processes = processes or os.cpu_count()
+    with_weather = has_weather_restriction(promocode.restrictions)
+    weathers = {}
+    total, accepted = 0, 0
+
+    # Forked workers must not share the parent database connections (segment restrictions query the database)
+    connections.close_all()
+
+    with open(output_path, 'w', newline='') as f, Pool(processes) as pool, ThreadPoolExecutor(
+        WEATHER_LOOKUP_THREADS
+    ) as weather_pool:
+        writer = csv.writer(f)
+        writer.writerow(['user', 'accepted', 'reasons'])
+
+        def write_results(async_result):
+            nonlocal total, accepted
+            for user, reasons in async_result.get():
+                total += 1
+                accepted += not reasons
+                writer.writerow([user, int(not reasons), '; '.join(reasons)])
+
+        pending = []
+        profiles = iter(profiles)
+        while True:
+            chunk: List[dict] = list(islice(profiles, chunk_size))
+            if not chunk:
+                break
+
+            chunk_weathers = None
+            if with_weather:
+                towns = {profile['town'] for profile in chunk if profile.get('town')}
+                missing = [town for town in towns if town not in weathers]
+                weathers.update(zip(missing, weather_pool.map(get_current_weather, missing)))
+                chunk_weathers = {town: weathers[town] for town in towns}
+
+            pending.append(pool.apply_async(_evaluate_chunk, (promocode.restrictions, chunk, chunk_weathers)))
+            # Bound the chunks in flight, and so the memory, while keeping every process busy
+            while len(pending) > 2 * processes:
+                write_results(pending.pop(0))
+
+        for async_result in pending:
+            write_results(async_result)
+
+    return {'total': total, 'accepted': accepted, 'share': accepted / total if total else 0}
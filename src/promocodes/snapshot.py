@@ -0,0 +1,156 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+import time
+
+from typing import Iterable, Optional
+
+# Binary snapshot of the promo codes catalogue, shared by every web worker through mmap.
+#
+# Layout (little-endian) :
+# - header : magic, number of index slots, number of records, generation timestamp
+# - index : open addressing hash table (linear probing) of (name hash, record offset, record length) slots
+# - records : name length, name (utf-8) and the JSON encoded promo code
+#
+# Lookups hash the name, probe the index and compare the name bytes in place :
+# only the matching record is decoded.
+
+MAGIC = b'PCS2'
+HEADER = struct.Struct('<4sIId')
+SLOT = struct.Struct('<QII')
+NAME_LENGTH = struct.Struct('<H')
+
+# Seconds between two checks of the snapshot file for a newer version
+RELOAD_INTERVAL = 1
+
+
+def hash_name(name: bytes) -> int:
+    """
+    Stable 64 bits hash of a promo code name - the built-in hash() is salted per process.
+    0 marks the empty index slots.
+    """
+    return int.from_bytes(hashlib.blake2b(name, digest_size=8).digest(), 'little') or 1
+
+
+def encode_promocode(promocode) -> dict:
+    return {
+        'uuid': str(promocode.uuid),
+        'name': promocode.name,
+        'advantage': promocode.advantage,
+        'restrictions': promocode.restrictions,
+        'is_time_only': promocode.is_time_only,
+        'is_active_now': promocode.is_active_now,
+        'active_until': promocode.active_until.timestamp() if promocode.active_until else None,
+    }
+
+
+def write_snapshot(path: str, promocodes: Iterable, generated_at: Optional[float] = None):
+    """
+    Write the snapshot of the given promo codes to path.
+    generated_at is the time at which the promo codes were read, it defaults to now.
+    The file is written next to path then atomically renamed, so workers never read a partial snapshot.
+    """
+    generated_at = time.time() if generated_at is None else generated_at
+    records = []
+    for promocode in promocodes:
+        name = promocode.name.encode()
+        payload = json.dumps(encode_promocode(promocode), separators=(',', ':')).encode()
+        records.append((name, NAME_LENGTH.pack(len(name)) + name + payload))
+
+    # Keep the load factor under 0.5 so that probe sequences stay short
+    slot_count = 1
+    while slot_count < 2 * len(records):
+        slot_count *= 2
+
+    slots = [(0, 0, 0)] * slot_count
+    offset = HEADER.size + slot_count * SLOT.size
+    for name, record in records:
+        name_hash = hash_name(name)
+        slot = name_hash & (slot_count - 1)
+        while slots[slot][2]:
+            slot = (slot + 1) & (slot_count - 1)
+        slots[slot] = (name_hash, offset, len(record))
+        offset += len(record)
+
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, slot_count, len(records), generated_at))
+        f.write(b''.join(SLOT.pack(*slot) for slot in slots))
+        for _, record in records:
+            f.write(record)
+    os.replace(tmp_path, path)
+
+
+class CatalogueSnapshot:
+    """
+    Read-only view of a snapshot file written by write_snapshot.
+    """
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.version = (stat.st_ino, stat.st_mtime_ns)
+
+        magic, self.slot_count, self.count, self.generated_at = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            self._mmap.close()
+            raise ValueError(f'{path} is not a promo codes snapshot.')
+
+    def __len__(self):
+        return self.count
+
+    def get(self, name: str) -> Optional[dict]:
+        """
+        Return the encoded promo code with the given name, or None if the snapshot does not contain it.
+        """
+        encoded_name = name.encode()
+        name_hash = hash_name(encoded_name)
+        mask = self.slot_count - 1
+        slot = name_hash & mask
+
+        for _ in range(self.slot_count):
+            slot_hash, offset, length = SLOT.unpack_from(self._mmap, HEADER.size + slot * SLOT.size)
+            if not length:
+                return None
+            if slot_hash == name_hash:
+                (name_length,) = NAME_LENGTH.unpack_from(self._mmap, offset)
+                name_start = offset + NAME_LENGTH.size
+                if self._mmap[name_start : name_start + name_length] == encoded_name:
+                    return json.loads(self._mmap[name_start + name_length : offset + length])
+            slot = (slot + 1) & mask
+        return None
+
+    def close(self):
+        self._mmap.close()
+
+
+class SnapshotReader:
+    """
+    Give access to the latest snapshot published at path, re-opening it when a new version is published.
+    Each process holds one mapping : the pages themselves are shared through the OS page cache.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._snapshot = None
+        self._checked_at = 0
+
+    def get_snapshot(self) -> Optional[CatalogueSnapshot]:
+        now = time.monotonic()
+        if now - self._checked_at < RELOAD_INTERVAL:
+            return self._snapshot
+        self._checked_at = now
+
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            self._snapshot = None
+            return None
+
+        if self._snapshot is None or self._snapshot.version != (stat.st_ino, stat.st_mtime_ns):
+            # The previous mapping is left to the garbage collector : a concurrent lookup may still be reading it
+            self._snapshot = CatalogueSnapshot(self.path)
+        return self._snapshot
@@ -0,0 +1,82 @@
+import logging
+
+from collections import defaultdict
+
+from celery import task
+from django.conf import settings
+
+from .audit import get_metrics, write_events
+from .catalogue import publish_snapshot
+from .counters import roll_up_counters
+from .models import PromoCode
+from .simulation import read_profiles_csv, simulate_campaign
+from .utils import get_static_verdict, get_static_verdict_expiry
+
+logger = logging.getLogger(__name__)
+
+
+@task(name='RefreshPromoCodesActiveFlagsTask')
+def refresh_promocodes_active_flags_task():
+    """
+    Flip is_active_now on the time-only promo codes whose verdict changed, and move their active_until to the next boundary.
+    Date restrictions have a day granularity, so every after / before boundary falls on midnight :
+    the task is scheduled right after it (see CELERYBEAT_SCHEDULE). Until it runs, the promo codes past their active_until
+    are evaluated - see PromoCode.is_statically_active.
+    """
+    # (is_active_now, active_until) -> uuids of the promo codes to update
+    changes = defaultdict(list)
+
+    promocodes = PromoCode.objects.filter(is_time_only=True).only('uuid', 'restrictions', 'is_active_now', 'active_until')
+    for promocode in promocodes.iterator():
+        static_fields = (get_static_verdict(promocode.restrictions), get_static_verdict_expiry(promocode.restrictions))
+        if static_fields != (promocode.is_active_now, promocode.active_until):
+            changes[static_fields].append(promocode.uuid)
+
+    for (is_active_now, active_until), uuids in changes.items():
+        PromoCode.objects.filter(uuid__in=uuids).update(is_active_now=is_active_now, active_until=active_until)
+
+    if settings.PROMOCODE_SNAPSHOT_PATH and changes:
+        publish_snapshot()
+
+
+@task(name='PublishPromoCodesSnapshotTask')
+def publish_promocodes_snapshot_task():
+    if not settings.PROMOCODE_SNAPSHOT_PATH:
+        return
+
+    publish_snapshot()
+
+
+@task(name='WriteValidationEventsTask')
+def write_validation_events_task():
+    """
+    Write the buffered validation events to the database - see audit.py
+    """
+    if not settings.AUDIT_ENABLED:
+        return
+
+    written = write_events()
+    if written:
+        logger.info(f'Wrote {written} validation events, audit metrics: {get_metrics()}')
+
+
+@task(name='RollUpPromoCodeCountersTask')
+def roll_up_promocode_counters_task():
+    """
+    Move the closed buckets of the live validation counters to PromoCodeCounter - see counters.py
+    """
+    if not settings.PROMOCODE_COUNTERS_ENABLED:
+        return
+
+    roll_up_counters()
+
+
+@task(name='SimulateCampaignTask')
+def simulate_campaign_task(promocode_name, input_path, output_path):
+    """
+    Evaluate the promo code against the user profiles of the input CSV file - see simulation.py
+    """
+    promocode = PromoCode.objects.get(name=promocode_name)
+    result = simulate_campaign(promocode, read_profiles_csv(input_path), output_path)
+    logger.info(f'Simulated promo code {promocode_name}: {result["accepted"]} of {result["total"]} users accepted.')
+    return result
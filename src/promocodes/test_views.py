@@ -0,0 +1,187 @@
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+from rest_framework.throttling import AnonRateThrottle
+
+from src.users.models import User
+from src.users.test.factories import UserFactory
+
+from .models import PromoCode, PromoCodeCounter
+from .views import STATS_MAX_HOURS
+
+
+class TestPromoCodeRetrieve(APITestCase):
+    def setUp(self):
+        self.promocode = PromoCode.objects.create(
+            name='WeatherCode', advantage={"percent": 20}, restrictions=[{"age": {"gt": 20}}]
+        )
+        self.url = reverse('promocode-detail', kwargs={'pk': self.promocode.pk})
+
+    def test_retrieve_sends_etag(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['ETag'], f'"{self.promocode.pk}-1"')
+        self.assertIn('Last-Modified', response)
+
+    def test_retrieve_not_modified(self):
+        etag = self.client.get(self.url)['ETag']
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_retrieve_modified(self):
+        etag = self.client.get(self.url)['ETag']
+        self.promocode.advantage = {"percent": 30}
+        with self.captureOnCommitCallbacks(execute=True):
+            self.promocode.save()
+        self.promocode.refresh_from_db()
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['ETag'], f'"{self.promocode.pk}-2"')
+        self.assertEqual(response.data['advantage'], {"percent": 30})
+
+    def test_concurrent_saves(self):
+        stale = PromoCode.objects.get(pk=self.promocode.pk)
+        self.promocode.save()
+        stale.save()
+
+        self.assertEqual((self.promocode.version, stale.version), (2, 3))
+
+        response = self.client.get(self.url)
+        self.assertEqual(response['ETag'], f'"{self.promocode.pk}-3"')
+
+    def test_retrieve_unknown_promocode(self):
+        response = self.client.get(reverse('promocode-detail', kwargs={'pk': 'unknown'}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class TestPromoCodeValidate(APITestCase):
+    """
+    The lean validate view keeps the contract of PromoCodeViewSet.validate
+    """
+
+    def setUp(self):
+        PromoCode.objects.create(name='AgeCode', advantage={"percent": 20}, restrictions=[{"age": {"gt": 20}}])
+        self.urls = [reverse('promocode-validate'), reverse('promocode-validate-lean')]
+
+    def assertSameResponses(self, data, expected_status, format='json'):
+        responses = [self.client.post(url, data, format=format) for url in self.urls]
+        for response in responses:
+            self.assertEqual(response.status_code, expected_status)
+            self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(responses[0].content, responses[1].content)
+
+    def test_accepted(self):
+        self.assertSameResponses({'promocode_name': 'AgeCode', 'arguments': {'age': 25}}, status.HTTP_200_OK)
+
+    def test_denied(self):
+        self.assertSameResponses({'promocode_name': 'AgeCode', 'arguments': {'age': 15}}, status.HTTP_400_BAD_REQUEST)
+
+    def test_invalid_arguments(self):
+        self.assertSameResponses({'promocode_name': 'AgeCode', 'arguments': {'age': '25'}}, status.HTTP_400_BAD_REQUEST)
+
+    def test_unknown_promocode(self):
+        self.assertSameResponses({'promocode_name': 'Unknown', 'arguments': {}}, status.HTTP_404_NOT_FOUND)
+
+    def test_form_data(self):
+        self.assertSameResponses({'promocode_name': 'Unknown'}, status.HTTP_404_NOT_FOUND, format='multipart')
+
+    def test_malformed_body(self):
+        responses = [
+            self.client.generic('POST', url, '{"promocode_name": ', content_type='application/json') for url in self.urls
+        ]
+        for response in responses:
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(responses[0].content, responses[1].content)
+
+    def test_method_not_allowed(self):
+        responses = [self.client.get(url) for url in self.urls]
+        for response in responses:
+            self.assertEqual(response.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
+        self.assertEqual(responses[0].content, responses[1].content)
+
+    def test_default_throttles(self):
+        cache.clear()
+        data = {'promocode_name': 'AgeCode', 'arguments': {'age': 25}}
+        with patch.object(AnonRateThrottle, 'THROTTLE_RATES', {'anon': '2/minute'}):
+            for url in self.urls:
+                self.assertEqual(self.client.post(url, data, format='json').status_code, status.HTTP_200_OK)
+            for url in self.urls:
+                response = self.client.post(url, data, format='json')
+                self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+                self.assertIn('Retry-After', response)
+
+    @override_settings(TOKEN_BUCKET_ENABLED=True)
+    def test_token_bucket_by_user(self):
+        user = User.objects.get(pk=UserFactory().pk)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {user.get_tokens()["access"]}')
+        with patch('src.common.throttling.consume_token', return_value=(True, 0.0)) as consume:
+            for url in self.urls:
+                self.client.post(url, {'promocode_name': 'AgeCode'}, format='json')
+
+        # One bucket for both views
+        self.assertEqual([call[0][0] for call in consume.call_args_list], [f'throttle:promocodes.validate:user:{user.pk}'] * 2)
+
+    def test_invalid_token(self):
+        responses = [
+            self.client.post(url, {'promocode_name': 'AgeCode'}, format='json', HTTP_AUTHORIZATION='Bearer invalid')
+            for url in self.urls
+        ]
+        # 403 : SessionAuthentication, the first authentication class, sends no WWW-Authenticate header
+        for response in responses:
+            self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(responses[0].content, responses[1].content)
+
+
+class TestPromoCodeStats(APITestCase):
+    def setUp(self):
+        self.promocode = PromoCode.objects.create(name='AgeCode', advantage={"percent": 20}, restrictions=[{"age": {"gt": 20}}])
+        self.url = reverse('promocode-stats', kwargs={'pk': self.promocode.pk})
+        self.client.force_authenticate(user=User.objects.get(pk=UserFactory(is_staff=True).pk))
+
+    def test_stats(self):
+        recent, old = timezone.now() - timedelta(hours=1), timezone.now() - timedelta(days=2)
+        PromoCodeCounter.objects.bulk_create(
+            [
+                PromoCodeCounter(bucket=recent, promocode_name='AgeCode', status='accepted', count=7),
+                PromoCodeCounter(bucket=recent - timedelta(minutes=1), promocode_name='AgeCode', status='accepted', count=3),
+                PromoCodeCounter(bucket=recent, promocode_name='AgeCode', status='denied', count=2),
+                PromoCodeCounter(
+                    bucket=recent, promocode_name='AgeCode', status='denied', reason='Age condition not met.', count=2
+                ),
+                PromoCodeCounter(bucket=old, promocode_name='AgeCode', status='accepted', count=100),
+                PromoCodeCounter(bucket=recent, promocode_name='OtherCode', status='accepted', count=100),
+            ]
+        )
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['accepted'], 10)
+        self.assertEqual(response.data['denied'], 2)
+        self.assertEqual(response.data['reasons'], {'Age condition not met.': 2})
+
+        response = self.client.get(self.url, {'hours': 72})
+        self.assertEqual(response.data['accepted'], 110)
+
+    def test_stats_with_invalid_hours(self):
+        response = self.client.get(self.url, {'hours': 'all'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.get(self.url, {'hours': 10**12})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['hours'], STATS_MAX_HOURS)
+
+    def test_stats_staff_only(self):
+        self.client.force_authenticate(user=User.objects.get(pk=UserFactory().pk))
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_403_FORBIDDEN)
+
+        self.client.force_authenticate(user=None)
+        self.assertIn(self.client.get(self.url).status_code, (status.HTTP_401_UNAUTHORIZED, status.HTTP_403_FORBIDDEN))
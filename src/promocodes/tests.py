@@ -1,11 +1,43 @@
+import os
+import tempfile
+import threading
+import time
 import unittest
+import uuid
 
 from datetime import datetime, timedelta
-from unittest.mock import patch
+from types import SimpleNamespace
+from unittest.mock import Mock, patch
+
+import billiard
+
+from django.db import DatabaseError, connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from redis.exceptions import RedisError
+
+from . import audit, catalogue
+from .audit import copy_events, record_validation_event, write_events
+from .bitmap import Bitmap
+from .bloom import BloomFilter
+from .catalogue import _may_exist, get_promocode
+from .generator import generate_promocodes
+from .invalidation import PromoCodeChangesListener
+from .models import PromoCode, PromoCodeValidationEvent
+from .segments import combine_segments, load_segment
+from .services import validate_promocode_request
+from .simulation import read_profiles_csv, simulate_campaign
+from .snapshot import CatalogueSnapshot, SnapshotReader, write_snapshot
+from .tasks import refresh_promocodes_active_flags_task
+
+from src.common.redis_client import get_redis
 
 from .utils import (
     check_condition,
     evaluate_restrictions,
+    get_static_verdict,
+    get_static_verdict_expiry,
+    is_time_only,
     is_valid_date,
     validate_advantage,
     validate_arguments,
@@ -69,6 +101,7 @@ class TestUtils(unittest.TestCase):
         test_cases = [
             ({"age": "14"}, "Invalid argument - age must be an integer."),
             ({"town": {"name": "Paris"}}, "Invalid argument - town must be a string."),
+            ({"user": 42}, "Invalid argument - user must be a string."),
             ({"age": 14, "town": "Paris"}, None),
             ({"town": "Paris"}, None),
             ({"age": 14, "town": "Paris", "date": "2024-01-01"}, None),
@@ -83,6 +116,9 @@ class TestUtils(unittest.TestCase):
             (["age"], "Restrictions must be an array of objects."),
             ([{"age": "20"}], "Age must be a JSON object."),
             ([{"age": {"gt": 20}}], None),
+            ([{"segment": "premium"}], "Segment must be a JSON object."),
+            ([{"segment": {"in": ["premium"]}}], "In must be a string."),
+            ([{"segment": {"in": "premium"}}], None),
             #  TODO : Add more test cases... test coverage is not complete whatsoever.
         ]
         for idx, (input, expected) in enumerate(test_cases):
@@ -104,6 +140,46 @@ class TestUtils(unittest.TestCase):
             actual = evaluate_restrictions(input_1, input_2)
             self.assertEqual(actual, expected, f"Case {idx}: Expected '{expected}', got '{actual}' with : {input_1} , {input_2}")
 
+    def test_is_time_only(self):
+        test_cases = [
+            ([{"date": {"after": "2024-01-01"}}], True),
+            ([{"or": [{"date": {"before": "2024-01-01"}}, {"and": [{"date": {"after": "2025-01-01"}}]}]}], True),
+            ([{"date": {"after": "2024-01-01"}}, {"age": {"gt": 20}}], False),
+            ([{"or": [{"date": {"before": "2024-01-01"}}, {"weather": {"is": "clear"}}]}], False),
+        ]
+        for idx, (input, expected) in enumerate(test_cases):
+            actual = is_time_only(input)
+            self.assertEqual(actual, expected, f"Case {idx}: Expected '{expected}', got '{actual}' with : {input}")
+
+    def test_get_static_verdict(self):
+        yesterday = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
+        tomorrow = (datetime.now() + timedelta(days=1)).strftime("%Y-%m-%d")
+        test_cases = [
+            ([{"date": {"after": yesterday, "before": tomorrow}}], True),
+            ([{"date": {"after": tomorrow}}], False),
+            ([{"or": [{"date": {"after": tomorrow}}, {"date": {"before": tomorrow}}]}], True),
+            # Not time-only : the verdict cannot be precomputed
+            ([{"date": {"after": yesterday}}, {"age": {"gt": 20}}], False),
+        ]
+        for idx, (input, expected) in enumerate(test_cases):
+            actual = get_static_verdict(input)
+            self.assertEqual(actual, expected, f"Case {idx}: Expected '{expected}', got '{actual}' with : {input}")
+
+    def test_get_static_verdict_expiry(self):
+        yesterday = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
+        tomorrow = (datetime.now() + timedelta(days=1)).strftime("%Y-%m-%d")
+        test_cases = [
+            ([{"date": {"after": yesterday, "before": tomorrow}}], tomorrow),
+            ([{"or": [{"date": {"after": tomorrow}}, {"date": {"before": yesterday}}]}], tomorrow),
+            ([{"date": {"before": yesterday}}], None),
+            # Not time-only : no static verdict
+            ([{"date": {"before": tomorrow}}, {"age": {"gt": 20}}], None),
+        ]
+        for idx, (input, expected) in enumerate(test_cases):
+            actual = get_static_verdict_expiry(input)
+            actual = actual and timezone.localtime(actual).strftime("%Y-%m-%d")
+            self.assertEqual(actual, expected, f"Case {idx}: Expected '{expected}', got '{actual}' with : {input}")
+
     # Mock the request.get method to test the validate_promo_code function
     @patch("requests.get")
     def test_evaluate_restrictions_with_api(self, mock_get):
@@ -179,3 +255,432 @@ class TestUtils(unittest.TestCase):
                 actual,
                 f"Expected {expected}, got '{actual}' with args: {args}",
             )
+
+
+class TestStaticVerdict(TestCase):
+    def setUp(self):
+        tomorrow = (datetime.now() + timedelta(days=1)).strftime("%Y-%m-%d")
+        self.promocode = PromoCode.objects.create(
+            name='TIMECODE', advantage={"percent": 10}, restrictions=[{"date": {"before": tomorrow}}]
+        )
+
+    def pass_boundary(self):
+        # The state right after the before date, until RefreshPromoCodesActiveFlagsTask runs
+        yesterday = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
+        PromoCode.objects.filter(pk=self.promocode.pk).update(
+            restrictions=[{"date": {"before": yesterday}}], active_until=timezone.now() - timedelta(seconds=1)
+        )
+
+    def test_active_until_boundary(self):
+        self.assertTrue(self.promocode.is_statically_active())
+        body, status_code = validate_promocode_request({'promocode_name': 'TIMECODE'})
+        self.assertEqual(status_code, 200)
+
+        # Past active_until, the stale flag is not trusted
+        self.pass_boundary()
+        self.promocode.refresh_from_db()
+        self.assertTrue(self.promocode.is_active_now)
+        self.assertFalse(self.promocode.is_statically_active())
+        body, status_code = validate_promocode_request({'promocode_name': 'TIMECODE'})
+        self.assertEqual(status_code, 400)
+        self.assertFalse(PromoCode.objects.active_now().exists())
+
+    def test_refresh_flips_flags(self):
+        self.pass_boundary()
+        refresh_promocodes_active_flags_task()
+
+        self.promocode.refresh_from_db()
+        self.assertFalse(self.promocode.is_active_now)
+        self.assertIsNone(self.promocode.active_until)
+
+
+class TestSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.promocodes = [
+            SimpleNamespace(
+                uuid=uuid.uuid4(),
+                name=f'PROMO{idx}',
+                advantage={'percent': idx},
+                restrictions=[{'age': {'gt': idx}}],
+                is_time_only=False,
+                is_active_now=False,
+                active_until=None,
+            )
+            for idx in range(100)
+        ]
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_lookup(self):
+        write_snapshot(self.path, self.promocodes)
+        snapshot = CatalogueSnapshot(self.path)
+
+        self.assertEqual(len(snapshot), 100)
+        for promocode in self.promocodes:
+            data = snapshot.get(promocode.name)
+            self.assertEqual(data['uuid'], str(promocode.uuid))
+            self.assertEqual(data['advantage'], promocode.advantage)
+            self.assertEqual(data['restrictions'], promocode.restrictions)
+        self.assertIsNone(snapshot.get('UNKNOWN'))
+        snapshot.close()
+
+    def test_empty_catalogue(self):
+        write_snapshot(self.path, [])
+        snapshot = CatalogueSnapshot(self.path)
+
+        self.assertEqual(len(snapshot), 0)
+        self.assertIsNone(snapshot.get('PROMO1'))
+        snapshot.close()
+
+
+class TestCatalogue(TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_created_after_snapshot(self):
+        write_snapshot(self.path, [], generated_at=datetime.now().timestamp() - 1)
+        promocode = PromoCode.objects.create(name='NEWCODE', advantage={"percent": 10}, restrictions=[{"age": {"gt": 20}}])
+
+        with patch('src.promocodes.catalogue._snapshot_reader', SnapshotReader(self.path)):
+            self.assertEqual(get_promocode('NEWCODE'), promocode)
+            with self.assertRaises(PromoCode.DoesNotExist):
+                get_promocode('UNKNOWN')
+
+    def test_created_after_bloom_filter(self):
+        with patch.multiple(
+            'src.promocodes.catalogue', _bloom_filter=BloomFilter(capacity=100), _bloom_filter_built_at=time.monotonic()
+        ):
+            with self.assertNumQueries(1):
+                self.assertFalse(_may_exist('NEWCODE'))
+            # Added on post_save
+            PromoCode.objects.create(name='NEWCODE', advantage={"percent": 10}, restrictions=[{"age": {"gt": 20}}])
+            with self.assertNumQueries(0):
+                self.assertTrue(_may_exist('NEWCODE'))
+
+    def test_created_by_another_process(self):
+        with patch.multiple(
+            'src.promocodes.catalogue', _bloom_filter=BloomFilter(capacity=100), _bloom_filter_built_at=time.monotonic()
+        ):
+            # No post_save, as if created by another process and not notified yet
+            PromoCode.objects.bulk_create(
+                [PromoCode(name='OTHERCODE', advantage={"percent": 10}, restrictions=[{"age": {"gt": 20}}])]
+            )
+            with self.assertNumQueries(1):
+                self.assertTrue(_may_exist('OTHERCODE'))
+            with self.assertNumQueries(0):
+                self.assertTrue(_may_exist('OTHERCODE'))
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'LISTEN / NOTIFY requires Postgres')
+@override_settings(PROMOCODE_CHANGES_LISTENER_ENABLED=True, PROMOCODE_BLOOM_FILTER_REBUILD_INTERVAL=0)
+class TestCatalogueInvalidation(TransactionTestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_notify_invalidates_snapshot(self):
+        promocode = PromoCode.objects.create(name='PROMO', advantage={"percent": 10}, restrictions=[{"age": {"gt": 20}}])
+        write_snapshot(self.path, [promocode], generated_at=time.time())
+
+        notified = threading.Event()
+
+        def on_change(promocode_uuid, names):
+            catalogue.on_promocode_change(promocode_uuid, names)
+            notified.set()
+            # Stop listening : the connection must be closed before the test database is dropped
+            raise StopIteration
+
+        listener = PromoCodeChangesListener(on_change, catalogue.on_listen)
+
+        def listen():
+            try:
+                listener.listen()
+            except StopIteration:
+                pass
+
+        with patch.dict(catalogue._cache, clear=True), patch.dict(catalogue._changed_names, clear=True), patch(
+            'src.promocodes.catalogue._snapshot_reader', SnapshotReader(self.path)
+        ), patch('src.promocodes.catalogue.start_listener', return_value=True):
+            thread = threading.Thread(target=listen, daemon=True)
+            thread.start()
+            self.assertTrue(listener.listening.wait(5))
+
+            # Read from the snapshot, then from the cache
+            self.assertEqual(get_promocode('PROMO').advantage, {"percent": 10})
+            self.assertEqual(get_promocode('PROMO').advantage, {"percent": 10})
+
+            promocode.advantage = {"percent": 20}
+            promocode.save()
+            self.assertTrue(notified.wait(5))
+            thread.join(5)
+
+            self.assertEqual(get_promocode('PROMO').advantage, {"percent": 20})
+
+
+class TestChangesListener(unittest.TestCase):
+    def test_restarts_on_handler_error(self):
+        listener = PromoCodeChangesListener(on_change=Mock(), on_listen=Mock())
+        listener.listening.set()
+
+        # Stop the loop on the reconnection delay
+        with patch.object(listener, 'listen', side_effect=KeyError('names')), patch(
+            'src.promocodes.invalidation.time.sleep', side_effect=StopIteration
+        ):
+            with self.assertRaises(StopIteration):
+                listener.run()
+        self.assertFalse(listener.listening.is_set())
+
+
+class TestBloomFilter(unittest.TestCase):
+    def test_membership(self):
+        names = [f'PROMO{idx}' for idx in range(10000)]
+        bloom_filter = BloomFilter.from_names(names, capacity=len(names), error_rate=0.01)
+
+        # No false negatives
+        for name in names:
+            self.assertIn(name, bloom_filter)
+
+        false_positives = sum(f'UNKNOWN{idx}' in bloom_filter for idx in range(10000))
+        self.assertLess(false_positives, 300)
+
+    def test_add(self):
+        bloom_filter = BloomFilter(capacity=100)
+        self.assertNotIn('PROMO', bloom_filter)
+        bloom_filter.add('PROMO')
+        self.assertIn('PROMO', bloom_filter)
+
+
+class TestBitmap(unittest.TestCase):
+    def test_membership(self):
+        bitmap = Bitmap.from_indexes([1, 8, 1000000])
+        self.assertEqual(len(bitmap), 3)
+        self.assertIn(1000000, bitmap)
+        self.assertNotIn(2, bitmap)
+        self.assertNotIn(2000000, bitmap)
+        self.assertIn(8, Bitmap.decompress(bitmap.compress()))
+
+    def test_set_operations(self):
+        a, b = Bitmap.from_indexes([1, 2, 3]), Bitmap.from_indexes([3, 4, 100])
+        self.assertEqual([i for i in range(128) if i in a | b], [1, 2, 3, 4, 100])
+        self.assertEqual([i for i in range(128) if i in a & b], [3])
+        self.assertEqual([i for i in range(128) if i in b - a], [4, 100])
+
+
+class TestSegments(TestCase):
+    def test_segment_restriction(self):
+        load_segment('premium', ['alice', 'bob'])
+        load_segment('churned', ['bob', 'carol'])
+        combine_segments('loyal', union=['premium'], difference=['churned'])
+        restrictions = [{"segment": {"in": "loyal"}}]
+
+        self.assertEqual(evaluate_restrictions(restrictions, {"user": "alice"}), [])
+        self.assertEqual(evaluate_restrictions(restrictions, {"user": "bob"}), ["Segment condition not met."])
+        self.assertEqual(evaluate_restrictions(restrictions, {"user": "dave"}), ["Segment condition not met."])
+        self.assertEqual(evaluate_restrictions(restrictions, {}), ["Segment condition not met."])
+        self.assertEqual(
+            evaluate_restrictions([{"segment": {"in": "unknown"}}], {"user": "alice"}), ["Segment condition not met."]
+        )
+        self.assertFalse(is_time_only(restrictions))
+
+    def test_combine_unknown_segment(self):
+        with self.assertRaises(ValueError):
+            combine_segments('loyal', union=['unknown'])
+
+
+class TestSimulation(unittest.TestCase):
+    @patch('src.promocodes.simulation.get_current_weather')
+    def test_simulate_campaign(self, mock_get_current_weather):
+        mock_get_current_weather.side_effect = lambda town: ('clear', 20) if town == 'Lyon' else ('clouds', 20)
+        promocode = SimpleNamespace(restrictions=[{"age": {"gt": 20}}, {"weather": {"is": "clear"}}])
+
+        with tempfile.TemporaryDirectory() as directory:
+            input_path, output_path = os.path.join(directory, 'profiles.csv'), os.path.join(directory, 'results.csv')
+            with open(input_path, 'w') as f:
+                f.write('user_id,age,town\n')
+                f.writelines(f'user{idx},{20 + idx % 2},{"Lyon" if idx % 3 else "Paris"}\n' for idx in range(30))
+
+            result = simulate_campaign(promocode, read_profiles_csv(input_path), output_path, processes=2, chunk_size=7)
+            with open(output_path) as f:
+                rows = f.read().splitlines()
+
+        self.assertEqual(result, {'total': 30, 'accepted': 10, 'share': 10 / 30})
+        self.assertEqual(rows[0], 'user,accepted,reasons')
+        self.assertEqual(rows[2], 'user1,1,')
+        self.assertEqual(rows[4], 'user3,0,Weather must be clear - current weather: clouds.')
+        # One weather lookup per town
+        self.assertEqual(mock_get_current_weather.call_count, 2)
+
+    def test_simulate_campaign_in_daemonic_process(self):
+        promocode = SimpleNamespace(restrictions=[{"age": {"gt": 20}}])
+
+        with tempfile.TemporaryDirectory() as directory:
+            input_path, output_path = os.path.join(directory, 'profiles.csv'), os.path.join(directory, 'results.csv')
+            with open(input_path, 'w') as f:
+                f.write('user_id,age,town\nuser0,25,Lyon\nuser1,twenty,Lyon\n')
+
+            # Like a Celery prefork worker
+            worker = billiard.Process(
+                target=simulate_campaign, args=(promocode, list(read_profiles_csv(input_path)), output_path, 2), daemon=True
+            )
+            worker.start()
+            worker.join()
+            with open(output_path) as f:
+                rows = f.read().splitlines()
+
+        self.assertEqual(worker.exitcode, 0)
+        self.assertEqual(rows[1], 'user0,1,')
+        self.assertEqual(rows[2], 'user1,0,Invalid argument - age must be an integer.')
+
+
+class TestGenerator(TestCase):
+    def test_generate_promocodes(self):
+        PromoCode.objects.create(name='EXISTING', advantage={"percent": 10}, restrictions=[{"age": {"gt": 20}}])
+
+        names = generate_promocodes(1200, {"value": 5}, [{"date": {"after": "2020-01-01"}}], prefix='SPRING-', batch_size=500)
+
+        self.assertEqual(len(names), 1200)
+        self.assertEqual(len(set(names)), 1200)
+        self.assertTrue(all(name.startswith('SPRING-') and len(name) == 15 for name in names))
+        self.assertEqual(PromoCode.objects.filter(name__in=names, is_active_now=True).count(), 1200)
+
+    def test_generate_promocodes_skips_existing_names(self):
+        PromoCode.objects.create(name='EXISTING', advantage={"percent": 10}, restrictions=[{"age": {"gt": 20}}])
+
+        with patch('src.promocodes.generator.random_name', side_effect=['CODE1', 'EXISTING', 'CODE2', 'CODE3']):
+            names = generate_promocodes(3, {"value": 5}, [{"date": {"after": "2020-01-01"}}], batch_size=3)
+
+        self.assertEqual(sorted(names), ['CODE1', 'CODE2', 'CODE3'])
+        self.assertEqual(PromoCode.objects.get(name='EXISTING').advantage, {"percent": 10})
+
+    def test_generate_promocodes_with_invalid_advantage(self):
+        with self.assertRaises(ValueError):
+            generate_promocodes(10, {"percent": "10"}, [{"age": {"gt": 20}}])
+
+
+class TestAudit(TestCase):
+    def setUp(self):
+        PromoCode.objects.create(name='AgeCode', advantage={"percent": 20}, restrictions=[{"age": {"gt": 20}}])
+
+    @patch('src.promocodes.services.record_validation_event')
+    def test_validation_events(self, mock_record):
+        validate_promocode_request({'promocode_name': 'AgeCode', 'arguments': {'age': 25}})
+        validate_promocode_request({'promocode_name': 'AgeCode', 'arguments': {'age': 15}})
+        validate_promocode_request({'promocode_name': 'AgeCode', 'arguments': {'age': '25'}})
+        validate_promocode_request({'promocode_name': 'Unknown'})
+
+        events = [call.args for call in mock_record.call_args_list]
+        self.assertEqual([event[2] for event in events], ['accepted', 'denied', 'invalid', 'not_found'])
+        self.assertEqual(events[1][:2], ('AgeCode', {'age': 15}))
+        self.assertEqual(len(events[1][3]), 1)
+        self.assertTrue(all(event[4] >= 0 for event in events))
+
+    @patch('src.promocodes.services.increment_counters')
+    def test_only_existing_promocodes_are_counted(self, mock_increment):
+        validate_promocode_request({'promocode_name': 'AgeCode', 'arguments': {'age': 25}})
+        validate_promocode_request({'promocode_name': 'Unknown' * 100})
+
+        mock_increment.assert_called_once_with('AgeCode', 'accepted', [])
+
+    def test_copy_events(self):
+        copy_events(
+            [
+                {
+                    'created_at': '2022-03-01T10:00:00+00:00',
+                    'promocode_name': 'AgeCode',
+                    'arguments': '{"age":15}',
+                    'status': 'denied',
+                    'reasons': '["age must be greater than 20"]',
+                    'latency_ms': '1.250',
+                }
+            ]
+        )
+
+        event = PromoCodeValidationEvent.objects.get()
+        self.assertEqual(event.arguments, {'age': 15})
+        self.assertEqual(event.latency_ms, 1.25)
+
+    @override_settings(AUDIT_ENABLED=True)
+    @patch('src.promocodes.audit._start_flusher')
+    def test_record_sanitizes_input(self, _):
+        audit._buffer.clear()
+        record_validation_event('A\x00' + 'B' * 300, {'town': 'Lyon\x00'}, 'not_found', [], 1.0)
+
+        event = audit._buffer.pop()
+        self.assertEqual(event['promocode_name'], 'A' + 'B' * 254)
+        self.assertEqual(event['arguments'], '{"town":"Lyon"}')
+
+
+def is_redis_reachable():
+    try:
+        return get_redis().ping()
+    except RedisError:
+        return False
+
+
+@unittest.skipUnless(is_redis_reachable(), 'Set REDIS_URL to a running Redis, e.g. docker-compose up redis')
+class TestAuditWriter(TestCase):
+    keys = (audit.STREAM_KEY, audit.METRICS_KEY, audit.WRITER_LOCK_KEY, audit.DEAD_LETTER_KEY, audit.FAILURES_KEY)
+
+    def setUp(self):
+        get_redis().delete(*self.keys)
+
+    def tearDown(self):
+        get_redis().delete(*self.keys)
+
+    def add_event(self, promocode_name):
+        event = {
+            'created_at': '2022-03-01T10:00:00+00:00',
+            'promocode_name': promocode_name,
+            'arguments': '{}',
+            'status': 'not_found',
+            'reasons': '[]',
+            'latency_ms': '1.000',
+        }
+        get_redis().xadd(audit.STREAM_KEY, event)
+
+    def test_failing_batch_is_dead_lettered(self):
+        # The real one creates the partitions on Postgres
+        real_copy_events = audit.copy_events
+
+        def copy_events(events):
+            if any(event['promocode_name'] == 'POISON' for event in events):
+                raise DatabaseError('COPY failed')
+            real_copy_events(events)
+
+        self.add_event('AgeCode')
+        self.add_event('POISON')
+
+        with patch('src.promocodes.audit.copy_events', side_effect=copy_events):
+            for _ in range(audit.MAX_BATCH_ATTEMPTS):
+                with self.assertRaises(DatabaseError):
+                    write_events()
+                # The lock is released
+                self.assertFalse(get_redis().exists(audit.WRITER_LOCK_KEY))
+
+            with self.assertLogs('src.promocodes.audit', 'ERROR'):
+                self.assertEqual(write_events(), 1)
+
+        self.assertEqual(PromoCodeValidationEvent.objects.count(), 1)
+        self.assertEqual(get_redis().xlen(audit.DEAD_LETTER_KEY), 1)
+        self.assertEqual(get_redis().xlen(audit.STREAM_KEY), 0)
+
+    def test_lock_of_another_writer_is_kept(self):
+        self.add_event('AgeCode')
+
+        def copy_events(events):
+            # The lock expired during the write, and another writer took it
+            get_redis().set(audit.WRITER_LOCK_KEY, 'other', ex=300)
+
+        with patch('src.promocodes.audit.copy_events', side_effect=copy_events):
+            self.assertEqual(write_events(), 1)
+        self.assertEqual(get_redis().get(audit.WRITER_LOCK_KEY), b'other')
@@ -1,7 +1,12 @@
+from django.urls import path
 from rest_framework.routers import SimpleRouter
 
-from .views import PromoCodeViewSet
+from .views import PromoCodeViewSet, validate_promocode
 
 promocodes_router = SimpleRouter()
 
 promocodes_router.register(r'promocodes', PromoCodeViewSet)
+
+urlpatterns = [
+    path('promocodes/validate/lean/', validate_promocode, name='promocode-validate-lean'),
+]
@@ -3,7 +3,8 @@ import requests
 
 from datetime import datetime
 from django.conf import settings
-from typing import TypedDict, List
+from django.utils import timezone
+from typing import TypedDict, List, Optional
 
 OPEN_WEATHER_KEY = settings.OPEN_WEATHER_KEY
 
@@ -36,6 +37,14 @@ class WeatherRestriction(TypedDict):
     _temp: "IntegerRestriction"
 
 
+class SegmentRestriction(TypedDict):
+    """
+    Note: added underscore to the keys to avoid conflict with the built-in keywords.
+    """
+
+    _in: str
+
+
 class Restriction(TypedDict):
     """
     Note: added underscore to the keys to avoid conflict with the built-in keywords.
@@ -47,6 +56,7 @@ class Restriction(TypedDict):
     _date: "DateRestriction"
     _age: "IntegerRestriction"
     _weather: "WeatherRestriction"
+    _segment: "SegmentRestriction"
     _or: List["Restriction"]
     _and: List["Restriction"]
 
@@ -137,8 +147,17 @@ def validate_restrictions(restrictions: Restrictions):
                     return "Gt must be an integer."
                 if "lt" in temp and not isinstance(temp["lt"], int):
                     return "Lt must be an integer."
+
+        elif "segment" in restriction:
+            segment = restriction["segment"]
+            if not isinstance(segment, dict):
+                return "Segment must be a JSON object."
+            if "in" not in segment:
+                return "Segment must contain an in key."
+            if not isinstance(segment["in"], str):
+                return "In must be a string."
         else:
-            return "Restriction must contain a date, or, and, age, or weather key."
+            return "Restriction must contain a date, or, and, age, weather, or segment key."
 
         return None
 
@@ -178,13 +197,40 @@ def check_condition(condition, val):
     return True
 
 
-def evaluate_restrictions(restrictions, arguments):
+def get_current_weather(town):
+    """
+    Return the current (weather, temperature) in the given town, or None if the weather API fails.
+    """
+    # Call the weather API to get the current weather : https://openweathermap.org/current
+    # requests.get('http://api.openweathermap.org/data/2.5/weather?q={town}&appid={API_KEY}')
+    location_endpoint = f'http://api.openweathermap.org/geo/1.0/direct?q={town}&limit=1&appid={OPEN_WEATHER_KEY}'
+    response = requests.get(location_endpoint)
+    if response.status_code != 200 or not response.json():
+        return None
+
+    location = response.json()[0]
+    lat, lon = location['lat'], location['lon']
+
+    weather_endpoint = f'http://api.openweathermap.org/data/2.5/onecall?lat={lat}&lon={lon}&appid={OPEN_WEATHER_KEY}&exclude=minutely,hourly,daily,alerts&units=metric'
+    response = requests.get(weather_endpoint)
+    if response.status_code != 200:
+        return None
+
+    temperature = response.json()['current']['temp']
+    weather = response.json()['current']['weather'][0]['main'].lower()
+    return weather, temperature
+
+
+def evaluate_restrictions(restrictions, arguments, weathers=None):
     """
     Recursively evaluates restrictions against provided arguments.
+    weathers is an optional town -> get_current_weather(town) cache, filled by the lookups : evaluations sharing it
+    call the weather API once per town.
     TODO : Refactor, improve readability
     """
     age = arguments.get('age', None)
     town = arguments.get('town', None)
+    user = arguments.get('user', None)
 
     failure_reasons = []
 
@@ -213,31 +259,32 @@ def evaluate_restrictions(restrictions, arguments):
                 expected_weather = restriction['weather'].get('is', None)
                 expected_temp = restriction['weather'].get('temp', None)
 
-                # Call the weather API to get the current weather : https://openweathermap.org/current
-                # requests.get('http://api.openweathermap.org/data/2.5/weather?q={town}&appid={API_KEY}')
-                location_endpoint = f'http://api.openweathermap.org/geo/1.0/direct?q={town}&limit=1&appid={OPEN_WEATHER_KEY}'
-                response = requests.get(location_endpoint)
-                if response.status_code != 200:
-                    failure_reasons.append(f"Failed to retrieve weather for location {town}.")
-
-                location = response.json()[0]
-                lat, lon = location['lat'], location['lon']
+                if weathers is None:
+                    current_weather = get_current_weather(town)
+                else:
+                    if town not in weathers:
+                        weathers[town] = get_current_weather(town)
+                    current_weather = weathers[town]
 
-                weather_endpoint = f'http://api.openweathermap.org/data/2.5/onecall?lat={lat}&lon={lon}&appid={OPEN_WEATHER_KEY}&exclude=minutely,hourly,daily,alerts&units=metric'
-                response = requests.get(weather_endpoint)
-                if response.status_code != 200:
+                if current_weather is None:
                     failure_reasons.append(f"Failed to retrieve weather for location {town}.")
-
-                temperature = response.json()['current']['temp']
-                weather = response.json()['current']['weather'][0]['main'].lower()
+                    continue
+                weather, temperature = current_weather
 
                 if expected_weather and weather != expected_weather:
                     failure_reasons.append(f"Weather must be {expected_weather} - current weather: {weather}.")
                 if expected_temp and not check_condition(expected_temp, temperature):
                     failure_reasons.append("Weather temperature condition not met.")
 
+        elif 'segment' in restriction:
+            # Segments are stored in the database, see segments.py
+            from .segments import is_in_segment
+
+            if not user or not is_in_segment(restriction['segment']['in'], user):
+                failure_reasons.append("Segment condition not met.")
+
         elif 'or' in restriction:
-            results = [evaluate_restrictions([sub_condition], arguments) for sub_condition in restriction['or']]
+            results = [evaluate_restrictions([sub_condition], arguments, weathers) for sub_condition in restriction['or']]
             failures = [res for res in results if res != []]
 
             # Success if any of the sub-conditions are met, i,e, at least one of evaluation returned no failures
@@ -250,7 +297,7 @@ def evaluate_restrictions(restrictions, arguments):
             failure_reasons.extend(failures)
 
         elif 'and' in restriction:
-            results = [evaluate_restrictions([sub_condition], arguments) for sub_condition in restriction['and']]
+            results = [evaluate_restrictions([sub_condition], arguments, weathers) for sub_condition in restriction['and']]
             failures = [res for res in results if res != []]
 
             # Success if all of the sub-conditions are met, i,e, all evaluations return empty lists
@@ -266,24 +313,100 @@ def evaluate_restrictions(restrictions, arguments):
     return list(set(failure_reasons))
 
 
+def has_weather_restriction(restrictions: Restrictions) -> bool:
+    """
+    Check whether the restrictions contain weather conditions, possibly nested inside or/and statements.
+    """
+    for restriction in restrictions:
+        if 'weather' in restriction:
+            return True
+        if 'or' in restriction and has_weather_restriction(restriction['or']):
+            return True
+        if 'and' in restriction and has_weather_restriction(restriction['and']):
+            return True
+    return False
+
+
+def is_time_only(restrictions: Restrictions) -> bool:
+    """
+    Check whether the restrictions only contain date conditions, possibly nested inside or/and statements.
+    The verdict of such promo codes only depends on the clock, so it can be precomputed (see PromoCode.is_active_now).
+    """
+    for restriction in restrictions:
+        if 'date' in restriction:
+            continue
+        elif 'or' in restriction:
+            if not is_time_only(restriction['or']):
+                return False
+        elif 'and' in restriction:
+            if not is_time_only(restriction['and']):
+                return False
+        else:
+            return False
+    return True
+
+
+def get_static_verdict(restrictions: Restrictions) -> bool:
+    """
+    Compute the current verdict of time-only restrictions - True if the promo code is currently active.
+    """
+    return is_time_only(restrictions) and evaluate_restrictions(restrictions, {}) == []
+
+
+def get_date_boundaries(restrictions: Restrictions) -> List[datetime]:
+    """
+    Return the after / before dates of the restrictions, possibly nested inside or/and statements.
+    """
+    boundaries = []
+    for restriction in restrictions:
+        if 'date' in restriction:
+            for key in ('after', 'before'):
+                if key in restriction['date']:
+                    boundaries.append(datetime.strptime(restriction['date'][key], '%Y-%m-%d'))
+        elif 'or' in restriction:
+            boundaries.extend(get_date_boundaries(restriction['or']))
+        elif 'and' in restriction:
+            boundaries.extend(get_date_boundaries(restriction['and']))
+    return boundaries
+
+
+def get_static_verdict_expiry(restrictions: Restrictions) -> Optional[datetime]:
+    """
+    Return the time until which the current verdict of time-only restrictions holds : their next after / before date,
+    None if there is none left (see PromoCode.active_until).
+    """
+    if not is_time_only(restrictions):
+        return None
+    # Naive like the dates compared by evaluate_restrictions, in the current time zone
+    now = datetime.now()
+    boundaries = [boundary for boundary in get_date_boundaries(restrictions) if boundary >= now]
+    return timezone.make_aware(min(boundaries)) if boundaries else None
+
+
 def validate_arguments(arguments):
     # arguments is an object which may contain the following keys:
     # - age : integer representing the age of the user.
     # - weather : a string representing the weather conditions.
+    # - user : a string identifying the user, for the segment conditions.
     if 'age' in arguments and not isinstance(arguments['age'], int):
         return "Invalid argument - age must be an integer."
     if 'town' in arguments and not isinstance(arguments['town'], str):
         return "Invalid argument - town must be a string."
+    if 'user' in arguments and not isinstance(arguments['user'], str):
+        return "Invalid argument - user must be a string."
     return None
 
 
 #  TODO : This may belong in the models file
-def validate_promo_code(restrictions, arguments):
+def validate_promo_code(restrictions, arguments, static_verdict=False):
     """
     restrictions is an array of restriction objects
     arguments is an object which may contain the following keys:
     - age : integer representing the age of the user.
     - town : a string representing the town the user is in.
+    - user : a string identifying the user.
+    static_verdict is the precomputed verdict of time-only promo codes, while it holds (PromoCode.is_statically_active) :
+    when True, the promo code is accepted without evaluating the restrictions.
     """
     if not restrictions:
         return []
@@ -292,5 +415,8 @@ def validate_promo_code(restrictions, arguments):
     if arguments_err:
         raise ValueError(f'Failed to validate arguments: {arguments_err}')
 
+    if static_verdict:
+        return []
+
     failure_reasons = evaluate_restrictions(restrictions, arguments)
     return failure_reasons
@@ -1,11 +1,58 @@
+from datetime import datetime, timedelta, timezone
+
+from django.http import HttpResponse
+from django.utils.decorators import method_decorator
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition
 from rest_framework import mixins, status, viewsets
 from rest_framework.decorators import action
-from rest_framework.permissions import AllowAny
+from rest_framework.exceptions import APIException, MethodNotAllowed, ParseError, Throttled
+from rest_framework.permissions import AllowAny, IsAdminUser
 from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from src.common.parsers import ORJSONParser
+from src.common.renderers import ORJSONRenderer
+from src.common.throttling import TokenBucketThrottle, check_default_throttles, check_token_bucket, get_client_ident
 
+from .catalogue import get_promocode_version
+from .counters import get_counters
 from .models import PromoCode
 from .serializers import PromoCodeReadSerializer, PromoCodeCreateSerializer, PromoCodeValidateSerializer
-from .utils import validate_promo_code
+from .services import validate_promocode_request
+
+
+# Longest period of the promo code stats, one year
+STATS_MAX_HOURS = 366 * 24
+
+
+def json_response(data, status_code):
+    return HttpResponse(ORJSONRenderer().render(data), status=status_code, content_type='application/json')
+
+
+def throttled_response(wait):
+    throttled = Throttled(wait)
+    response = json_response({'detail': str(throttled.detail)}, status.HTTP_429_TOO_MANY_REQUESTS)
+    if throttled.wait is not None:
+        response['Retry-After'] = '%d' % throttled.wait
+    return response
+
+
+def get_request_promocode_version(request, pk):
+    # Both condition() functions need the version : look it up once per request
+    if not hasattr(request, 'promocode_version'):
+        request.promocode_version = get_promocode_version(pk)
+    return request.promocode_version
+
+
+def promocode_etag(request, pk):
+    version = get_request_promocode_version(request, pk)
+    return f'"{pk}-{version[0]}"' if version else None
+
+
+def promocode_last_modified(request, pk):
+    version = get_request_promocode_version(request, pk)
+    return datetime.fromtimestamp(version[1], tz=timezone.utc) if version else None
 
 
 class PromoCodeViewSet(mixins.RetrieveModelMixin, mixins.CreateModelMixin, viewsets.GenericViewSet):
@@ -14,6 +61,7 @@ class PromoCodeViewSet(mixins.RetrieveModelMixin, mixins.CreateModelMixin, views
     - retrieve
     - create
     - validate
+    - stats
     """
 
     queryset = PromoCode.objects.all()
@@ -23,7 +71,9 @@ class PromoCodeViewSet(mixins.RetrieveModelMixin, mixins.CreateModelMixin, views
         'validate': PromoCodeValidateSerializer,
     }
     # TODO : Fix permissions
-    permissions = {'default': [AllowAny], 'create': [AllowAny]}
+    permissions = {'default': [AllowAny], 'create': [AllowAny], 'stats': [IsAdminUser]}
+    # See settings.TOKEN_BUCKET_RATES
+    token_bucket_scope = 'promocodes'
 
     def get_serializer_class(self):
         return self.serializers.get(self.action, self.serializers['default'])
@@ -32,6 +82,16 @@ class PromoCodeViewSet(mixins.RetrieveModelMixin, mixins.CreateModelMixin, views
         self.permission_classes = self.permissions.get(self.action, self.permissions['default'])
         return super().get_permissions()
 
+    def get_throttles(self):
+        return super().get_throttles() + [TokenBucketThrottle()]
+
+    @method_decorator(condition(etag_func=promocode_etag, last_modified_func=promocode_last_modified))
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Answer If-None-Match / If-Modified-Since with a 304 from the cached version, without loading the promo code.
+        """
+        return super().retrieve(request, *args, **kwargs)
+
     def create(self, request, *args, **kwargs):
         try:
             return super().create(request, *args, **kwargs)
@@ -40,24 +100,66 @@ class PromoCodeViewSet(mixins.RetrieveModelMixin, mixins.CreateModelMixin, views
 
     @action(detail=False, methods=['post'], url_path='validate', url_name='validate')
     def validate(self, instance):
+        """
+        See also validate_promocode, the lean version of this endpoint.
+        """
+        response, status_code = validate_promocode_request(self.request.data)
+        return Response(response, status=status_code)
+
+    @action(detail=True, methods=['get'], url_path='stats', url_name='stats')
+    def stats(self, request, *args, **kwargs):
+        """
+        Validation counts of the promo code over the last `hours` (default 24, at most STATS_MAX_HOURS),
+        by status and by denial reason. Staff only.
+        """
         try:
-            promocode_name = self.request.data['promocode_name']
-            promocode = PromoCode.objects.get(name=promocode_name)
-        except PromoCode.DoesNotExist:
-            return Response({'error': f'Promo code {promocode_name} does not exist'}, status=status.HTTP_404_NOT_FOUND)
+            hours = int(request.query_params.get('hours', 24))
+        except ValueError:
+            return Response({'error': 'hours must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        hours = min(max(hours, 1), STATS_MAX_HOURS)
 
-        arguments = {}
-        if 'arguments' in self.request.data:
-            arguments = self.request.data['arguments']
+        promocode = self.get_object()
+        since = datetime.now(tz=timezone.utc) - timedelta(hours=hours)
+        return Response({'promocode_name': promocode.name, 'hours': hours, **get_counters(promocode.name, since)})
 
-        try:
-            failure_reasons = validate_promo_code(promocode.restrictions, arguments)
-        except ValueError as e:
-            return Response({'error': f'Failed to validate promo code: {e}'}, status=status.HTTP_400_BAD_REQUEST)
 
-        if len(failure_reasons) > 0:
-            response = {"promocode_name": promocode_name, "status": "denied", "reasons": failure_reasons}
-            return Response({'error': response}, status=status.HTTP_400_BAD_REQUEST)
+drf_validate_promocode = PromoCodeViewSet.as_view({'post': 'validate'})
+
+
+@csrf_exempt
+def validate_promocode(request):
+    """
+    Lean version of PromoCodeViewSet.validate, with the same request and response contract, without the DRF stack :
+    the JSON body is parsed and the response rendered directly. The same throttles apply, with the same buckets : the DRF
+    default ones, then the validate token bucket, by user, API key or IP - see get_client_ident.
+    Non JSON bodies (forms) and requests whose authentication fails are handed over to the DRF view.
+    """
+    if request.method != 'POST':
+        return json_response({'detail': str(MethodNotAllowed(request.method).detail)}, status.HTTP_405_METHOD_NOT_ALLOWED)
+
+    if request.content_type != ORJSONParser.media_type:
+        return drf_validate_promocode(request)
+
+    drf_request = APIView().initialize_request(request)
+    try:
+        allowed, wait = check_default_throttles(drf_request)
+        client_ident = get_client_ident(drf_request)
+    except APIException:
+        # The DRF view renders the authentication errors, the body is still unread
+        return drf_validate_promocode(request)
+    if not allowed:
+        return throttled_response(wait)
+
+    try:
+        # Like DRF, an empty body is empty data
+        data = ORJSONParser().parse(request) if int(request.META.get('CONTENT_LENGTH') or 0) else {}
+    except ParseError as e:
+        return json_response({'detail': str(e.detail)}, status.HTTP_400_BAD_REQUEST)
+
+    promocode_name = data.get('promocode_name') if isinstance(data, dict) else None
+    allowed, wait = check_token_bucket('promocodes.validate', client_ident, promocode_name)
+    if not allowed:
+        return throttled_response(wait)
 
-        response = {"promocode_name": promocode_name, "status": "accepted", "advantage": promocode.advantage}
-        return Response({'message': response}, status=status.HTTP_200_OK)
+    response, status_code = validate_promocode_request(data)
+    return json_response(response, status_code)
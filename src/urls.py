@@ -14,6 +14,7 @@ from drf_yasg import openapi
 
 from src.social.views import exchange_token, complete_twitter_login
 from src.files.urls import files_router
+from src.users.serializers import UserTokenObtainPairSerializer
 from src.users.urls import users_router
 from src.promocodes.urls import promocodes_router
 
@@ -36,10 +37,11 @@ urlpatterns = [
     path('summernote/', include('django_summernote.urls')),
     # api
     path('api/v1/', include(router.urls)),
+    path('api/v1/', include('src.promocodes.urls')),
     url(r'^api/v1/password_reset/', include('django_rest_passwordreset.urls', namespace='password_reset')),
     # auth
     path('api-auth/', include('rest_framework.urls', namespace='rest_framework')),
-    path('api/v1/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
+    path('api/v1/token/', TokenObtainPairView.as_view(serializer_class=UserTokenObtainPairSerializer), name='token_obtain_pair'),
     path('api/v1/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     # social login
     url('', include('social_django.urls', namespace='social')),
@@ -52,4 +54,8 @@ urlpatterns = [
     url(r'^health/', include('health_check.urls')),
     # the 'api-root' from django rest-frameworks default router
     re_path(r'^$', RedirectView.as_view(url=reverse_lazy('api-root'), permanent=False)),
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+]
+
+# Served by nginx otherwise
+if not settings.NGINX_ACCEL_REDIRECT_PREFIX:
+    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
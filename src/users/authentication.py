@@ -0,0 +1,90 @@
+import logging
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import router
+from django.utils.translation import gettext_lazy as _
+from redis.exceptions import RedisError
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+logger = logging.getLogger(__name__)
+
+# Stateless JWT authentication.
+#
+# The tokens carry the fields of the user most requests need (USER_CLAIMS), so that authenticating a request does not
+# query the users table : request.user is built from the claims, its other fields are loaded - all at once - on first
+# access. The claims are a snapshot taken on login : deactivations, flag changes and deletions revoke the tokens of the
+# user through a deny-list cached for the lifetime of the refresh tokens, in the 'auth' cache. Unlike the default cache,
+# it raises the Redis errors : a revocation that cannot be written fails the change of the user, and the requests
+# are authenticated from the database while the deny-list cannot be read.
+
+USER_CLAIMS = ('username', 'is_active', 'is_staff', 'is_superuser')
+# Login time, copied from the refresh token to the access tokens it issues
+AUTH_TIME_CLAIM = 'auth_time'
+
+
+def get_revocation_cache_key(user_id):
+    return f'auth:revoked:{user_id}'
+
+
+def revoke_user_tokens(user_id):
+    """
+    Deny the tokens of the user issued until now
+    """
+    caches['auth'].set(
+        get_revocation_cache_key(user_id), time.time(), settings.SIMPLE_JWT['REFRESH_TOKEN_LIFETIME'].total_seconds()
+    )
+
+
+class UserRefreshToken(RefreshToken):
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        for claim in USER_CLAIMS:
+            token[claim] = getattr(user, claim)
+        token[AUTH_TIME_CLAIM] = time.time()
+        return token
+
+
+def get_token_user(validated_token):
+    """
+    Return the user of the token, only holding the claims : its other fields are deferred.
+    """
+    user_model = get_user_model()
+    claims = {
+        api_settings.USER_ID_FIELD: user_model._meta.pk.to_python(validated_token[api_settings.USER_ID_CLAIM]),
+        **{claim: validated_token[claim] for claim in USER_CLAIMS},
+    }
+    # from_db expects the values in the order of the fields
+    field_names = [field.attname for field in user_model._meta.concrete_fields if field.attname in claims]
+    user = user_model.from_db(router.db_for_read(user_model), field_names, [claims[name] for name in field_names])
+    user._from_token = True
+    return user
+
+
+class StatelessJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication without the user query - see get_token_user
+    """
+
+    def get_user(self, validated_token):
+        # Issued before the claims
+        if AUTH_TIME_CLAIM not in validated_token:
+            return super().get_user(validated_token)
+
+        try:
+            revoked_at = caches['auth'].get(get_revocation_cache_key(validated_token[api_settings.USER_ID_CLAIM]))
+        except RedisError:
+            # The user and its flags as they are now, instead of the claims
+            logger.warning('Token deny-list unreachable, the user is loaded from the database.', exc_info=True)
+            return super().get_user(validated_token)
+        if revoked_at is not None and validated_token[AUTH_TIME_CLAIM] <= revoked_at:
+            raise AuthenticationFailed(_('Token has been revoked'), code='token_revoked')
+        if not validated_token['is_active']:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+        return get_token_user(validated_token)
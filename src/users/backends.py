@@ -1,32 +1,53 @@
 import re
 
+from django.conf import settings
 from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+from django.db.models import Case, Value, When
 
-from src.users.models import User
+from src.users.models import User, get_user_cache_key
 
+EMAIL_REGEX = re.compile(r'[^@\s]+@[^@\s]+\.[^@\s]+')
 
-class EmailOrUsernameModelBackend(ModelBackend):
-    def authenticate(self, request, **kwargs):
-        username = kwargs['username']
-        password = kwargs['password']
 
-        if username and re.search(r'[^@\s]+@[^@\s]+\.[^@\s]+', username):
-            kwargs = {'email': username}
-        else:
-            kwargs = {'username': username}
+class EmailOrUsernameModelBackend(ModelBackend):
+    """
+    Authenticates with the email or the username, case-insensitively - the lookups use the upper-case indexes of User
+    """
 
-        try:
-            user = User.objects.get(**kwargs)
-        except User.DoesNotExist:
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        if username is None or password is None:
             return None
+
+        username = username.strip()
+        if EMAIL_REGEX.search(username):
+            field = 'email'
         else:
-            if user.is_active and user.check_password(password):
-                return user
+            field = 'username'
+
+        # Neither the emails nor the usernames are unique case-insensitively : the exact match wins, if any.
+        # The exact matches come first, whatever the number of case variants.
+        exact_first = Case(When(**{field: username}, then=Value(0)), default=Value(1))
+        candidates = list(User.objects.filter(**{f'{field}__iexact': username}).order_by(exact_first, 'pk')[:2])
+        if len(candidates) > 1:
+            candidates = [user for user in candidates if getattr(user, field) == username]
+
+        if len(candidates) != 1:
+            # Hash the password anyway, unknown logins taking as long as the known ones (see ModelBackend)
+            User().set_password(password)
+            return None
 
+        user = candidates[0]
+        if user.check_password(password) and self.user_can_authenticate(user):
+            return user
         return None
 
     def get_user(self, user_id):
-        try:
-            return User.objects.get(pk=user_id)
-        except User.DoesNotExist:
-            return None
+        # Called on each request authenticated by the session. The cached user is deleted on save - see src/users/models.py
+        key = get_user_cache_key(user_id)
+        user = cache.get(key)
+        if user is None:
+            user = super().get_user(user_id)
+            if user is not None and settings.USER_CACHE_TTL:
+                cache.set(key, user, settings.USER_CACHE_TTL)
+        return user
@@ -1,16 +1,19 @@
 import uuid
+from django.core.cache import cache
 from django.db import models
+from django.db.models.functions import Upper
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
 from django.contrib.auth.models import AbstractUser
-from rest_framework_simplejwt.tokens import RefreshToken
 from easy_thumbnails.fields import ThumbnailerImageField
 from django.urls import reverse
 from django_rest_passwordreset.signals import reset_password_token_created
 from easy_thumbnails.signals import saved_file
-from easy_thumbnails.signal_handlers import generate_aliases_global
 
 from src.common.helpers import build_absolute_uri
+from src.common.thumbnails import generate_aliases_global
 from src.notifications.services import notify, ACTIVITY_USER_RESETS_PASS
+from src.users.authentication import UserRefreshToken, revoke_user_tokens
 
 
 @receiver(reset_password_token_created)
@@ -29,20 +32,61 @@ def password_reset_token_created(sender, instance, reset_password_token, *args,
     notify(ACTIVITY_USER_RESETS_PASS, context=context, email_to=[reset_password_token.user.email])
 
 
+def get_user_cache_key(user_id):
+    return f'users:user:{user_id}'
+
+
 class User(AbstractUser):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     profile_picture = ThumbnailerImageField('ProfilePicture', upload_to='profile_pictures/', blank=True, null=True)
 
+    class Meta(AbstractUser.Meta):
+        # The case-insensitive lookups of the logins - see src/users/backends.py
+        indexes = [
+            models.Index(Upper('email'), name='users_user_email_upper_idx'),
+            models.Index(Upper('username'), name='users_user_username_upper_idx'),
+        ]
+
     def get_tokens(self):
-        refresh = RefreshToken.for_user(self)
+        refresh = UserRefreshToken.for_user(self)
 
         return {
             'refresh': str(refresh),
             'access': str(refresh.access_token),
         }
 
+    def refresh_from_db(self, using=None, fields=None):
+        # A user built from the token claims loads all its deferred fields on the first access to one of them
+        if fields is not None and getattr(self, '_from_token', False):
+            fields = set(fields) | self.get_deferred_fields()
+        super().refresh_from_db(using=using, fields=fields)
+
     def __str__(self):
         return self.username
 
 
+@receiver(pre_save, sender=User)
+def revoke_tokens_on_claims_change(sender, instance, raw=False, **kwargs):
+    """
+    The tokens hold the flags of the user : deny them when a flag changes - see src/users/authentication.py
+    """
+    if raw or instance._state.adding:
+        return
+    flags = ('is_active', 'is_staff', 'is_superuser')
+    previous = User.objects.filter(pk=instance.pk).values(*flags).first()
+    if previous is not None and any(previous[flag] != getattr(instance, flag) for flag in flags):
+        revoke_user_tokens(instance.pk)
+
+
+@receiver(post_delete, sender=User)
+def revoke_tokens_on_delete(sender, instance, **kwargs):
+    revoke_user_tokens(instance.pk)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def delete_cached_user(sender, instance, **kwargs):
+    cache.delete(get_user_cache_key(instance.pk))
+
+
 saved_file.connect(generate_aliases_global)
@@ -1,11 +1,13 @@
 from rest_framework import serializers
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 
+from src.users.authentication import UserRefreshToken
 from src.users.models import User
 from src.common.serializers import ThumbnailerJSONSerializer
 
 
 class UserSerializer(serializers.ModelSerializer):
-    profile_picture = ThumbnailerJSONSerializer(required=False, allow_null=True, alias_target='src.users')
+    profile_picture = ThumbnailerJSONSerializer(required=False, allow_null=True, alias_target='users')
 
     class Meta:
         model = User
@@ -20,7 +22,7 @@ class UserSerializer(serializers.ModelSerializer):
 
 
 class CreateUserSerializer(serializers.ModelSerializer):
-    profile_picture = ThumbnailerJSONSerializer(required=False, allow_null=True, alias_target='src.users')
+    profile_picture = ThumbnailerJSONSerializer(required=False, allow_null=True, alias_target='users')
     tokens = serializers.SerializerMethodField()
 
     def get_tokens(self, user):
@@ -46,3 +48,10 @@ class CreateUserSerializer(serializers.ModelSerializer):
         )
         read_only_fields = ('tokens',)
         extra_kwargs = {'password': {'write_only': True}}
+
+
+class UserTokenObtainPairSerializer(TokenObtainPairSerializer):
+    @classmethod
+    def get_token(cls, user):
+        # With the claims of the user - see src/users/authentication.py
+        return UserRefreshToken.for_user(user)
@@ -0,0 +1,85 @@
+from unittest.mock import patch
+
+from django.core.cache import caches
+from django.test import TestCase
+from redis.exceptions import ConnectionError
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from ..authentication import StatelessJWTAuthentication
+from ..models import User
+from .factories import UserFactory
+
+
+class TestStatelessJWTAuthentication(TestCase):
+    def setUp(self):
+        caches['auth'].clear()
+        # The factory leaves a string id
+        self.user = User.objects.get(pk=UserFactory().pk)
+
+    def authenticate(self, access_token=None):
+        access_token = access_token or self.user.get_tokens()['access']
+        request = APIRequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {access_token}')
+        user, _ = StatelessJWTAuthentication().authenticate(request)
+        return user
+
+    def test_user_from_claims(self):
+        with self.assertNumQueries(0):
+            user = self.authenticate()
+            self.assertEqual(user, self.user)
+            self.assertEqual((user.username, user.is_staff), (self.user.username, False))
+
+        # The other fields are loaded at once
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                (user.email, user.first_name, user.last_name), (self.user.email, self.user.first_name, self.user.last_name)
+            )
+
+    def test_token_without_claims(self):
+        access_token = str(RefreshToken.for_user(self.user).access_token)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.authenticate(access_token), self.user)
+
+    def test_deactivated_user(self):
+        access_token = self.user.get_tokens()['access']
+        self.user.is_active = False
+        self.user.save()
+
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(access_token)
+
+    def test_flag_change_revokes_tokens(self):
+        access_token = self.user.get_tokens()['access']
+        self.user.is_staff = True
+        self.user.save()
+
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(access_token)
+        # Tokens issued afterwards hold the new flag
+        self.assertTrue(self.authenticate().is_staff)
+
+    def test_other_change_keeps_tokens(self):
+        access_token = self.user.get_tokens()['access']
+        self.user.first_name = 'Other'
+        self.user.save()
+
+        self.assertEqual(self.authenticate(access_token), self.user)
+
+    def test_deleted_user(self):
+        access_token = self.user.get_tokens()['access']
+        self.user.delete()
+
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(access_token)
+
+    def test_unreachable_deny_list(self):
+        access_token = self.user.get_tokens()['access']
+        self.user.is_active = False
+        self.user.save()
+
+        # The flags are read from the database
+        with patch.object(caches['auth'], 'get', side_effect=ConnectionError), self.assertLogs(
+            'src.users.authentication', 'WARNING'
+        ), self.assertRaises(AuthenticationFailed):
+            self.authenticate(access_token)
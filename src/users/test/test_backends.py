@@ -0,0 +1,62 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase
+
+from ..backends import EmailOrUsernameModelBackend
+from ..models import User
+from .factories import UserFactory
+
+
+class TestEmailOrUsernameModelBackend(TestCase):
+    def setUp(self):
+        cache.clear()
+        # The factory leaves a string id
+        self.user = User.objects.get(pk=UserFactory(username='Alice', email='Alice@Example.com').pk)
+        self.backend = EmailOrUsernameModelBackend()
+
+    def authenticate(self, username, password='asdf'):
+        return self.backend.authenticate(None, username=username, password=password)
+
+    def test_authenticate_case_insensitive(self):
+        for username in ('Alice', 'alice', ' ALICE ', 'Alice@Example.com', 'alice@example.com'):
+            self.assertEqual(self.authenticate(username), self.user)
+
+        self.assertIsNone(self.authenticate('alice', 'wrong'))
+
+    def test_authenticate_ambiguous(self):
+        other = User.objects.get(pk=UserFactory(username='alice', email='other@example.com').pk)
+
+        self.assertEqual(self.authenticate('Alice'), self.user)
+        self.assertEqual(self.authenticate('alice'), other)
+        self.assertIsNone(self.authenticate('ALICE'))
+
+    def test_authenticate_exact_among_case_variants(self):
+        # More case variants than the candidates read : the exact match is still one of them
+        others = [User.objects.get(pk=UserFactory(username=username).pk) for username in ('ALICE', 'aLiCe', 'alice')]
+
+        self.assertEqual(self.authenticate('Alice'), self.user)
+        for other in others:
+            self.assertEqual(self.authenticate(other.username), other)
+        self.assertIsNone(self.authenticate('ALIce'))
+
+    def test_authenticate_unknown_hashes_password(self):
+        with mock.patch.object(User, 'set_password') as set_password:
+            self.assertIsNone(self.authenticate('bob', 'secret'))
+        set_password.assert_called_once_with('secret')
+
+    def test_authenticate_inactive(self):
+        self.user.is_active = False
+        self.user.save()
+
+        self.assertIsNone(self.authenticate('alice'))
+
+    def test_get_user_cached(self):
+        self.assertEqual(self.backend.get_user(self.user.pk), self.user)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.backend.get_user(self.user.pk), self.user)
+
+        # Deleted on save
+        self.user.is_active = False
+        self.user.save()
+        self.assertIsNone(self.backend.get_user(self.user.pk))